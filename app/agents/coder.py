@@ -1,138 +1,197 @@
-from app.config import get_llm
+from app.llm import llm_cache, cascade, cascade_stats
+from app.llm.cascade import validate_script
+from app.agents.prompts import build_coder_prompt
 from app.state import AgentState
 from app.tools.browser import browser_instance
+from app.tools.fix_memory import fix_memory
+from app.agents.triage import classify_failure, HEALABLE, FATAL
+from app.agents.planner import split_branch
+from app.tools.timeouts import timeout_profiles, resolve_timeout, is_timeout_error
+from app.tools.tracing import get_recorder, TRACE_FRAMES
+import time
+
+def generate_script(step_desc: str, tier=None):
+    """
+    Ask the LLM for the code of one plan step (fast model first unless tier="strong").
+    Returns (script, prompt_info).
+    """
+    messages, prompt_info = build_coder_prompt(step_desc)
+    response, used_tier, escalated = cascade.invoke("code", messages, validate=validate_script, tier=tier)
+    script = response.content.replace("```python", "").replace("```", "").strip()
+    metadata = response.response_metadata or {}
+    prompt_info["cache"] = metadata.get("cache", "miss")
+    prompt_info["cache_keys"] = metadata.get("cache_keys")
+    prompt_info["tier"] = used_tier
+    prompt_info["escalated"] = escalated
+    return script, prompt_info
+
+def _record_runtime(code_tier, pending_fix, succeeded):
+    """Per-tier runtime success of freshly generated (or LLM-repaired) scripts"""
+    if code_tier:
+        cascade_stats.record_runtime("code", code_tier, succeeded)
+    if pending_fix and pending_fix.get("tier"):
+        cascade_stats.record_runtime("repair", pending_fix["tier"], succeeded)
 
 def execution_node(state: AgentState):
-    llm = get_llm()
     step_idx = state["current_step_index"]
-    current_step_desc = state["plan"][step_idx]
+    # Branch tags only matter to the parallel executor - run the step's code as usual
+    _, current_step_desc = split_branch(state["plan"][step_idx])
     
     logs = []
+    # Cache entry of a freshly generated script - dropped if the script fails
+    cache_keys = None
+    # Model tier that generated the script (None if it was not generated here)
+    code_tier = None
     
     # Determine script to run (either cached or new)
     if state.get("current_script") and not state.get("error"):
         script = state["current_script"]
     else:
-        prompt = f"""
-        Write Python Playwright code for this step: "{current_step_desc}".
-        Assume 'page' variable exists and browser is already running.
-        Assume 'browser_manager' variable exists in scope (use for switching tabs).
-        You can use 'await' with page methods (e.g., await page.goto(url)) or call them directly (e.g., page.goto(url)).
-        
-        Important guidelines:
-        1. For page.goto(): ALWAYS use wait_until='domcontentloaded' or 'commit' for SPEED:
-           - FASTEST: page.goto(url, wait_until='commit', timeout=30000) - just wait for navigation commit
-           - FAST: page.goto(url, wait_until='domcontentloaded', timeout=30000) - wait for DOM ready
-           - NEVER use wait_until='load' or 'networkidle' - these are too slow
-           - After commit/domcontentloaded, wait for specific elements if needed
-           - This makes navigation 3-5x faster on most websites
-        2. After page.goto(), wait for page load: page.wait_for_load_state('domcontentloaded') first, then wait for elements
-        2a. For form inputs (universal across all sites), prefer name attribute: page.locator('[name="fieldname"]') - this is most reliable across ALL websites
-        2b. For search boxes (universal): Try page.locator('[name*="search"], [name*="q"]') or page.locator('input[type="search"], textarea[name*="q"]') - works on Google, Amazon, eBay, etc.
-        3. Before filling or clicking, wait for element: page.wait_for_selector('selector', state='visible', timeout=30000)
-        4. For search forms (universal): Use page.locator('[name*="search"], [name*="q"], [type="search"]') - works on most sites
-        5. Handle dialogs carefully: Use .first for multiple matches: page.locator('button:has-text("Accept")').first.click() with try/except if dialog exists
-        6. After pressing Enter or submitting forms, wait for navigation: 
-           - Use page.wait_for_load_state('domcontentloaded') for speed (faster than networkidle)
-           - Or wait for specific elements: page.wait_for_selector('expected-element', timeout=30000)
-           - Avoid 'networkidle' - it's slow and often unnecessary
-        7. For page.evaluate() JavaScript code: ALWAYS use null safety:
-           - Use optional chaining: element?.property
-           - Use nullish coalescing: value ?? defaultValue
-           - Filter out nulls: .filter(item => item !== null)
-           - Example: item.querySelector('h2 a')?.href ?? null
-        8. For attribute selectors that timeout:
-           - Try numeric attributes without quotes: [data-rating=4] instead of [data-rating="4"]
-           - Check if element exists first: if page.locator('selector').count() > 0
-           - Use alternative selectors or text-based locators as fallback
-           - Consider that attributes might not exist - handle gracefully
-        8a. CRITICAL: Always filter out advertisements/sponsored content:
-           - For Amazon/e-commerce: NEVER click sponsored items or ads
-           - Filter out sponsored: page.locator('.s-result-item').filter(has_not=page.locator('text=Sponsored')).first
-           - Or use: page.locator('[data-asin]:not([data-component-type*="sp-"])').first (excludes sponsored)
-           - Check for ad indicators: text=Sponsored, Ad, Advertisement, or data-component-type contains "sp-"
-           - Always filter before clicking product items to avoid clicking ads
-           - Example for first non-sponsored product: page.locator('.s-result-item').filter(has_not=page.locator('text=Sponsored')).first.click()
-        8b. CRITICAL: For e-commerce product pages (universal - works on ALL shopping sites):
-           - After clicking a product, wait for product page (FAST): page.wait_for_load_state('domcontentloaded')
-           - Wait for product details (universal): page.wait_for_selector('h1, [class*="product"], [class*="title"], [class*="name"]', timeout=30000)
-           - SELECT PRODUCT VARIATIONS FIRST if available (universal patterns):
-             * Size: page.locator('[name*="size"], [name*="Size"], [data-attribute*="size"], [class*="size"]').first.click(timeout=5000) if exists
-             * Color: page.locator('[name*="color"], [name*="Color"], [data-attribute*="color"], [class*="color"]').first.click(timeout=5000) if exists
-             * Style/Variant: page.locator('[name*="variant"], [name*="style"], [data-attribute*="variant"]').first.click(timeout=5000) if exists
-             * Use try/except for each variation - they may not exist on all sites
-           - Then find add-to-cart button using UNIVERSAL generic selectors (works on Amazon, eBay, Walmart, Target, Etsy, etc.):
-             * By ID: page.locator('#add-to-cart, #addToCart, #add-to-cart-button, #addToCartButton')
-             * By name: page.locator('[name*="add"], [name*="cart"], [name*="add-to-cart"]')
-             * By text: page.locator('button:has-text("Add to Cart"), button:has-text("Add to Bag"), button:has-text("Add"), button:has-text("Buy Now")')
-             * By class: page.locator('[class*="add-to-cart"], [class*="addToCart"], [class*="add-cart"], [class*="cart-button"]')
-             * Try multiple selectors in order until one works - this works on ALL e-commerce sites
-        9. CRITICAL: Handle new tabs/windows (common on Amazon/e-commerce):
-           - If an action (like clicking a product) opens a new tab, you MUST switch to it:
-           - Use: browser_manager.switch_to_new_tab() immediately after the click
-           - Example: 
-             page.click('.product-link')
-             browser_manager.switch_to_new_tab()
-        10. Do NOT add imports. Do NOT add page.goto unless specified in the step.
-        11. For strict mode violations (multiple elements): Use .first, .last, or .nth(0) to select specific element
-        12. CRITICAL: For Image-Based Links (Books, Product Covers, Icons):
-            - Text selectors (`text=...`) FAIL if the text is inside an image (like book covers on Vedabase).
-            - Use `alt` text: `page.locator('img[alt*="Bhagavad"]').first.click()`
-            - Use `aria-label`: `page.locator('[aria-label*="Bhagavad"]').first.click()`
-            - CRITICAL: Attributes are CASE-SENSITIVE! "blue" != "Blue".
-            - To match text case-insensitively, use Regex:
-              `page.locator('img').filter(has_text=re.compile(r'blue tshirt', re.IGNORECASE)).first.click()`
-              OR use simple CSS with widely wildcard: `page.locator('img[alt*="lue"]').first.click()`
-            - Or use Playwright's text locator which is easier:
-              `page.get_by_alt_text(re.compile(r"blue tshirt", re.IGNORECASE)).first.click()`
-            - If the text looks stylized or like a logo, it's likely an image. Do not rely on `text=` selector.
-        13. For CSS pseudo-selectors: Playwright does NOT support CSS pseudo-selectors like :first-of-type, :nth-child()
-           - Instead use: page.locator('.class').first (for first element)
-           - Or: page.locator('.class').nth(0) (for nth element)
-           - NEVER use: .class:first-of-type or .class:nth-child(1) in Playwright
-        14. If element not found, try alternative strategies before giving up
-        15. When using quotes in strings: Use double quotes for outer string, single quotes inside, or escape properly
-           - Example: page.fill('#id', "text with 'quotes'") or page.fill('#id', 'text with \\'quotes\\'')
-        
-        Return ONLY the code, no explanations. 
-        IMPORTANT: If you use 're' (regex), you MUST import it at the top of your snippet: "import re"
-        """
-        response = llm.invoke(prompt)
-        script = response.content.replace("```python", "").replace("```", "").strip()
+        try:
+            # A fast-model script failed on this step already - go straight to the strong model
+            script, prompt_info = generate_script(current_step_desc, tier="strong" if state.get("escalate_code") else None)
+        except Exception as e:
+            # LLM unavailable (missing key, rate limit, network) - there is no script to heal
+            error_class = classify_failure(str(e))
+            if error_class == HEALABLE:
+                error_class = FATAL
+            logs.append(f"❌ Code generation failed ({error_class}): {str(e)}")
+            return {
+                "current_script": None,
+                "error": str(e),
+                "error_class": error_class,
+                "escalate_code": False,
+                "retry_count": state.get("retry_count", 0) + 1,
+                "logs": logs
+            }
+        if prompt_info["escalated"]:
+            logs.append(f"⬆️ Fast model's code rejected ({prompt_info['escalated']}) - used the strong model")
+        if prompt_info["cache"] == "miss":
+            logs.append(f"✂️ Prompt: {prompt_info['tokens']} tokens (saved {prompt_info['saved']})")
+        else:
+            logs.append(f"♻️ Reused cached code ({prompt_info['cache']} match) - no LLM call")
+        cache_keys = prompt_info["cache_keys"]
+        code_tier = prompt_info["tier"]
     
     logs.append(f"⚙️ Executing Step {step_idx + 1}: {current_step_desc}")
+    tracer = get_recorder(state)
 
     # Run Browser
     try:
         # Ensure browser is started
-        browser_instance.start(headless=False) # Visible browser for demo
+        browser_instance.start() # Headless or not per BROWSER_PROFILE
+        # Close stale tabs / recycle the context if the browser is using too much memory
+        logs.extend(browser_instance.watchdog.check(state.get("run_id")))
+        
+        # Per-step timeout learned from earlier runs (or an explicit override)
+        timeout_ms, domain, kind, source = resolve_timeout(state, current_step_desc, browser_instance.get_page().url)
+        browser_instance.set_step_timeout(timeout_ms)
+        if source != "default":
+            logs.append(f"⏱️ Timeout {timeout_ms}ms ({source}, {kind} on {domain or 'page'})")
+        
+        if tracer:
+            browser_instance.tracer = tracer
+            tracer.step_start(step_idx, current_step_desc)
+            tracer.action(script)
+        
+        browser_instance.last_navigation = None
+        started = time.perf_counter()
         result = browser_instance.execute_script(script)
+        duration_ms = (time.perf_counter() - started) * 1000
+        
+        # A navigation that "succeeded" with a 4xx/5xx page is still a failure
+        navigation = browser_instance.last_navigation
+        if result["status"] == "success" and navigation and navigation["status"] >= 400:
+            result = {"status": "error", "error": f"HTTP {navigation['status']} navigating to {navigation['url']}"}
+        
+        # Next step to run - skipping those another branch of a failed parallel group completed
+        new_step_index = step_idx + 1
+        completed = state.get("completed_steps") or []
+        while new_step_index in completed:
+            new_step_index += 1
+        
+        if tracer:
+            # One frame per step boundary instead of a continuous recording
+            frame = browser_instance.screenshot_jpeg() if TRACE_FRAMES else None
+            if frame:
+                tracer.frame(frame)
+            tracer.step_end(result["status"], duration_ms, result.get("error"))
+        
+        pending_fix = state.get("pending_fix")
         
         if result["status"] == "success":
-            new_step_index = step_idx + 1
             logs.append("✅ Success")
+            logs.extend(result.get("tab_logs") or [])
+            timeout_profiles.record(domain, kind, duration_ms)
+            
+            # The healer's rewrite worked - remember it for the next time this error shows up
+            if pending_fix:
+                fix_memory.record_success(pending_fix, script)
+            _record_runtime(code_tier, pending_fix, True)
+            # The script that completed the step (generated, cached or healed) - for app/exporter.py
+            step_scripts = {**(state.get("step_scripts") or {}), str(step_idx): {"script": script, "timeout_ms": timeout_ms}}
+            step_outputs = {**(state.get("step_outputs") or {}), str(step_idx): result.get("output")}
             
             return {
                 "current_script": None,
                 "error": None,
+                "pending_fix": None,
+                "error_class": None,
+                "escalate_code": False,
+                "step_scripts": step_scripts,
+                "step_outputs": step_outputs,
+                "heal_session": None,
                 "current_step_index": new_step_index,
                 "retry_count": 0,
+                "transient_retries": 0,
                 "logs": logs
             }
         else:
-            logs.append(f"❌ Error: {result['error']}")
+            if pending_fix:
+                fix_memory.record_failure(pending_fix)
+            if cache_keys:
+                llm_cache.invalidate("code", cache_keys)
+            if is_timeout_error(result["error"]):
+                timeout_profiles.record_timeout_failure(timeout_ms)
+            blocker = browser_instance.detect_blocker()
+            error_class = classify_failure(result["error"], {"blocker": blocker})
+            if blocker == "captcha":
+                result["error"] = f"CAPTCHA detected on page. {result['error']}"
+            logs.append(f"❌ Error ({error_class}): {result['error']}")
+            _record_runtime(code_tier, pending_fix, False)
+            # Code from the fast model failed: regenerate it with the strong model before healing
+            escalate = code_tier == "fast" and error_class == HEALABLE
+            if escalate:
+                logs.append("⬆️ Regenerating this step with the strong model")
             return {
                 "current_script": script,
                 "error": result["error"],
+                "error_class": error_class,
+                "escalate_code": escalate,
+                "pending_fix": None,
                 "screenshot": result.get("screenshot"),
                 "retry_count": state.get("retry_count", 0) + 1,
                 "logs": logs
             }
     except Exception as e:
-        logs.append(f"❌ Execution Exception: {str(e)}")
+        error_class = classify_failure(str(e))
+        logs.append(f"❌ Execution Exception ({error_class}): {str(e)}")
+        if tracer:
+            tracer.step_end("error", 0, str(e))
+        if state.get("pending_fix"):
+            fix_memory.record_failure(state["pending_fix"])
+        if cache_keys:
+            llm_cache.invalidate("code", cache_keys)
+        _record_runtime(code_tier, state.get("pending_fix"), False)
+        escalate = code_tier == "fast" and error_class == HEALABLE
+        if escalate:
+            logs.append("⬆️ Regenerating this step with the strong model")
         return {
             "current_script": script,
             "error": str(e),
+            "error_class": error_class,
+            "escalate_code": escalate,
+            "pending_fix": None,
             "retry_count": state.get("retry_count", 0) + 1,
             "logs": logs
         }
\ No newline at end of file
@@ -1,74 +1,311 @@
-from app.config import get_llm
+import asyncio
+import contextvars
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode, urljoin
+
+from app.cancellation import call_cancellable
+from app.config import get_llm, DATA_DIR
 from app.state import AgentState
 from app.tools.browser import browser_instance
-from langchain_core.messages import HumanMessage
+from app.tools.fingerprint import FINGERPRINT_JS
+
+DISCOVERY_DIR = os.path.join(DATA_DIR, "discovery")
+MAX_PAGES = int(os.getenv("DISCOVERY_MAX_PAGES", "30"))
+MAX_DEPTH = int(os.getenv("DISCOVERY_MAX_DEPTH", "2"))
+CONCURRENCY = int(os.getenv("DISCOVERY_CONCURRENCY", "4"))
+PAGE_TIMEOUT_MS = 15000
+# Tasks starting with this crawl the site instead of being planned (or state["mode"] == "discover")
+DISCOVER_PREFIX = re.compile(r"^\s*discover\s*:", re.IGNORECASE)
+
+_TRACKING_PARAMS = re.compile(r"^(utm_.*|gclid|fbclid|msclkid|ref|ref_|_ga|mc_.*)$", re.IGNORECASE)
+_SKIP_EXTENSIONS = re.compile(r"\.(pdf|jpe?g|png|gif|svg|webp|ico|zip|gz|mp4|mp3|css|js|xml|json)$", re.IGNORECASE)
+
+# Runs in the page: interactive elements, same-page links and the structural
+# fingerprint (see app/tools/fingerprint.py) - no LLM needed.
+EXTRACT_JS = """() => {
+    const cssPath = (el) => {
+        if (el.id) return '#' + CSS.escape(el.id);
+        const name = el.getAttribute('name');
+        if (name) return el.tagName.toLowerCase() + '[name="' + name + '"]';
+        const testId = el.getAttribute('data-testid') || el.getAttribute('data-test');
+        if (testId) return '[data-test' + (el.hasAttribute('data-testid') ? 'id' : '') + '="' + testId + '"]';
+        return null;
+    };
+    const label = (el) => (el.getAttribute('aria-label') || el.innerText || el.value || el.getAttribute('placeholder') || el.getAttribute('alt') || '')
+        .trim().replace(/\\s+/g, ' ').slice(0, 60);
+    const visible = (el) => !!(el.offsetWidth || el.offsetHeight || el.getClientRects().length);
+
+    const elements = [];
+    document.querySelectorAll('a[href], button, input, select, textarea, [role="button"], [role="link"], [onclick]').forEach((el) => {
+        if (!visible(el) || elements.length >= 150) return;
+        elements.push({
+            tag: el.tagName.toLowerCase(),
+            role: el.getAttribute('role'),
+            type: el.getAttribute('type'),
+            text: label(el),
+            selector: cssPath(el),
+        });
+    });
+
+    const forms = Array.from(document.forms).slice(0, 10).map((f) => ({
+        action: f.getAttribute('action'),
+        fields: Array.from(f.elements).map((e) => e.getAttribute('name') || e.getAttribute('type') || e.tagName.toLowerCase()).slice(0, 20),
+    }));
+
+    const links = Array.from(document.querySelectorAll('a[href]')).map((a) => a.href);
+
+    return { title: document.title, elements, forms, links, structure: (""" + FINGERPRINT_JS + """)() };
+}"""
+
+
+def normalize_url(url: str) -> str:
+    """Dedup key for a URL: lowercase host, no fragment/default port/tracking params, sorted query."""
+    parsed = urlparse(url)
+    host = parsed.hostname or ""
+    if parsed.port and not ((parsed.scheme == "http" and parsed.port == 80) or (parsed.scheme == "https" and parsed.port == 443)):
+        host = f"{host}:{parsed.port}"
+    query = sorted((k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if not _TRACKING_PARAMS.match(k))
+    path = parsed.path.rstrip("/") or "/"
+    return urlunparse((parsed.scheme.lower(), host.lower(), path, "", urlencode(query), ""))
+
+
+def path_template(url: str) -> str:
+    """/products/123/reviews -> /products/:id/reviews (used to label clusters)."""
+    parts = []
+    for part in urlparse(url).path.strip("/").split("/"):
+        if re.fullmatch(r"\d+|[0-9a-f]{8,}|[A-Z0-9]{10}", part or ""):
+            part = ":id"
+        parts.append(part)
+    return "/" + "/".join(parts)
+
+
+def _crawlable(url: str, origin: str) -> bool:
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        return False
+    if f"{parsed.scheme}://{parsed.netloc}".lower() != origin:
+        return False
+    return not _SKIP_EXTENSIONS.search(parsed.path)
+
+
+async def crawl(context, start_url: str, max_pages=MAX_PAGES, max_depth=MAX_DEPTH, concurrency=CONCURRENCY):
+    """
+    Bounded concurrent BFS over same-origin links using `concurrency` pages of one context.
+    The origin is the one the start page ends up on (after redirects). Pages whose
+    structure hash was already seen are recorded but not expanded, and no more than
+    `max_pages` URLs are queued. Returns the list of visited page records.
+    """
+    queue = asyncio.Queue()
+    seen_urls = {normalize_url(start_url)}
+    seen_structures = set()
+    pages = []
+    origin = None
+    queued = 1
+    await queue.put((start_url, 0))
+
+    async def worker():
+        nonlocal origin, queued
+        page = await context.new_page()
+        page.set_default_timeout(PAGE_TIMEOUT_MS)
+        try:
+            while True:
+                url, depth = await queue.get()
+                try:
+                    record = {"url": url, "key": normalize_url(url), "depth": depth}
+                    pages.append(record)
+                    try:
+                        await page.goto(url, wait_until="domcontentloaded", timeout=PAGE_TIMEOUT_MS)
+                        info = await page.evaluate(EXTRACT_JS)
+                    except Exception as e:
+                        record["error"] = str(e).split("\n")[0]
+                        continue
+
+                    if origin is None:
+                        # Redirects (http -> https, apex -> www) decide where the site lives
+                        final = urlparse(page.url)
+                        origin = f"{final.scheme}://{final.netloc}".lower()
+                        seen_urls.add(normalize_url(page.url))
+                    record.update({
+                        "final_url": page.url,
+                        "title": info["title"],
+                        "structure": info["structure"],
+                        "elements": info["elements"],
+                        "forms": info["forms"],
+                    })
+                    duplicate = info["structure"] in seen_structures
+                    seen_structures.add(info["structure"])
+                    record["duplicate_structure"] = duplicate
+                    if duplicate or depth >= max_depth:
+                        continue
+
+                    links = []
+                    for href in info["links"]:
+                        if queued >= max_pages:
+                            break
+                        href = urljoin(page.url, href)
+                        key = normalize_url(href)
+                        if key in seen_urls or not _crawlable(href, origin):
+                            continue
+                        seen_urls.add(key)
+                        links.append(href)
+                        queued += 1
+                        await queue.put((href, depth + 1))
+                    record["links"] = links
+                finally:
+                    queue.task_done()
+        finally:
+            await page.close()
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, concurrency))]
+    # Wait for the queue to drain, or for every worker to have died (e.g. no tab could be opened)
+    drained = asyncio.create_task(queue.join())
+    running = set(workers)
+    try:
+        while running and not drained.done():
+            done, _ = await asyncio.wait(running | {drained}, return_when=asyncio.FIRST_COMPLETED)
+            running -= done
+    finally:
+        drained.cancel()
+        for task in workers:
+            task.cancel()
+        results = await asyncio.gather(*workers, return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors and not pages:
+        raise errors[0]
+    return pages
+
+
+def cluster_pages(pages):
+    """Group successfully loaded pages by structure hash. Returns {cluster_id: [page, ...]}."""
+    clusters = {}
+    for page in pages:
+        if page.get("structure"):
+            clusters.setdefault(page["structure"], []).append(page)
+    return clusters
+
+
+def _parse_flows(text: str):
+    """Parse the LLM's list of flows safely (JSON first, then a Python literal) - never eval."""
+    import ast
+    text = text.replace("```json", "").replace("```python", "").replace("```", "").strip()
+    for parser in (json.loads, ast.literal_eval):
+        try:
+            flows = parser(text)
+            if isinstance(flows, list):
+                return [str(flow) for flow in flows]
+        except (ValueError, SyntaxError):
+            continue
+    return []
+
+
+def propose_flows(url: str, members):
+    """One LLM call per cluster, using the representative page's extracted elements (text only)."""
+    llm = get_llm(purpose="discovery")
+    page = members[0]
+    elements = "\n".join(
+        f"- {e['tag']}{'[' + e['type'] + ']' if e.get('type') else ''} \"{e['text']}\"" + (f" ({e['selector']})" if e.get("selector") else "")
+        for e in page["elements"][:60]
+    )
+    prompt_text = f"""
+    You are a Test Architect. The website {url} has a group of {len(members)} structurally similar page(s),
+    e.g. {page.get('final_url', page['url'])} (Title: {page.get('title', '')}; URL pattern {path_template(page['url'])}).
+    Forms: {json.dumps(page.get('forms', []))}
+    Interactive elements:
+    {elements}
+
+    Identify 1-3 critical user flows that should be tested on pages like this.
+    Examples of flows: "Login with valid credentials", "Search for a product", "Add item to cart".
+
+    Return ONLY a JSON list of strings describing these flows.
+    """
+    response = call_cancellable(llm.invoke, prompt_text)
+    return _parse_flows(response.content)
+
+
+def _save_results(url, pages, clusters, flows):
+    domain = urlparse(url).netloc.lower()
+    out_dir = os.path.join(DISCOVERY_DIR, domain)
+    os.makedirs(out_dir, exist_ok=True)
+
+    sitemap = {
+        "start_url": url,
+        "pages": [
+            {k: v for k, v in p.items() if k != "elements"} | {"interactive_elements": len(p.get("elements", []))}
+            for p in pages
+        ],
+        "clusters": {
+            cid: {"pattern": path_template(members[0]["url"]), "urls": [m["url"] for m in members]}
+            for cid, members in clusters.items()
+        },
+    }
+    sitemap_path = os.path.join(out_dir, "sitemap.json")
+    with open(sitemap_path, "w", encoding="utf-8") as f:
+        json.dump(sitemap, f, indent=2)
+
+    flows_path = os.path.join(out_dir, "flows.json")
+    with open(flows_path, "w", encoding="utf-8") as f:
+        json.dump(flows, f, indent=2)
+    return sitemap_path, flows_path
+
+
+def is_discovery_task(state: AgentState):
+    """Discovery is explicit: a "discover: <url>" task or mode="discover" - never guessed from the wording."""
+    return state.get("mode") == "discover" or bool(DISCOVER_PREFIX.match(state.get("task") or ""))
+
 
 def discovery_node(state: AgentState):
     """
-    Discovery Agent: Crawls a URL and identifies potential user flows.
+    Discovery Agent: Crawls a site and identifies potential user flows.
+    The LLM is only called once per cluster of structurally similar pages.
     """
-    llm = get_llm()
     task = state.get('task')
-    
+
     # Extract URL from task if present (simple heuristic)
-    import re
     url_match = re.search(r'https?://[^\s]+', task)
     if not url_match:
         return {
             "logs": ["⚠️ No URL found in task for discovery. Skipping."]
         }
-    
-    url = url_match.group(0)
-    
-    # 1. Navigate to the page
-    import os
-    browser_instance.start(headless=False)
-    page = browser_instance.get_page()
-    
+
+    url = url_match.group(0).rstrip(".,)'\"")
+
     try:
-        page.goto(url, wait_until='domcontentloaded')
-        page.wait_for_timeout(2000) # Wait for UI to settle
-        
-        # 2. Capture Screenshot for Vision Analysis
-        import base64
-        screenshot_bytes = page.screenshot(type='png')
-        screenshot_b64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-        
-        # 3. Get page text/content (simplified)
-        page_title = page.title()
-        
-        # 4. Ask LLM to identify flows
-        prompt_text = f"""
-        You are a Test Architect. You are looking at the website: {url} (Title: {page_title}).
-        
-        Based on the screenshot of the page, identify 3-5 critical user flows that should be tested.
-        Examples of flows: "Login with valid credentials", "Search for a product", "Add item to cart", "Navigate to About Us".
-        
-        Return ONLY a Python list of strings describing these flows.
-        """
-        
-        message_content = [
-            {"type": "text", "text": prompt_text},
-            {
-                "type": "image_url",
-                "image_url": {"url": f"data:image/png;base64,{screenshot_b64}"}
+        # 1. Crawl same-origin pages concurrently
+        browser_instance.start()
+        pages = browser_instance.run_async(crawl(browser_instance.async_context, url))
+        loaded = [p for p in pages if p.get("structure")]
+        if not loaded:
+            return {
+                "logs": [f"❌ Discovery failed: could not load {url}"]
             }
+
+        # 2. Cluster by page structure so similar pages share one LLM call
+        clusters = cluster_pages(pages)
+
+        # 3. Propose flows per cluster (LLM calls run concurrently)
+        cluster_ids = list(clusters)
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(4, len(cluster_ids))) as pool:
+            results = list(pool.map(lambda cid: context.copy().run(propose_flows, url, clusters[cid]), cluster_ids))
+        flows = [
+            {"cluster": cid, "pattern": path_template(clusters[cid][0]["url"]), "example_url": clusters[cid][0]["url"], "flows": result}
+            for cid, result in zip(cluster_ids, results)
         ]
-        
-        response = llm.invoke([HumanMessage(content=message_content)])
-        
-        # Parse flows
-        try:
-            suggested_flows = eval(response.content.replace("```python", "").replace("```", "").strip())
-        except:
-            suggested_flows = ["Could not parse flows"]
+
+        sitemap_path, flows_path = _save_results(url, pages, clusters, flows)
+        all_flows = [flow for entry in flows for flow in entry["flows"]]
 
         return {
-            "logs": [f"🔍 Discovery complete. Found flows: {suggested_flows}"],
-            # In a real app, we might store these in state or present to user
-            # For now, we just log them.
+            "logs": [
+                f"🕸️ Crawled {len(loaded)} page(s) ({len(pages) - len(loaded)} failed) into {len(clusters)} cluster(s).",
+                f"🔍 Discovery complete. Found flows: {all_flows}",
+                f"💾 Site map: {sitemap_path}, flows: {flows_path}",
+            ],
         }
-        
+
     except Exception as e:
         return {
             "logs": [f"❌ Discovery failed: {str(e)}"]
@@ -6,6 +6,22 @@ from app.tools.browser import browser_instance
 # Simple baseline storage (in a real app, use a database or artifact store)
 BASELINE_DIR = "baselines"
 
+# Skip the screenshot + pixel diff when the page structure matches the baseline's.
+# Off by default: the fingerprint has no text or styles, so text/CSS regressions would pass
+STRUCTURE_SHORTCUT = os.getenv("MONITOR_STRUCTURE_SHORTCUT", "0") == "1"
+
+def baseline_path(task, step):
+    """Baseline screenshot of a task after `step` steps (the .fp fingerprint sits next to it)."""
+    import hashlib
+    task_hash = hashlib.md5(task.encode()).hexdigest()
+    return os.path.join(BASELINE_DIR, f"{task_hash}_step_{step}.png")
+
+def _save_fingerprint(fingerprint_path, fingerprint):
+    """Fingerprint of a page that matched its baseline (also for baselines saved before .fp files)."""
+    if fingerprint and not os.path.exists(fingerprint_path):
+        with open(fingerprint_path, "w") as f:
+            f.write(fingerprint)
+
 def monitor_node(state: AgentState):
     """
     Regression Monitor: Compares current screenshot with baseline.
@@ -13,22 +29,35 @@ def monitor_node(state: AgentState):
     os.makedirs(BASELINE_DIR, exist_ok=True)
     
     # Identify task ID (simple hash of the task description for now)
-    import hashlib
-    task_hash = hashlib.md5(state['task'].encode()).hexdigest()
     step = state.get('current_step_index', 0)
-    baseline_path = os.path.join(BASELINE_DIR, f"{task_hash}_step_{step}.png")
+    baseline_png = baseline_path(state['task'], step)
+    fingerprint_path = baseline_png[:-len(".png")] + ".fp"
     
     # Capture current screenshot
     try:
         # Ensure browser is started
-        browser_instance.start(headless=False)
+        browser_instance.start()
         page = browser_instance.get_page()
+        # Only needed for the shortcut, or to write a .fp file this baseline doesn't have yet
+        fingerprint = None
+        if STRUCTURE_SHORTCUT or not os.path.exists(fingerprint_path):
+            fingerprint = browser_instance.fingerprint()
+        
+        # Same DOM structure as the baseline - no need for a screenshot or pixel diff
+        if STRUCTURE_SHORTCUT and fingerprint and os.path.exists(baseline_png) and os.path.exists(fingerprint_path):
+            with open(fingerprint_path, "r") as f:
+                if f.read().strip() == fingerprint:
+                    return {
+                        "logs": ["✅ Visual Check Passed (page structure unchanged)."]
+                    }
+        
         screenshot_bytes = page.screenshot(type='png')
         
         # If no baseline, save as baseline
-        if not os.path.exists(baseline_path):
-            with open(baseline_path, "wb") as f:
+        if not os.path.exists(baseline_png):
+            with open(baseline_png, "wb") as f:
                 f.write(screenshot_bytes)
+            _save_fingerprint(fingerprint_path, fingerprint)
             return {
                 "logs": ["📸 New task detected. Saved screenshot as BASELINE."]
             }
@@ -42,7 +71,7 @@ def monitor_node(state: AgentState):
                 import io
                 
                 img_current = Image.open(io.BytesIO(screenshot_bytes)).convert('RGB')
-                img_baseline = Image.open(baseline_path).convert('RGB')
+                img_baseline = Image.open(baseline_png).convert('RGB')
                 
                 # Resize if needed to match (simple approach)
                 if img_current.size != img_baseline.size:
@@ -63,10 +92,12 @@ def monitor_node(state: AgentState):
                             "logs": [f"⚠️ VISUAL REGRESSION DETECTED! Difference: {diff_percentage:.2f}%"]
                         }
                     else:
+                         _save_fingerprint(fingerprint_path, fingerprint)
                          return {
                             "logs": ["✅ Visual Check Passed (Minor noise ignored)."]
                         }
                 else:
+                    _save_fingerprint(fingerprint_path, fingerprint)
                     return {
                         "logs": ["✅ Visual Check Passed (Exact match)."]
                     }
@@ -0,0 +1,147 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.state import AgentState
+from app.tools.browser import browser_instance
+from app.agents.coder import generate_script
+from app.agents.planner import split_branch
+from app.tools.timeouts import timeout_profiles, resolve_timeout
+
+# Max branches (tabs) running at the same time
+MAX_PARALLEL_TABS = int(os.getenv("MAX_PARALLEL_TABS", "4"))
+
+
+def starts_parallel_group(state: AgentState) -> bool:
+    """True if the current step is a branch-tagged step (start of a parallel group)."""
+    plan = state.get("plan", [])
+    index = state.get("current_step_index", 0)
+    if index < (state.get("sequential_until") or 0):
+        # Falling back to sequential execution after a failed parallel group
+        return False
+    return index < len(plan) and split_branch(plan[index])[0] is not None
+
+
+def parallel_group(plan, start):
+    """
+    Collect the run of consecutive branch-tagged steps starting at `start`.
+    Returns (end_index, {branch: [(step_index, code), ...]}) with branches in order of first appearance.
+    """
+    branches = {}
+    end = start
+    while end < len(plan):
+        branch, code = split_branch(plan[end])
+        if branch is None:
+            break
+        branches.setdefault(branch, []).append((end, code))
+        end += 1
+    return end, branches
+
+
+def _run_branch(name, steps, state):
+    """
+    Generate and run one branch's steps in order in its own tab, each with its
+    learned (or overridden) timeout. Stops at the first failure; an error outside
+    the step scripts (e.g. the tab could not be opened) fails the step it hit.
+    """
+    results = []
+    page = None
+    index = steps[0][0]
+    try:
+        page = browser_instance.new_page()
+        for index, code in steps:
+            try:
+                script, _ = generate_script(code)
+            except Exception as e:
+                results.append({"index": index, "status": "error", "error": str(e), "script": None, "timeout_ms": None})
+                break
+            timeout_ms, domain, kind, _ = resolve_timeout({**state, "current_step_index": index}, code, page.url)
+            browser_instance.set_step_timeout(timeout_ms, page=page)
+            started = time.perf_counter()
+            result = browser_instance.execute_script(script, page=page)
+            if result["status"] == "success":
+                timeout_profiles.record(domain, kind, (time.perf_counter() - started) * 1000)
+            results.append({"index": index, "script": script, "timeout_ms": timeout_ms, **result})
+            if result["status"] != "success":
+                break
+    except Exception as e:
+        results.append({"index": index, "status": "error", "error": str(e), "script": None, "timeout_ms": None})
+    finally:
+        if page is not None:
+            try:
+                page.close()
+            except Exception:
+                pass
+    return name, results
+
+
+def parallel_node(state: AgentState):
+    """
+    Run a group of independent plan steps concurrently, one tab per branch.
+    Results are merged back in plan order so the state and logs are deterministic.
+    If a step fails, its branch is re-run sequentially on the main tab (from the
+    branch's first step) so the usual triage/repair path sees the right page;
+    the steps other branches completed are kept and skipped (completed_steps).
+    """
+    plan = state["plan"]
+    start = state["current_step_index"]
+    end, branches = parallel_group(plan, start)
+
+    browser_instance.start()
+    workers = min(MAX_PARALLEL_TABS, len(branches))
+    logs = [f"🔀 Running steps {start + 1}-{end} as {len(branches)} parallel branch(es) on up to {workers} tab(s)"]
+
+    # Branch threads must see the same browser_instance (the run's leased browser)
+    context = contextvars.copy_context()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        branch_results = dict(pool.map(lambda item: context.copy().run(_run_branch, *item, state), branches.items()))
+
+    # Merge in plan order
+    results = sorted((r for rs in branch_results.values() for r in rs), key=lambda r: r["index"])
+    for name, steps in branches.items():
+        done = sum(1 for r in branch_results[name] if r["status"] == "success")
+        logs.append(f"  [{name}] {done}/{len(steps)} step(s) succeeded")
+
+    failures = [r for r in results if r["status"] != "success"]
+    failed_branch = None
+    if failures:
+        failed_branch = next(name for name, rs in branch_results.items() if failures[0] in rs)
+    # Steps of the branches that completed (a failed branch re-runs from its first step on the main tab)
+    kept = [r for name, rs in branch_results.items() if name != failed_branch for r in rs]
+    step_scripts = dict(state.get("step_scripts") or {})
+    step_outputs = dict(state.get("step_outputs") or {})
+    for r in sorted(kept, key=lambda r: r["index"]):
+        step_scripts[str(r["index"])] = {"script": r["script"], "timeout_ms": r["timeout_ms"]}
+        step_outputs[str(r["index"])] = r.get("output")
+
+    if not failures:
+        logs.append("✅ Parallel group complete")
+        return {
+            "current_script": None,
+            "error": None,
+            "error_class": None,
+            "step_scripts": step_scripts,
+            "step_outputs": step_outputs,
+            "current_step_index": end,
+            "retry_count": 0,
+            "logs": logs
+        }
+
+    failed = failures[0]
+    restart = branches[failed_branch][0][0]
+    completed = sorted({*(state.get("completed_steps") or []), *(r["index"] for r in kept)})
+    logs.append(f"❌ Step {failed['index'] + 1} failed in branch [{failed_branch}]: {failed['error']}")
+    logs.append(f"↪️ Re-running branch [{failed_branch}] from step {restart + 1} sequentially"
+                + (f", keeping {len(kept)} completed step(s) of the other branches." if kept else "."))
+    return {
+        "current_script": None,
+        "error": None,
+        "error_class": None,
+        "step_scripts": step_scripts,
+        "step_outputs": step_outputs,
+        "completed_steps": completed,
+        "current_step_index": restart,
+        "sequential_until": end,
+        "logs": logs
+    }
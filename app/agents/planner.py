@@ -1,8 +1,71 @@
-from app.config import get_llm
+from app.config import MissingAPIKeyError
+from app.llm import cascade
+from app.llm.cascade import validate_script
 from app.state import AgentState
+from app.agents.triage import classify_failure, FATAL
+from app.tools.assertions import split_assertion, parse_assertion
+import re
+import uuid
+
+# "[branch:name] page.goto(...)" - steps of one branch run in order in their own tab,
+# different branches run in parallel (see agents/parallel.py)
+BRANCH_TAG = re.compile(r'^\[branch:([\w-]+)\]\s*')
+
+def split_branch(step: str):
+    """Returns (branch name or None, step code without the tag)."""
+    match = BRANCH_TAG.match(step)
+    if not match:
+        return None, step
+    return match.group(1), step[match.end():]
+
+def parse_plan(content: str):
+    """Plan steps (code lines, optionally branch-tagged) from the LLM's answer."""
+    # Remove markdown code blocks if present
+    content = content.strip().replace("```python", "").replace("```text", "").replace("```", "").strip()
+    
+    # Split by newlines and filter empty lines
+    plan = [line.strip() for line in content.split('\n') if line.strip()]
+    
+    # Remove any leading "- " or "* " or "1. " if LLM ignored instructions
+    cleaned_plan = []
+    for step in plan:
+        # Remove common list markers
+        step = re.sub(r'^[\d]+\.\s*', '', step)
+        step = re.sub(r'^[\-\*]\s*', '', step)
+        # Remove quotes if the LLM wrapped the whole line in quotes
+        if (step.startswith('"') and step.endswith('"')) or (step.startswith("'") and step.endswith("'")):
+            step = step[1:-1]
+        
+        # Verify it looks like code (starts with page. or browser_manager.)
+        # This is a loose check to filter out conversational text
+        _, code = split_branch(step)
+        if code.startswith("page.") or code.startswith("browser_manager.") or code.startswith("await"):
+            cleaned_plan.append(step)
+        elif split_assertion(step) is not None:
+            cleaned_plan.append(step)
+    return cleaned_plan
+
+def validate_plan(content: str):
+    """Static check of a plan answer for the model cascade: None if usable, else why not."""
+    steps = parse_plan(content)
+    if not steps:
+        return "no valid steps"
+    for index, step in enumerate(steps):
+        assertion = split_assertion(step)
+        if assertion is not None:
+            try:
+                parse_assertion(assertion)
+            except ValueError as e:
+                return f"step {index + 1}: {str(e)}"
+            continue
+        problem = validate_script(split_branch(step)[1])
+        if problem:
+            return f"step {index + 1}: {problem}"
+    return None
 
 def plan_node(state: AgentState):
-    llm = get_llm()
+    # Identifies the run in traces and other per-run records
+    run_id = state.get("run_id") or uuid.uuid4().hex[:12]
     task = state['task']
     
     prompt = f"""
@@ -18,47 +81,78 @@ def plan_node(state: AgentState):
        - page.goto('url', wait_until='domcontentloaded')
     
     2. HANDLING NEW TABS (Critical for Amazon/E-commerce):
-       - If an action (like clicking a product) opens a new tab, add "browser_manager.switch_to_new_tab()" step immediately after.
+       - If an action (like clicking a product) opens a new tab, the next step runs in that tab automatically.
+       - Do NOT add browser_manager.switch_to_new_tab() steps.
     
     3. SEARCHING:
        - Prefer clicking search buttons over pressing Enter.
     
+    4. INDEPENDENT WORK (e.g. "check prices on these five product pages"):
+       - Steps that do not depend on each other can run in parallel tabs.
+       - Prefix them with a branch tag: [branch:NAME] page.goto(...)
+       - Steps with the same tag run in order in one tab; each branch MUST start with its own page.goto().
+       - Put all branch steps together, after any shared setup steps (like logging in). Do not switch tabs inside a branch.
+    
+    5. VERIFICATION ("verify I am on ...", "check that ..."):
+       - Do NOT write code for checks. Emit one "[assert] ..." line per check (CSS or XPath selectors):
+         [assert] url matches <regex>  |  [assert] url contains <text>  |  [assert] title contains <text>
+         [assert] visible <selector>  |  [assert] hidden <selector>
+         [assert] text <selector> contains <text>  |  [assert] text <selector> is <text>
+         [assert] count <selector> >= <number>  (also ==, !=, <=, >, <)
+         [assert] unchanged <selector>  (the element looks the same as in earlier runs)
+       - Assertion lines are never branch-tagged.
+    
     Example Output: 
     page.goto('https://amazon.in', wait_until='domcontentloaded')
     page.fill('#twotabsearchtextbox', 'blue tshirt')
     page.click('input[type="submit"]')
-    browser_manager.switch_to_new_tab()
-    """
-    
-    response = llm.invoke(prompt)
     
-    content = response.content.strip()
+    Example Output (verification):
+    page.goto('https://www.saucedemo.com', wait_until='domcontentloaded')
+    page.fill('#user-name', 'standard_user')
+    page.fill('#password', 'secret_sauce')
+    page.click('#login-button')
+    [assert] url contains /inventory.html
+    [assert] visible .inventory_list
     
-    # Simple line-based parsing
-    # Remove markdown code blocks if present
-    content = content.replace("```python", "").replace("```text", "").replace("```", "").strip()
+    Example Output (parallel):
+    [branch:p1] page.goto('https://shop.example.com/item/1', wait_until='domcontentloaded')
+    [branch:p1] page.locator('.price').first.inner_text()
+    [branch:p2] page.goto('https://shop.example.com/item/2', wait_until='domcontentloaded')
+    [branch:p2] page.locator('.price').first.inner_text()
+    """
     
-    # Split by newlines and filter empty lines
-    plan = [line.strip() for line in content.split('\n') if line.strip()]
+    try:
+        # Fast model first, strong model if the plan does not parse (see app/llm/cascade.py)
+        response, tier, escalated = cascade.invoke("plan", prompt, validate=validate_plan)
+    except MissingAPIKeyError as e:
+        # Nothing can run without an API key, end before touching the browser
+        return {
+            "run_id": run_id,
+            "plan": [],
+            "current_step_index": 0,
+            "retry_count": 0,
+            "error": str(e),
+            "error_class": FATAL,
+            "logs": [f"❌ {str(e)}"]
+        }
+    except Exception as e:
+        return {
+            "run_id": run_id,
+            "plan": [],
+            "current_step_index": 0,
+            "retry_count": 0,
+            "error": str(e),
+            "error_class": classify_failure(str(e)),
+            "logs": [f"❌ Planning failed: {str(e)}"]
+        }
     
-    # Remove any leading "- " or "* " or "1. " if LLM ignored instructions
-    import re
-    cleaned_plan = []
-    for step in plan:
-        # Remove common list markers
-        step = re.sub(r'^[\d]+\.\s*', '', step)
-        step = re.sub(r'^[\-\*]\s*', '', step)
-        # Remove quotes if the LLM wrapped the whole line in quotes
-        if (step.startswith('"') and step.endswith('"')) or (step.startswith("'") and step.endswith("'")):
-            step = step[1:-1]
-        
-        # Verify it looks like code (starts with page. or browser_manager.)
-        # This is a loose check to filter out conversational text
-        if step.startswith("page.") or step.startswith("browser_manager.") or step.startswith("await"):
-            cleaned_plan.append(step)
+    content = response.content.strip()
+    cleaned_plan = parse_plan(content)
             
     if not cleaned_plan:
          return {
+            "run_id": run_id,
             "plan": [],
             "current_step_index": 0,
             "retry_count": 0,
@@ -67,8 +161,10 @@ def plan_node(state: AgentState):
         }
             
     return {
+        "run_id": run_id,
         "plan": cleaned_plan, 
         "current_step_index": 0, 
         "retry_count": 0,
-        "logs": [f"📅 Plan created with {len(cleaned_plan)} steps."]
+        "logs": ([f"⬆️ Fast model's plan rejected ({escalated}) - used the strong model."] if escalated else [])
+                + [f"📅 Plan created with {len(cleaned_plan)} steps ({tier} model)."]
     }
\ No newline at end of file
@@ -0,0 +1,197 @@
+"""
+Preflight: check the plan's selectors against the live page before running steps.
+
+Before each step the selectors of the upcoming steps that will run on the
+current page (up to the next navigation, tab switch, click or key press) are
+extracted with `ast` and resolved in one batched evaluate: match count and
+visibility. This only happens while the page is on the URL the steps were
+planned for (their last page.goto). A selector of the current step that
+still matches nothing PREFLIGHT_GRACE_MS after the document has finished
+loading, or that matches several elements where Playwright is strict, goes
+straight to the healer instead of waiting for a 30s timeout. If the page is
+still loading after PREFLIGHT_MAX_WAIT_MS, a missing selector is only logged
+and Playwright's own wait takes over. CSS selectors are also resolved in open
+shadow roots; issues of later steps are only logged.
+"""
+import ast
+import os
+import time
+from urllib.parse import urlparse
+
+from app.state import AgentState
+from app.tools.browser import browser_instance
+from app.agents.planner import split_branch
+from app.agents.triage import HEALABLE
+
+PREFLIGHT_ENABLED = os.getenv("PREFLIGHT", "1").lower() in ("1", "true", "yes")
+PREFLIGHT_GRACE_MS = int(os.getenv("PREFLIGHT_GRACE_MS", "2000"))
+PREFLIGHT_MAX_WAIT_MS = int(os.getenv("PREFLIGHT_MAX_WAIT_MS", "5000"))
+
+# page.<method>(selector, ...) calls that wait for the selector to match
+SELECTOR_ACTIONS = {
+    "click", "dblclick", "tap", "fill", "type", "press", "check", "uncheck", "hover", "focus",
+    "select_option", "set_input_files", "inner_text", "inner_html", "text_content",
+    "get_attribute", "input_value", "locator",
+}
+# Steps after one of these may be on another page
+NAVIGATING_ACTIONS = {"goto", "click", "dblclick", "tap", "press", "go_back", "go_forward", "reload", "switch_to_new_tab"}
+# locator(...) followed by these does not wait for a match / is not strict
+NON_WAITING_LOCATOR_USES = {"count", "all", "is_visible", "is_hidden", "wait_for"}
+NON_STRICT_LOCATOR_USES = {"first", "last", "nth"}
+# Playwright-only selector syntax that document.querySelectorAll can't evaluate
+PLAYWRIGHT_ONLY = ("text=", "role=", "id=", "data-testid=", "internal:", ">>", ":has-text(", ":text(", ":visible", ":nth-match(")
+
+
+def _parse(code: str):
+    source = code.strip()
+    if "await" in source:
+        source = "async def _step():\n" + "\n".join("    " + line for line in source.split("\n"))
+    try:
+        return ast.parse(source)
+    except SyntaxError:
+        return None
+
+
+def step_calls(code: str):
+    """
+    [(method, first string argument or None, strict)] for the calls on `page`
+    (including chained ones) of a step, or None if the step does not parse.
+    `strict` marks locator(...) actions, which fail on more than one match.
+    """
+    tree = _parse(code)
+    if tree is None:
+        return None
+    parents = {}
+    for node in ast.walk(tree):
+        for child in ast.iter_child_nodes(node):
+            parents[child] = node
+
+    calls = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)):
+            continue
+        receiver = root = node.func.value
+        while isinstance(root, (ast.Attribute, ast.Call, ast.Subscript, ast.Await)):
+            root = root.func if isinstance(root, ast.Call) else root.value
+        if not (isinstance(root, ast.Name) and root.id in ("page", "browser_manager")):
+            continue
+        method = node.func.attr
+        argument = None
+        # Only selectors passed to page.* itself - chained ones are relative to another locator
+        if receiver is root and node.args and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str):
+            argument = node.args[0].value
+        strict = False
+        if method == "locator":
+            use = parents.get(node)
+            use_name = use.attr if isinstance(use, ast.Attribute) else None
+            if use_name in NON_WAITING_LOCATOR_USES:
+                argument = None
+            elif use_name not in NON_STRICT_LOCATOR_USES:
+                strict = True
+        calls.append((method, argument, strict))
+    return calls
+
+
+def _goto_url(code: str):
+    return next((argument for method, argument, _ in step_calls(code) or [] if method == "goto"), None)
+
+
+def _same_page(url_a: str, url_b: str):
+    a, b = urlparse(url_a or ""), urlparse(url_b or "")
+    host = lambda u: u.netloc.lower().removeprefix("www.")
+    return host(a) == host(b) and (a.path.rstrip("/") or "/") == (b.path.rstrip("/") or "/")
+
+
+def preflight_window(plan, start):
+    """[(step index, calls)] of the steps from `start` that run on the current page."""
+    window = []
+    for index in range(start, len(plan)):
+        branch, code = split_branch(plan[index])
+        calls = step_calls(code)
+        if branch or calls is None:
+            break
+        methods = {method for method, _, _ in calls}
+        if index > start and "goto" in methods:
+            break
+        window.append((index, calls))
+        if methods & NAVIGATING_ACTIONS:
+            break
+    return window
+
+
+def target_url(plan, start):
+    """URL of the last page.goto() before step `start` (None if there is none)."""
+    for index in range(start - 1, -1, -1):
+        url = _goto_url(split_branch(plan[index])[1])
+        if url:
+            return url
+    return None
+
+
+def preflight_node(state: AgentState):
+    if not PREFLIGHT_ENABLED:
+        return {}
+    plan = state["plan"]
+    step_idx = state["current_step_index"]
+    page = browser_instance.get_page()
+    if page is None:
+        return {}
+    expected = target_url(plan, step_idx)
+    if expected and not _same_page(page.url, expected):
+        return {}  # Navigated elsewhere (e.g. a search result) - the plan's selectors may not apply
+
+    items, owners = [], []
+    for index, calls in preflight_window(plan, step_idx):
+        for method, selector, strict in calls:
+            if method not in SELECTOR_ACTIONS:
+                continue
+            if selector and not any(token in selector for token in PLAYWRIGHT_ONLY) and not selector.startswith(("'", '"')):
+                items.append({"selector": selector, "wait": index == step_idx})
+                owners.append((index, method, selector, strict))
+    if not items:
+        return {}
+
+    started = time.perf_counter()
+    try:
+        checked = browser_instance.check_selectors(items, grace_ms=PREFLIGHT_GRACE_MS, max_wait_ms=PREFLIGHT_MAX_WAIT_MS)
+    except Exception as e:
+        return {"logs": [f"⚠️ Preflight skipped: {str(e)}"]}
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    logs = []
+    blocking = None
+    for (index, method, selector, strict), result in zip(owners, checked["results"]):
+        if result.get("unsupported"):
+            continue
+        if result["count"] == 0:
+            problem = f"selector '{selector}' matched no elements"
+        elif strict and result["count"] > 1:
+            problem = f"strict mode violation: locator('{selector}') resolved to {result['count']} elements"
+        elif result["visible"] == 0:
+            logs.append(f"👁️ Preflight: step {index + 1} '{selector}' is on the page but hidden")
+            continue
+        else:
+            continue
+        if index == step_idx and blocking is None and (checked["settled"] or result["count"] > 1):
+            blocking = problem
+        elif index == step_idx and not checked["settled"] and result["count"] == 0:
+            # Still loading - slow content may yet show up within Playwright's own wait
+            logs.append(f"⏳ Preflight: step {index + 1} {problem} while the page is still loading")
+        else:
+            logs.append(f"⚠️ Preflight: step {index + 1} {problem} (yet)")
+
+    logs.insert(0, f"🛫 Preflight: {len(items)} selector(s) checked in {elapsed_ms:.0f}ms")
+    if blocking is None:
+        return {"logs": logs}
+
+    # Send the step to the healer now instead of letting it time out
+    _, code = split_branch(plan[step_idx])
+    error = f"Preflight: {blocking} on {page.url} (step {step_idx + 1} would time out)"
+    logs.append(f"❌ {error}")
+    return {
+        "current_script": code,
+        "error": error,
+        "error_class": HEALABLE,
+        "retry_count": state.get("retry_count", 0) + 1,
+        "logs": logs
+    }
@@ -0,0 +1,353 @@
+"""
+Prompt builder for the coder and healer.
+
+The static guidelines are split into sections. Only the sections relevant to the
+current step (coder) or error class (healer) are sent, as a system message whose
+static prefix is marked cacheable so providers that support prompt caching
+(Anthropic via OpenRouter) can reuse it across calls. A token budget caps how
+many optional sections are included.
+"""
+import os
+import re
+
+# Max tokens for the guideline (system) part of a single prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1500"))
+
+# Running totals, reported in the UI logs
+prompt_stats = {"calls": 0, "tokens_sent": 0, "tokens_saved": 0}
+
+_encoder = None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with tiktoken if installed, otherwise estimate (~4 chars per token)."""
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoder = False
+    if _encoder:
+        return len(_encoder.encode(text))
+    return (len(text) + 3) // 4
+
+
+# ---------------------------------------------------------------------------
+# Coder guidelines
+# ---------------------------------------------------------------------------
+
+CODER_BASE = """You write Python Playwright code for a single step of a browser automation plan.
+Assume 'page' variable exists and browser is already running.
+Assume 'browser_manager' variable exists in scope (use for switching tabs).
+You can use 'await' with page methods (e.g., await page.goto(url)) or call them directly (e.g., page.goto(url)).
+
+Core rules:
+- Do NOT add imports. Do NOT add page.goto unless specified in the step.
+- IMPORTANT: If you use 're' (regex), you MUST import it at the top of your snippet: "import re"
+- Before filling or clicking, wait for element: page.wait_for_selector('selector', state='visible')
+- For strict mode violations (multiple elements): Use .first, .last, or .nth(0) to select specific element
+- If element not found, try alternative strategies before giving up
+- Do not pass timeout= arguments unless the step asks for one; per-step timeouts are set automatically.
+- Return ONLY the code, no explanations."""
+
+# (name, trigger regex matched against the step text, guideline text)
+# Sections are listed in priority order - earlier sections win when the budget is tight.
+CODER_SECTIONS = [
+    ("navigation", r"goto|navigat|url|http", """Navigation:
+- For page.goto(): ALWAYS use wait_until='domcontentloaded' or 'commit' for SPEED:
+  - FASTEST: page.goto(url, wait_until='commit') - just wait for navigation commit
+  - FAST: page.goto(url, wait_until='domcontentloaded') - wait for DOM ready
+  - NEVER use wait_until='load' or 'networkidle' - these are too slow
+  - After commit/domcontentloaded, wait for specific elements if needed
+- After page.goto(), wait for page load: page.wait_for_load_state('domcontentloaded') first, then wait for elements"""),
+    ("forms", r"fill|type|press|input|search|login|password|username|form|submit|enter", """Forms and search:
+- For form inputs (universal across all sites), prefer name attribute: page.locator('[name="fieldname"]') - this is most reliable across ALL websites
+- For search boxes (universal): Try page.locator('[name*="search"], [name*="q"]') or page.locator('input[type="search"], textarea[name*="q"]') - works on Google, Amazon, eBay, etc.
+- After pressing Enter or submitting forms, wait for navigation:
+  - Use page.wait_for_load_state('domcontentloaded') for speed (faster than networkidle)
+  - Or wait for specific elements: page.wait_for_selector('expected-element')
+  - Avoid 'networkidle' - it's slow and often unnecessary"""),
+    ("dialogs", r"accept|cookie|consent|dialog|modal|popup|agree|dismiss", """Dialogs:
+- Handle dialogs carefully: Use .first for multiple matches: page.locator('button:has-text("Accept")').first.click() with try/except if dialog exists"""),
+    ("extraction", r"extract|scrape|collect|all\(\)|inner_text|text_content|get_attribute|list of|prices?|titles?|names|links|rows|table|results", """Reading data from the page - PREFER browser_manager.extract() (one round trip for all rows):
+- NEVER loop over page.locator(...).all() calling inner_text()/get_attribute() per element - each call is a separate round trip
+- Use a declarative schema instead (call it WITHOUT await; in scripts that use await, use await browser_manager.extract_async(schema)):
+  rows = browser_manager.extract({
+      "rows": ".s-result-item",                 # one row per matching element (omit for a single page-level row)
+      "fields": {
+          "title": "h2 a",                      # innerText of the first match inside the row
+          "link": "h2 a@href",                  # "@name" reads an attribute/property
+          "asin": "@data-asin",                 # attribute of the row element itself
+          "badges": {"selector": ".badge", "all": True},  # list of all matches
+      },
+      "limit": 50,
+  })
+- Returns a list of dicts (missing fields are None); large result sets are fetched in chunks automatically
+- Store the result in a variable (e.g. rows); print(rows) if the step asks to report the data"""),
+    ("evaluate", r"evaluate|javascript", """page.evaluate() JavaScript code - ALWAYS use null safety:
+- Use optional chaining: element?.property
+- Use nullish coalescing: value ?? defaultValue
+- Filter out nulls: .filter(item => item !== null)
+- Example: item.querySelector('h2 a')?.href ?? null"""),
+    ("attributes", r"\[[\w-]+[*^$]?=|data-|rating", """Attribute selectors that timeout:
+- Try numeric attributes without quotes: [data-rating=4] instead of [data-rating="4"]
+- Check if element exists first: if page.locator('selector').count() > 0
+- Use alternative selectors or text-based locators as fallback
+- Consider that attributes might not exist - handle gracefully"""),
+    ("ads", r"product|result|item|amazon|shop|buy|first|cart", """CRITICAL: Always filter out advertisements/sponsored content:
+- For Amazon/e-commerce: NEVER click sponsored items or ads
+- Filter out sponsored: page.locator('.s-result-item').filter(has_not=page.locator('text=Sponsored')).first
+- Or use: page.locator('[data-asin]:not([data-component-type*="sp-"])').first (excludes sponsored)
+- Check for ad indicators: text=Sponsored, Ad, Advertisement, or data-component-type contains "sp-"
+- Example for first non-sponsored product: page.locator('.s-result-item').filter(has_not=page.locator('text=Sponsored')).first.click()"""),
+    ("product_page", r"cart|bag|size|colou?r|variant|product|buy", """CRITICAL: For e-commerce product pages (universal - works on ALL shopping sites):
+- After clicking a product, wait for product page (FAST): page.wait_for_load_state('domcontentloaded')
+- Wait for product details (universal): page.wait_for_selector('h1, [class*="product"], [class*="title"], [class*="name"]')
+- SELECT PRODUCT VARIATIONS FIRST if available (universal patterns), each in try/except:
+  * Size: page.locator('[name*="size"], [name*="Size"], [data-attribute*="size"], [class*="size"]').first.click(timeout=5000)
+  * Color: page.locator('[name*="color"], [name*="Color"], [data-attribute*="color"], [class*="color"]').first.click(timeout=5000)
+  * Style/Variant: page.locator('[name*="variant"], [name*="style"], [data-attribute*="variant"]').first.click(timeout=5000)
+- Then find add-to-cart button using UNIVERSAL generic selectors, trying each in order until one works:
+  * By ID: page.locator('#add-to-cart, #addToCart, #add-to-cart-button, #addToCartButton')
+  * By name: page.locator('[name*="add"], [name*="cart"], [name*="add-to-cart"]')
+  * By text: page.locator('button:has-text("Add to Cart"), button:has-text("Add to Bag"), button:has-text("Add"), button:has-text("Buy Now")')
+  * By class: page.locator('[class*="add-to-cart"], [class*="addToCart"], [class*="add-cart"], [class*="cart-button"]')"""),
+    ("new_tab", r"\btabs?\b|window|switch_to_new_tab|product|click", """CRITICAL: Handle new tabs/windows (common on Amazon/e-commerce):
+- New tabs opened by a step are followed automatically: the NEXT step already runs in the new tab
+- Only if THIS step must keep working in the tab its click opened, switch and re-read the page:
+  page.click('.product-link')
+  browser_manager.switch_to_new_tab()
+  page = browser_manager.get_page()"""),
+    ("images", r"img|image|alt|logo|icon|cover|book", """CRITICAL: For Image-Based Links (Books, Product Covers, Icons):
+- Text selectors (`text=...`) FAIL if the text is inside an image (like book covers on Vedabase).
+- Use `alt` text: `page.locator('img[alt*="Bhagavad"]').first.click()`
+- Use `aria-label`: `page.locator('[aria-label*="Bhagavad"]').first.click()`
+- CRITICAL: Attributes are CASE-SENSITIVE! "blue" != "Blue". To match case-insensitively, use Regex:
+  `page.get_by_alt_text(re.compile(r"blue tshirt", re.IGNORECASE)).first.click()`
+- If the text looks stylized or like a logo, it's likely an image. Do not rely on `text=` selector."""),
+    ("pseudo", r":first|:last|:nth|nth-child|of-type", """CSS pseudo-selectors: Playwright does NOT support CSS pseudo-selectors like :first-of-type, :nth-child()
+- Instead use: page.locator('.class').first (for first element) or page.locator('.class').nth(0)
+- NEVER use: .class:first-of-type or .class:nth-child(1) in Playwright"""),
+    ("quotes", r"'[^']*\"|\"[^\"]*'", """Quotes in strings: Use double quotes for outer string, single quotes inside, or escape properly
+- Example: page.fill('#id', "text with 'quotes'") or page.fill('#id', 'text with \\'quotes\\'')"""),
+]
+
+
+# ---------------------------------------------------------------------------
+# Healer guidelines
+# ---------------------------------------------------------------------------
+
+HEALER_BASE = """You fix broken Playwright Python scripts. The script failed with an error.
+'page' and 'browser_manager' exist in scope; the browser is already running.
+
+General fixing rules:
+- Always wait for elements before interacting: page.wait_for_selector('selector', state='visible')
+- If selector timeout (element not found): Try alternative selectors, check attribute format, use text-based locators
+- Use more robust locators: name attribute for forms (page.locator('[name="fieldname"]')), text content for buttons (page.locator('button:has-text("Submit")'))
+- Avoid generic role selectors when multiple exist - be more specific
+- Return ONLY the fixed python code. Do not include imports or explanations. Do NOT wrap the code in ```python or ```."""
+
+# (name, trigger regex matched against error text + broken script, guideline text)
+HEALER_SECTIONS = [
+    ("strict_mode", r"strict mode violation|resolved to \d+ elements", """Strict mode violations (multiple elements found):
+- Use .first or .last to select specific element: page.locator('selector').first
+- Or use more specific selectors to narrow down: page.locator('div[role="dialog"]').get_by_text('Accept')
+- Or use nth=0 for first element: page.locator('selector').nth(0)
+- For dialogs, try: page.locator('button:has-text("Accept")').first.click() or page.locator('button:has-text("I agree")').first.click()"""),
+    ("js_evaluate", r"evaluate|javascript|cannot read propert|is not a function|undefined|null", """JavaScript evaluation errors in page.evaluate():
+- Add null safety: Use optional chaining (?.) and nullish coalescing (??)
+- Check if element exists before accessing properties: if (item.querySelector('selector')) before accessing
+- Change: item.querySelector('h2 a').href  To: item.querySelector('h2 a')?.href ?? null
+- Filter out nulls: .map(...).filter(link => link !== null)
+- Add try-catch in JavaScript if needed"""),
+    ("nav_timeout", r"goto|navigation|net::|wait_until|load_state", """page.goto() / navigation timeout errors - OPTIMIZE FOR SPEED:
+- FASTEST: page.goto(url, wait_until='commit', timeout=30000) - just waits for navigation to start
+- FAST: page.goto(url, wait_until='domcontentloaded', timeout=30000) - waits for DOM ready
+- NEVER use wait_until='load' or 'networkidle' - these wait for all resources and are 3-5x slower
+- After commit/domcontentloaded, wait for specific elements: page.wait_for_selector('main-selector', timeout=30000)
+- If timeout still occurs, check network connectivity or use timeout=60000"""),
+    ("search_box", r"placeholder|textarea|\[name=.q.\]|google|search", """Search boxes (if placeholder not found):
+- Google search: Use page.locator('textarea[name="q"]') (most reliable), or page.locator('input[name="q"]'), or page.locator('[name="q"]')
+- DO NOT use get_by_placeholder if it's timing out - use name attribute instead
+- Always wait for it: page.wait_for_selector('textarea[name="q"]', state='visible')"""),
+    ("dialogs", r"dialog|modal|accept|consent|cookie|intercepts pointer events", """Dialogs/modals:
+- Wait for page load first: page.wait_for_load_state('domcontentloaded')
+- Then dismiss dialogs using specific text: page.locator('button:has-text("Accept all")').first.click(timeout=5000) with try/except
+- Or skip dialog handling if not critical - just wait for main content"""),
+    ("wait_after_submit", r"press|enter|submit|wait_for_load_state|waiting for", """After pressing Enter or submitting forms, wait for navigation (FAST):
+- page.wait_for_load_state('domcontentloaded') - waits for DOM ready (much faster)
+- Or wait for specific element: page.wait_for_selector('expected-element', timeout=30000)
+- Avoid 'networkidle' - it's too slow and often unnecessary"""),
+    ("new_tab", r"timeout.*(locator|selector|waiting)|waiting for (locator|selector)|click", """Element timeout after clicking a link/button: The action might have opened a NEW TAB
+- ADD after the click: browser_manager.switch_to_new_tab() then page = browser_manager.get_page()
+- This waits for the new tab and switches to it, where the element actually exists"""),
+    ("attribute", r"\[[\w-]+[*^$]?=|data-|rating", """Attribute selector timeouts (like data-review-rating):
+- Try numeric without quotes: [data-review-rating=4] instead of [data-review-rating="4"]; or partial matching: [data-review-rating*="4"]
+- Try finding parent container first, then filtering children: page.locator('[data-asin]').filter(has=page.locator('.a-icon-alt:has-text("4")'))
+- Use text-based search as fallback: page.locator('span:has-text("4")').first
+- Consider that the attribute might not be present - use optional selectors or try/except
+- Use page.locator('[data-asin]').first.click() to click first product if rating selector fails"""),
+    ("ads", r"product|result|item|asin|sponsor|amazon", """CRITICAL: For clicking product items - avoid advertisements/sponsored content:
+- NEVER click on elements with "Sponsored", "Ad", "Advertisement" text
+- Use: page.locator('.s-result-item').filter(has_not=page.locator('text=Sponsored')).first
+- Or: page.locator('[data-asin]:not([data-component-type*="sp-"])').first
+- Other patterns: .filter(has_not=page.locator('[class*="sponsored"]')), .filter(has_not=page.locator('[data-type*="sponsor"]'))
+- After clicking product, wait for navigation: page.wait_for_load_state('domcontentloaded')"""),
+    ("product_page", r"cart|bag|size|colou?r|variant|product|buy", """CRITICAL: For e-commerce product pages (add-to-cart button not found):
+- FIRST: Wait for product page to load (FAST): page.wait_for_load_state('domcontentloaded') after clicking product
+- Wait for product title/details: page.wait_for_selector('h1, [id*="productTitle"], [class*="product-title"]', timeout=30000)
+- SELECT PRODUCT VARIATIONS FIRST (Size, Color, Style) if options are available, each in try/except:
+  * Size select: page.locator('select[name*="size"]').first.select_option(index=1, timeout=3000)
+  * Size button: page.locator('[data-action*="size"], [class*="size"] button, [aria-label*="Size"]').first.click(timeout=3000)
+  * Color button: page.locator('[data-action*="color"], [aria-label*="Color"]').first.click(timeout=3000)
+  * Wait after variations: page.wait_for_timeout(1000) or page.wait_for_load_state('domcontentloaded')
+- Then find add-to-cart button, trying each selector in order with try/except:
+  * page.locator('#add-to-cart-button, #addToCart, [name*="add-to-cart"]').first.wait_for(timeout=30000)
+  * page.locator('[name*="submit"], [id*="addToCart"]').first.wait_for(timeout=30000)
+  * page.locator('button:has-text("Add to Cart"), button:has-text("Add to Bag"), input[value*="Add"]').first.wait_for(timeout=30000)
+  * page.locator('[class*="add-to-cart"], [class*="addToCart"]').first.wait_for(timeout=30000)"""),
+    ("image_text", r"text=|img|alt|image|xpath|get_by_text", """If "Text not found" but you see it in screenshot: IT IS LIKELY AN IMAGE/LOGO
+- Do NOT use `text=...` selector. Use `img[alt*="Text"]` or `[aria-label*="Text"]`.
+- Example: page.locator('img[alt*="Bhagavad"]').first.click()
+- XPath image selectors (//img[contains(@alt, "text")]): convert to CSS: page.locator('img[alt*="text"]')
+- Or use Playwright's get_by_alt_text: page.get_by_alt_text("text", exact=False).first
+- On e-commerce, DON'T click images directly - click the product link/container:
+  page.locator('.s-result-item').filter(has=page.locator('img[alt*="blue"]')).first.click()"""),
+    ("pseudo", r":first|:last|:nth|nth-child|of-type|unexpected token|not a valid selector", """CSS pseudo-selector errors (like :first-of-type, :nth-child):
+- Playwright does NOT support CSS pseudo-selectors in selectors
+- Instead of: '.class:first-of-type' use: page.locator('.class').first
+- Instead of: '.class:nth-child(1)' use: page.locator('.class').nth(0)"""),
+    ("quotes", r"unterminated string|syntaxerror|invalid syntax|eol while scanning", """"unterminated string literal" / syntax errors:
+- Fix quote escaping in string literals
+- Use double quotes for outer string if inner has single quotes: "text with 'quotes'"
+- Or escape properly: 'text with \\'quotes\\''"""),
+]
+
+
+def _select_sections(sections, subject, base_tokens, budget):
+    """Pick the sections whose trigger matches `subject`, in priority order, within the token budget."""
+    chosen = []
+    used = base_tokens
+    for name, trigger, text in sections:
+        if not re.search(trigger, subject, re.IGNORECASE):
+            continue
+        tokens = count_tokens(text)
+        if used + tokens > budget:
+            continue
+        chosen.append((name, text))
+        used += tokens
+    return chosen, used
+
+
+def _full_tokens(base, sections):
+    return count_tokens(base) + sum(count_tokens(text) for _, _, text in sections)
+
+
+def _system_message(base, chosen):
+    """
+    System message whose first block (the static base) is marked cacheable.
+    The selected sections follow in a second block so the cached prefix stays stable.
+    """
+    from langchain_core.messages import SystemMessage
+
+    content = [{"type": "text", "text": base, "cache_control": {"type": "ephemeral"}}]
+    if chosen:
+        content.append({"type": "text", "text": "\n\n".join(text for _, text in chosen)})
+    return SystemMessage(content=content)
+
+
+def _record(used, full):
+    saved = max(full - used, 0)
+    prompt_stats["calls"] += 1
+    prompt_stats["tokens_sent"] += used
+    prompt_stats["tokens_saved"] += saved
+    return saved
+
+
+def build_coder_prompt(step: str, budget: int = None):
+    """
+    Build the codegen messages for one plan step.
+    Returns (messages, info) where info has the sections used and tokens sent/saved.
+    """
+    from langchain_core.messages import HumanMessage
+
+    budget = budget or PROMPT_TOKEN_BUDGET
+    chosen, used = _select_sections(CODER_SECTIONS, step, count_tokens(CODER_BASE), budget)
+    human = f"Write Python Playwright code for this step:\n{step}"
+    used += count_tokens(human)
+    full = _full_tokens(CODER_BASE, CODER_SECTIONS) + count_tokens(human)
+    saved = _record(used, full)
+
+    messages = [_system_message(CODER_BASE, chosen), HumanMessage(content=human)]
+    return messages, {"sections": [name for name, _ in chosen], "tokens": used, "saved": saved}
+
+
+def build_healer_prompt(error: str, script: str, image_url: str = None, budget: int = None, examples=None):
+    """
+    Build the repair messages for a failed script. Sections are selected by the
+    error class (matched against the error text and the broken script).
+    `examples` are remembered fixes (fix memory entries) shown as few-shot examples.
+    Returns (messages, info) like build_coder_prompt; info["opening"] is the human
+    text, which later attempts of a healing session resend unchanged.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    subject = f"{error}\n{script}"
+    chosen, used = _select_sections(HEALER_SECTIONS, subject, count_tokens(HEALER_BASE), budget)
+    human_text = f"Error: {error}\n\nBroken Script:\n{script}"
+    if examples:
+        shots = "\n\n".join(
+            f"Broken:\n{e['failed_script']}\nFixed:\n{e['fixed_script']}" for e in examples
+        )
+        human_text += f"\n\nFixes that worked for the same error before:\n{shots}"
+    used += count_tokens(human_text)
+    full = _full_tokens(HEALER_BASE, HEALER_SECTIONS) + count_tokens(human_text)
+    saved = _record(used, full)
+
+    messages = [_system_message(HEALER_BASE, chosen), _opening_message(human_text, image_url)]
+    return messages, {"sections": [name for name, _ in chosen], "tokens": used, "saved": saved, "opening": human_text}
+
+
+def _opening_message(text, image_url=None):
+    """First message of a healing session - marked cacheable, later attempts start with it too."""
+    from langchain_core.messages import HumanMessage
+
+    content = [{"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}]
+    if image_url:
+        content.append({"type": "image_url", "image_url": {"url": image_url}})
+    return HumanMessage(content=content)
+
+
+def build_healer_session_prompt(session, image_url: str = None, opening_image_url: str = None):
+    """
+    Messages for a later attempt of a healing session (see agents/healer.py): the
+    first attempt's system prompt and message unchanged, so the provider's prompt
+    cache covers them, then each earlier fix with the feedback on it. Only the last
+    feedback (and `image_url`, e.g. the region of the page that changed) is new.
+    Returns (messages, info) like build_healer_prompt, plus the new/cached split.
+    """
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    chosen = [(name, text) for name, _, text in HEALER_SECTIONS if name in session["sections"]]
+    messages = [_system_message(HEALER_BASE, chosen), _opening_message(session["opening"], opening_image_url)]
+    turns = list(zip(session["fixes"], session["feedback"]))
+    for number, (fix, feedback) in enumerate(turns, 1):
+        if number == len(turns):
+            # Cache breakpoint after the last fix: the next attempt only adds its feedback
+            messages.append(AIMessage(content=[{"type": "text", "text": fix, "cache_control": {"type": "ephemeral"}}]))
+            content = [{"type": "text", "text": feedback}]
+            if image_url:
+                content.append({"type": "image_url", "image_url": {"url": image_url}})
+            messages.append(HumanMessage(content=content))
+        else:
+            messages.append(AIMessage(content=fix))
+            messages.append(HumanMessage(content=feedback))
+
+    history = sum(count_tokens(fix) + count_tokens(feedback) for fix, feedback in turns)
+    opening = count_tokens(session["opening"])
+    used = count_tokens(HEALER_BASE) + sum(count_tokens(text) for _, text in chosen) + opening + history
+    full = _full_tokens(HEALER_BASE, HEALER_SECTIONS) + opening + history
+    saved = _record(used, full)
+    new_tokens = count_tokens(session["feedback"][-1])
+    return messages, {"sections": session["sections"], "tokens": used, "saved": saved,
+                      "new_tokens": new_tokens, "cached_tokens": used - new_tokens}
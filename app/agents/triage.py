@@ -0,0 +1,97 @@
+import os
+import random
+import re
+
+from app.cancellation import sleep
+from app.state import AgentState
+
+# Failure classes
+TRANSIENT = "transient"   # Retry the same script after a backoff - no LLM
+HEALABLE = "healable"     # Script problem - send to the healer
+FATAL = "fatal"           # Cannot be fixed by retrying or rewriting - stop the run
+
+MAX_TRANSIENT_RETRIES = int(os.getenv("MAX_TRANSIENT_RETRIES", "2"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 10.0
+
+_FATAL_PATTERNS = [
+    r"net::ERR_NAME_NOT_RESOLVED",
+    r"net::ERR_CERT_",
+    r"net::ERR_SSL_",
+    r"net::ERR_BLOCKED_BY_",
+    r"net::ERR_ADDRESS_UNREACHABLE",
+    r"Target page, context or browser has been closed",
+    r"Browser has been closed",
+    r"browser has disconnected",
+    r"Executable doesn't exist",
+    r"OPENROUTER_API_KEY not found",
+    r"Incorrect API key|invalid api key|No auth credentials|Error code: 401",
+    r"Error code: 402|Insufficient credits",
+    r"Error code: 403",
+    r"CAPTCHA detected",
+]
+
+_TRANSIENT_PATTERNS = [
+    r"net::ERR_CONNECTION_(RESET|CLOSED|REFUSED|TIMED_OUT|ABORTED)",
+    r"net::ERR_TIMED_OUT",
+    r"net::ERR_NETWORK_CHANGED",
+    r"net::ERR_INTERNET_DISCONNECTED",
+    r"net::ERR_EMPTY_RESPONSE",
+    r"Error code: (429|500|502|503|504)",
+    r"Rate limit|rate_limit|Too Many Requests",
+    r"Connection error|APIConnectionError|Request timed out",
+]
+
+_HTTP_STATUS = re.compile(r"^HTTP (\d{3}) navigating to")
+
+
+def classify_failure(error: str, signals: dict = None) -> str:
+    """
+    Sort a failure into TRANSIENT, HEALABLE or FATAL.
+    `signals` carries page-level evidence gathered by the executor
+    (e.g. {"blocker": "captcha"}).
+    """
+    signals = signals or {}
+    if not error:
+        return HEALABLE
+
+    if signals.get("blocker") == "captcha":
+        return FATAL
+
+    status_match = _HTTP_STATUS.match(error)
+    if status_match:
+        status = int(status_match.group(1))
+        # Gateway errors and throttling usually clear up; other 4xx/5xx will not
+        if status in (408, 429, 502, 503, 504):
+            return TRANSIENT
+        return FATAL
+
+    for pattern in _FATAL_PATTERNS:
+        if re.search(pattern, error, re.IGNORECASE):
+            return FATAL
+    for pattern in _TRANSIENT_PATTERNS:
+        if re.search(pattern, error, re.IGNORECASE):
+            return TRANSIENT
+    return HEALABLE
+
+
+def backoff_seconds(attempt: int) -> float:
+    """Exponential backoff with full jitter for transient retries."""
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+def retry_node(state: AgentState):
+    """
+    Cheap retry for transient failures: wait, then let the executor run the same script again.
+    No LLM call and no screenshot analysis.
+    """
+    attempt = state.get("transient_retries", 0)
+    delay = backoff_seconds(attempt)
+    # Interrupted (RunCancelled) if the run is cancelled while backing off
+    sleep(delay)
+    return {
+        "error": None,
+        "error_class": None,
+        "transient_retries": attempt + 1,
+        "logs": [f"🔁 Transient failure - retrying in {delay:.1f}s (attempt {attempt + 1}/{MAX_TRANSIENT_RETRIES})"]
+    }
@@ -0,0 +1,104 @@
+"""
+Verify: run "[assert] ..." plan steps locally instead of generating code for them.
+
+Consecutive assertion steps are parsed (app/tools/assertions.py) and checked
+together in one in-page call that waits up to VERIFY_TIMEOUT_MS for them to
+pass. Selectors in Playwright-only syntax fall back to one locator call each,
+"unchanged" regions are compared with a baseline screenshot. The outcome of
+every assertion goes into state["assertion_results"]; a failed assertion ends
+the run with the diagnostics as its error - there is nothing to heal.
+"""
+import hashlib
+import os
+
+from app.state import AgentState
+from app.tools.assertions import split_assertion, parse_assertion, check_with_locator, compare_screenshot
+from app.tools.browser import browser_instance
+from app.agents.monitor import BASELINE_DIR
+from app.agents.triage import FATAL
+
+VERIFY_TIMEOUT_MS = int(os.getenv("VERIFY_TIMEOUT_MS", "10000"))
+# Mean pixel difference (%) above which an "unchanged" region counts as changed
+REGION_DIFF_THRESHOLD = float(os.getenv("VERIFY_REGION_DIFF_THRESHOLD", "1.0"))
+
+
+def assertion_group(plan, start):
+    """[(step index, assertion text)] of the consecutive assertion steps from `start`."""
+    group = []
+    for index in range(start, len(plan)):
+        text = split_assertion(plan[index])
+        if text is None:
+            break
+        group.append((index, text))
+    return group
+
+
+def starts_assertion_group(state: AgentState):
+    plan = state.get("plan") or []
+    return bool(assertion_group(plan, state.get("current_step_index", 0)))
+
+
+def region_baseline_path(task, index):
+    task_hash = hashlib.md5(task.encode()).hexdigest()
+    return os.path.join(BASELINE_DIR, f"{task_hash}_step_{index}_region.png")
+
+
+def _check_region(page, task, index, assertion):
+    """Compare the element's screenshot with the baseline saved by the first run."""
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    baseline_path = region_baseline_path(task, index)
+    screenshot_bytes = page.locator(assertion["selector"]).first.screenshot(type='png')
+    if not os.path.exists(baseline_path):
+        with open(baseline_path, "wb") as f:
+            f.write(screenshot_bytes)
+        return {"passed": True, "actual": "baseline saved"}
+    return compare_screenshot(screenshot_bytes, baseline_path, REGION_DIFF_THRESHOLD)
+
+
+def verify_node(state: AgentState):
+    plan = state["plan"]
+    start = state["current_step_index"]
+    group = assertion_group(plan, start)
+    previous = state.get("assertion_results") or []
+
+    try:
+        assertions = [parse_assertion(text) for _, text in group]
+    except ValueError as e:
+        error = f"Invalid assertion: {str(e)}"
+        return {"error": error, "error_class": FATAL, "logs": [f"❌ {error}"]}
+
+    try:
+        browser_instance.start()
+        page = browser_instance.get_page()
+        results = browser_instance.check_assertions(assertions, VERIFY_TIMEOUT_MS)
+        for (index, _), assertion, result in zip(group, assertions, results):
+            if result.get("unsupported"):
+                result.update(check_with_locator(page, assertion))
+                result.pop("unsupported")
+            if assertion["kind"] == "unchanged" and result["passed"]:
+                result.update(_check_region(page, state["task"], index, assertion))
+    except Exception as e:
+        error = f"Verification could not run: {str(e)}"
+        return {"error": error, "error_class": FATAL, "logs": [f"❌ {error}"]}
+
+    outcomes = [
+        {"step": index + 1, "assertion": assertion["source"], "passed": bool(result["passed"]), "actual": result.get("actual")}
+        for (index, _), assertion, result in zip(group, assertions, results)
+    ]
+    logs = [f"🔎 Verified {len(outcomes)} assertion(s) locally"]
+    for outcome in outcomes:
+        mark = "✅" if outcome["passed"] else "❌"
+        logs.append(f"{mark} {outcome['assertion']} (got: {outcome['actual']})")
+
+    failed = [o for o in outcomes if not o["passed"]]
+    if failed:
+        error = "Assertion failed: " + "; ".join(f"step {o['step']} '{o['assertion']}' got {o['actual']}" for o in failed)
+        return {"error": error, "error_class": FATAL, "assertion_results": previous + outcomes, "logs": logs}
+    return {
+        "current_step_index": start + len(group),
+        "error": None,
+        "error_class": None,
+        "retry_count": 0,
+        "assertion_results": previous + outcomes,
+        "logs": logs
+    }
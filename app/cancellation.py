@@ -0,0 +1,184 @@
+"""
+Cooperative cancellation and run deadlines.
+
+A run's cancel token lives in a registry keyed by run_id (the state only
+carries run_id and an optional `deadline`, a Unix timestamp). While a node
+runs, its token is also the context's current token, so blocking waits deep
+in the stack (BrowserManager._run_async, LLM calls, retry backoff) give up as
+soon as the run is cancelled or its deadline passes, raising RunCancelled.
+
+RunCancelled derives from BaseException (like asyncio.CancelledError) so the
+nodes' `except Exception` error handling does not turn it into a healable error.
+"""
+import concurrent.futures
+import contextvars
+import functools
+import os
+import threading
+import time
+
+# Default run deadline in seconds for the run service (0 = none)
+RUN_DEADLINE_SECONDS = float(os.getenv("RUN_DEADLINE_SECONDS", "0"))
+# How often blocking waits re-check their token
+POLL_INTERVAL = 0.25
+
+
+class RunCancelled(BaseException):
+    pass
+
+
+class CancelToken:
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="Run cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.time() >= self.deadline:
+            self.cancel("Run deadline exceeded")
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds until the deadline, or None if there is none."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def check(self):
+        if self.cancelled:
+            raise RunCancelled(self.reason)
+
+    def sleep(self, seconds):
+        """time.sleep() that wakes up (and raises) on cancellation."""
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            self._event.wait(remaining)
+        else:
+            self._event.wait(seconds)
+        self.check()
+
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+_current_token = contextvars.ContextVar("current_cancel_token", default=None)
+
+
+def register(run_id, deadline=None):
+    """Create (or return) the token for a run."""
+    with _tokens_lock:
+        token = _tokens.get(run_id)
+        if token is None:
+            token = _tokens[run_id] = CancelToken(deadline)
+        elif deadline is not None:
+            token.deadline = deadline
+        return token
+
+
+def cancel(run_id, reason="Run cancelled"):
+    with _tokens_lock:
+        token = _tokens.get(run_id)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
+
+
+def release(run_id):
+    with _tokens_lock:
+        _tokens.pop(run_id, None)
+
+
+def current_token():
+    """The token of the run executing in this context, or None."""
+    return _current_token.get()
+
+
+def wait_future(future, timeout=None, poll=POLL_INTERVAL):
+    """
+    future.result(timeout) that stops waiting when the current run is cancelled:
+    the future is cancelled (which cancels the coroutine/awaits behind it)
+    and RunCancelled is raised.
+    """
+    token = current_token()
+    if token is None:
+        return future.result(timeout=timeout)
+    give_up = None if timeout is None else time.monotonic() + timeout
+    while True:
+        if token.cancelled:
+            future.cancel()
+            raise RunCancelled(token.reason)
+        wait = poll
+        remaining = token.remaining()
+        if remaining is not None:
+            wait = min(wait, remaining + 0.01)
+        if give_up is not None:
+            wait = min(wait, max(0.0, give_up - time.monotonic()))
+        try:
+            return future.result(timeout=wait)
+        except concurrent.futures.TimeoutError:
+            if give_up is not None and time.monotonic() >= give_up:
+                raise
+
+
+_call_pool = None
+_call_pool_lock = threading.Lock()
+
+
+def call_cancellable(fn, *args, **kwargs):
+    """
+    Run a blocking call (e.g. an LLM request) so that the current run can stop
+    waiting for it. The call itself keeps going in the background and its result
+    is discarded; the HTTP client's own timeout bounds it.
+    """
+    if current_token() is None:
+        return fn(*args, **kwargs)
+    global _call_pool
+    with _call_pool_lock:
+        if _call_pool is None:
+            _call_pool = concurrent.futures.ThreadPoolExecutor(max_workers=16, thread_name_prefix="cancellable-call")
+    context = contextvars.copy_context()
+    return wait_future(_call_pool.submit(context.run, fn, *args, **kwargs))
+
+
+def sleep(seconds):
+    """time.sleep() that is interrupted when the current run is cancelled."""
+    token = current_token()
+    if token is None:
+        time.sleep(seconds)
+    else:
+        token.sleep(seconds)
+
+
+def cancellable(node):
+    """
+    Wrap a graph node: skip it if the run is already cancelled or past its
+    deadline, make the run's token current while it runs, and turn RunCancelled
+    into a fatal error so the graph ends.
+    """
+    @functools.wraps(node)
+    def wrapper(state):
+        run_id = state.get("run_id")
+        if not run_id:
+            return node(state)
+        token = register(run_id, state.get("deadline"))
+        reset = _current_token.set(token)
+        try:
+            token.check()
+            return node(state)
+        except RunCancelled as e:
+            from app.agents.triage import FATAL
+            return {
+                "error": str(e) or "Run cancelled",
+                "error_class": FATAL,
+                "current_script": None,
+                "logs": [f"⏹️ {str(e) or 'Run cancelled'} - stopping."]
+            }
+        finally:
+            _current_token.reset(reset)
+    return wrapper
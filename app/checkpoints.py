@@ -0,0 +1,329 @@
+"""
+Durable run checkpoints, so an interrupted run (process, browser or UI session
+died) can continue from its last completed step instead of planning again.
+
+After every graph node the merged AgentState is written to
+.agent_data/checkpoints.db together with the browser's URL and storage state
+(cookies, localStorage). Fields larger than CHECKPOINT_INLINE_BYTES (plan,
+scripts, screenshots, storage state) are stored once by content hash and
+referenced, so a checkpoint is usually a few hundred bytes. The newest
+CHECKPOINT_MAX_RUNS runs are kept.
+
+    python -m app.checkpoints list
+    python -m app.checkpoints show <run_id>
+    python -m app.checkpoints resume <run_id> [--headless]
+"""
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+from app.config import DATA_DIR
+
+CHECKPOINT_PATH = os.path.join(DATA_DIR, "checkpoints.db")
+CHECKPOINTS_ENABLED = os.getenv("CHECKPOINTS", "1").lower() in ("1", "true", "yes")
+MAX_RUNS = int(os.getenv("CHECKPOINT_MAX_RUNS", "50"))
+INLINE_BYTES = int(os.getenv("CHECKPOINT_INLINE_BYTES", "1024"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    resumed_from TEXT,
+    checkpoints INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS checkpoints (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    node TEXT NOT NULL,
+    state TEXT NOT NULL,
+    browser TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blob_refs (
+    run_id TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (run_id, hash)
+);
+"""
+
+
+class CheckpointStore:
+    def __init__(self, path=CHECKPOINT_PATH, max_runs=MAX_RUNS, inline_bytes=INLINE_BYTES):
+        self.path = path
+        self.max_runs = max_runs
+        self.inline_bytes = inline_bytes
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._ready = True
+        return conn
+
+    def _pack(self, values, blobs):
+        """JSON of `values` with large fields replaced by {"$blob": hash} (blobs collected in `blobs`)."""
+        packed = {}
+        for key, value in values.items():
+            encoded = json.dumps(value, ensure_ascii=False)
+            if len(encoded) > self.inline_bytes:
+                digest = hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+                blobs.setdefault(digest, encoded)
+                packed[key] = {"$blob": digest}
+            else:
+                packed[key] = value
+        return json.dumps(packed, ensure_ascii=False)
+
+    def _unpack(self, conn, text):
+        if text is None:
+            return None
+        values = json.loads(text)
+        for key, value in values.items():
+            if isinstance(value, dict) and set(value) == {"$blob"}:
+                row = conn.execute("SELECT data FROM blobs WHERE hash = ?", (value["$blob"],)).fetchone()
+                values[key] = json.loads(zlib.decompress(row[0]).decode("utf-8")) if row else None
+        return values
+
+    def save(self, run_id, node, state, browser=None, resumed_from=None):
+        """Write a checkpoint of the state after `node` (and the browser snapshot, if any)."""
+        blobs = {}
+        state_text = self._pack(state, blobs)
+        browser_text = self._pack(browser, blobs) if browser else None
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute(
+                        "INSERT INTO runs (run_id, task, resumed_from, updated) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(run_id) DO UPDATE SET updated = excluded.updated",
+                        (run_id, state.get("task", ""), resumed_from, now),
+                    )
+                    seq = conn.execute("SELECT checkpoints FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+                    for digest, encoded in blobs.items():
+                        # Blobs are content addressed: the same plan/storage state is stored once
+                        if conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (digest,)).fetchone() is None:
+                            conn.execute("INSERT INTO blobs (hash, data) VALUES (?, ?)", (digest, zlib.compress(encoded.encode("utf-8"))))
+                        conn.execute("INSERT OR IGNORE INTO blob_refs (run_id, hash) VALUES (?, ?)", (run_id, digest))
+                    conn.execute(
+                        "INSERT INTO checkpoints (run_id, seq, node, state, browser, created) VALUES (?, ?, ?, ?, ?, ?)",
+                        (run_id, seq, node, state_text, browser_text, now),
+                    )
+                    conn.execute("UPDATE runs SET checkpoints = checkpoints + 1 WHERE run_id = ?", (run_id,))
+                    self._prune(conn)
+            finally:
+                conn.close()
+
+    def _prune(self, conn):
+        stale = [row[0] for row in conn.execute(
+            "SELECT run_id FROM runs ORDER BY updated DESC LIMIT -1 OFFSET ?", (self.max_runs,)
+        )]
+        if not stale:
+            return
+        marks = ",".join("?" * len(stale))
+        for table in ("checkpoints", "blob_refs", "runs"):
+            conn.execute(f"DELETE FROM {table} WHERE run_id IN ({marks})", stale)
+        conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM blob_refs)")
+
+    def mark_finished(self, run_id, status):
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("UPDATE runs SET status = ? WHERE run_id = ?", (status, run_id))
+            finally:
+                conn.close()
+
+    def latest(self, run_id):
+        """The newest checkpoint of a run: {"seq", "node", "created", "state", "browser"}, or None."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT seq, node, state, browser, created FROM checkpoints WHERE run_id = ? ORDER BY seq DESC LIMIT 1",
+                    (run_id,),
+                ).fetchone()
+                if row is None:
+                    return None
+                return {
+                    "seq": row[0],
+                    "node": row[1],
+                    "state": self._unpack(conn, row[2]),
+                    "browser": self._unpack(conn, row[3]),
+                    "created": row[4],
+                }
+            finally:
+                conn.close()
+
+    def list_runs(self, limit=20):
+        with self._lock:
+            conn = self._connect()
+            try:
+                rows = conn.execute(
+                    "SELECT run_id, task, status, resumed_from, checkpoints, updated FROM runs ORDER BY updated DESC LIMIT ?",
+                    (limit,),
+                ).fetchall()
+            finally:
+                conn.close()
+        keys = ("run_id", "task", "status", "resumed_from", "checkpoints", "updated")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+# Global instance
+checkpoint_store = CheckpointStore()
+
+
+def _browser_snapshot():
+    """URL and storage state of the run's browser, or None if it isn't started."""
+    from app.tools.browser import browser_instance
+
+    if not browser_instance.page or not browser_instance.async_context:
+        return None
+    return {
+        "url": browser_instance.page.url,
+        "storage_state": browser_instance.run_async(browser_instance.async_context.storage_state()),
+    }
+
+
+def checkpointed(name, node):
+    """Wrap a graph node: after it returns, checkpoint the merged state (see module docstring)."""
+    @functools.wraps(node)
+    def wrapper(state):
+        update = node(state)
+        if not CHECKPOINTS_ENABLED:
+            return update
+        merged = {**state, **(update or {})}
+        run_id = merged.get("run_id")
+        if not run_id:
+            return update
+        try:
+            checkpoint_store.save(run_id, name, merged, _browser_snapshot(), merged.get("resumed_from"))
+        except Exception as e:
+            # A lost checkpoint only costs resumability - never fail the step for it
+            update = {**(update or {}), "logs": list((update or {}).get("logs") or []) + [f"⚠️ Checkpoint not saved: {str(e)}"]}
+        return update
+    return wrapper
+
+
+def resume_state(run_id):
+    """
+    (state, browser_snapshot) to continue a run from its last checkpoint: the next
+    step that has not completed is re-run with a clean error/retry state.
+    Raises ValueError if the run has no checkpoint or nothing left to do.
+    """
+    checkpoint = checkpoint_store.latest(run_id)
+    if checkpoint is None:
+        raise ValueError(f"No checkpoint for run {run_id}")
+    state = checkpoint["state"]
+    plan = state.get("plan") or []
+    if plan and state.get("current_step_index", 0) >= len(plan) and not state.get("error"):
+        raise ValueError(f"Run {run_id} already completed all {len(plan)} steps")
+    if state.get("error"):
+        # Regenerate the failed step's code instead of re-running the broken script
+        state["current_script"] = None
+    state.update({
+        "error": None,
+        "error_class": None,
+        "pending_fix": None,
+        "screenshot": None,
+        "retry_count": 0,
+        "transient_retries": 0,
+        "deadline": None,
+        "logs": [],
+        "resumed_from": run_id,
+    })
+    return state, checkpoint["browser"]
+
+
+def restore_browser(browser, snapshot):
+    """Bring a started browser back to a checkpoint's URL, cookies and localStorage."""
+    if snapshot and snapshot.get("storage_state"):
+        browser.recycle_context(storage_state=snapshot["storage_state"], url=snapshot.get("url"))
+    elif snapshot and (snapshot.get("url") or "").startswith("http"):
+        browser.page.goto(snapshot["url"], wait_until="domcontentloaded")
+
+
+def _main():
+    import argparse
+    import uuid
+
+    parser = argparse.ArgumentParser(prog="python -m app.checkpoints", description="Inspect and resume run checkpoints")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List checkpointed runs")
+    show = sub.add_parser("show", help="Show the last checkpoint of a run")
+    show.add_argument("run_id")
+    resume = sub.add_parser("resume", help="Continue a run from its last checkpoint")
+    resume.add_argument("run_id")
+    resume.add_argument("--headless", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for run in checkpoint_store.list_runs():
+            checkpoint = checkpoint_store.latest(run["run_id"])
+            state = checkpoint["state"] if checkpoint else {}
+            progress = f"{state.get('current_step_index', 0)}/{len(state.get('plan') or [])}"
+            print(f"{run['run_id']:<14} {run['status']:<10} step {progress:<7} {run['task'][:60]}")
+        return
+
+    if args.command == "show":
+        checkpoint = checkpoint_store.latest(args.run_id)
+        if checkpoint is None:
+            raise SystemExit(f"No checkpoint for run {args.run_id}")
+        state = checkpoint["state"]
+        print(f"After node '{checkpoint['node']}' (checkpoint {checkpoint['seq']})")
+        for index, step in enumerate(state.get("plan") or []):
+            print(f"  {'✓' if index < state.get('current_step_index', 0) else ' '} {index + 1}. {step}")
+        if state.get("error"):
+            print(f"Error: {state['error']}")
+        if checkpoint["browser"]:
+            print(f"Browser at {checkpoint['browser']['url']}")
+        return
+
+    try:
+        state, snapshot = resume_state(args.run_id)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    from app.graph import app as agent_app
+    from app.tools.browser import browser_instance
+    from app.tools.tracing import finish_run
+
+    state["run_id"] = uuid.uuid4().hex[:12]
+    print(f"Resuming {args.run_id} as {state['run_id']} at step {state['current_step_index'] + 1}/{len(state.get('plan') or [])}")
+    browser_instance.start(headless=True if args.headless else None)
+    restore_browser(browser_instance, snapshot)
+    status = "failed"
+    try:
+        for event in agent_app.stream(state):
+            for node, data in event.items():
+                state.update(data or {})
+                for log in (data or {}).get("logs") or []:
+                    print(f"[{node}] {log}")
+        if not state.get("error"):
+            status = "success"
+    finally:
+        checkpoint_store.mark_finished(state["run_id"], status)
+        # Every way out of the run (failure, Ctrl+C, an exception) closes its trace
+        finish_run(state["run_id"], status)
+        browser_instance.tracer = None
+        browser_instance.close()
+    print(f"Run {state['run_id']}: {status}")
+
+
+if __name__ == "__main__":
+    _main()
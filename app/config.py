@@ -1,20 +1,48 @@
 import os
-from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_llm():
-    """Returns a ChatOpenAI instance configured for OpenRouter."""
+# Local storage for everything the agent learns between runs (fix memory, stats, ...)
+DATA_DIR = os.getenv("AGENT_DATA_DIR", ".agent_data")
+
+# Upper bound for a single LLM request (a stuck request must not hold a run forever)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+
+# We use Claude 3.5 Sonnet as it is currently SOTA for coding/agents
+LLM_MODEL = "anthropic/claude-3.5-sonnet"
+# Cheap model tried first for planning/codegen (see app/llm/cascade.py)
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "anthropic/claude-3.5-haiku")
+LLM_CASCADE = os.getenv("LLM_CASCADE", "1").lower() in ("1", "true", "yes")
+
+class MissingAPIKeyError(ValueError):
+    """No OPENROUTER_API_KEY configured - no LLM call can succeed."""
+
+
+def get_llm(purpose=None, tier="strong"):
+    """
+    Returns the LLM client for OpenRouter: a ChatOpenAI model wrapped by app/llm
+    (response cache, rate limiter). `purpose` ("plan", "code", "repair", "discovery")
+    selects what is cached; `tier` ("fast" or "strong") selects the model.
+    """
     api_key = os.getenv("OPENROUTER_API_KEY")
     if not api_key:
-        raise ValueError("OPENROUTER_API_KEY not found in .env")
+        raise MissingAPIKeyError("OPENROUTER_API_KEY not found in .env")
+
+    # Imported lazily: langchain_openai is the slowest import in the app
+    from langchain_openai import ChatOpenAI
+
+    from app.llm import LLMClient
 
-    return ChatOpenAI(
+    model = LLM_FAST_MODEL if tier == "fast" else LLM_MODEL
+    chat_model = ChatOpenAI(
         base_url="https://openrouter.ai/api/v1",
         api_key=api_key,
-        # We use Claude 3.5 Sonnet as it is currently SOTA for coding/agents
-        model="anthropic/claude-3.5-sonnet",
+        model=model,
         temperature=0,
-        max_tokens=2048 # Limit output to prevent 402 errors
-    )
\ No newline at end of file
+        max_tokens=2048, # Limit output to prevent 402 errors
+        timeout=LLM_TIMEOUT_SECONDS,
+        # 429/402 retries are done by the shared limiter (app/llm/limiter.py), not the client
+        max_retries=0
+    )
+    return LLMClient(chat_model, model, purpose)
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Export a completed run as a standalone Playwright module that replays it
+without the agent - no LLM, LangChain or graph - for scheduled regression runs.
+
+Each plan step becomes a function with the final script that completed it
+(generated, cached or healed, recorded in state["step_scripts"]), together
+with the timeout it ran with and the monitor's baseline screenshot for the
+page it leaves behind. "[assert]" steps are kept as assertion checks. The
+run is read from its last checkpoint (app/checkpoints.py). Baselines are
+copied next to the module (<module>_baselines/), so it replays from any
+working directory or machine.
+
+    python -m app.exporter <run_id> [--out exports] [--pytest]
+
+The module runs with the lightweight runner (python -m app.runner, many
+modules in parallel) or, as test_*.py with --pytest, under pytest-playwright.
+"""
+import argparse
+import ast
+import os
+import re
+import shutil
+import textwrap
+import time
+
+from app.agents.monitor import baseline_path
+from app.agents.planner import split_branch
+from app.agents.verify import region_baseline_path
+from app.checkpoints import checkpoint_store
+from app.tools.assertions import split_assertion, parse_assertion
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+
+
+class _Unawait(ast.NodeTransformer):
+    """Rewrite an 'await' script for the sync Playwright API the runner uses."""
+    def visit_Await(self, node):
+        return self.visit(node.value)
+
+    def visit_AsyncWith(self, node):
+        self.generic_visit(node)
+        return ast.copy_location(ast.With(items=node.items, body=node.body, type_comment=None), node)
+
+    def visit_AsyncFor(self, node):
+        self.generic_visit(node)
+        return ast.copy_location(ast.For(target=node.target, iter=node.iter, body=node.body, orelse=node.orelse, type_comment=None), node)
+
+    def visit_Attribute(self, node):
+        self.generic_visit(node)
+        if node.attr == "extract_async":
+            node.attr = "extract"
+        return node
+
+
+def to_sync(script):
+    """The script as sync Playwright code (scripts without 'await' are kept as they are)."""
+    script = textwrap.dedent(script).strip()
+    if "await" not in script:
+        return script
+    wrapped = "async def _user_script():\n" + textwrap.indent(script, "    ")
+    function = ast.parse(wrapped).body[0]
+    body = [_Unawait().visit(statement) for statement in function.body]
+    return "\n".join(ast.unparse(ast.fix_missing_locations(statement)) for statement in body)
+
+
+def _slug(text):
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")[:40] or "run"
+
+
+def render_module(run_id, state, baselines_name="baselines"):
+    """
+    (source, baselines) of the replay module for a completed run's state.
+    baselines maps file names the module expects in its `baselines_name`
+    directory (next to the module) to the files to copy there.
+    """
+    plan = state.get("plan") or []
+    scripts = state.get("step_scripts") or {}
+    task = state["task"]
+    functions, entries = [], []
+    baselines = {}
+
+    def _baseline(path, name):
+        baselines[name] = path
+        fingerprint = path[:-len(".png")] + ".fp"
+        if os.path.exists(fingerprint):
+            baselines[name[:-len(".png")] + ".fp"] = fingerprint
+        return f"_baseline({name!r})"
+
+    index = 0
+    while index < len(plan):
+        # Consecutive assertions are checked together, as in the verify node
+        checks = []
+        while index < len(plan) and split_assertion(plan[index]) is not None:
+            checks.append((index, split_assertion(plan[index])))
+            index += 1
+        if checks:
+            assertions = [text for _, text in checks]
+            regions = ", ".join(
+                f"{position}: {_baseline(region_baseline_path(task, step), f'step_{step + 1}_region.png')}"
+                for position, (step, text) in enumerate(checks)
+                if parse_assertion(text)["kind"] == "unchanged" and os.path.exists(region_baseline_path(task, step))
+            )
+            entries.append(f"    Check({checks[0][0] + 1}, {assertions!r}, regions={{{regions}}}),")
+            continue
+
+        recorded = scripts.get(str(index))
+        if not recorded or not recorded.get("script"):
+            raise ValueError(f"Run {run_id} has no recorded script for step {index + 1} ({plan[index]})")
+        _, description = split_branch(plan[index])
+        body = textwrap.indent(to_sync(recorded["script"]) or "pass", "    ")
+        functions.append(f"def step_{index + 1}(page, browser_manager):\n    # Plan: {description}\n{body}\n")
+        baseline = baseline_path(task, index + 1)
+        baseline = _baseline(baseline, f"step_{index + 1}.png") if os.path.exists(baseline) else None
+        entries.append(f"    Step({index + 1}, step_{index + 1}, timeout_ms={recorded.get('timeout_ms')!r}, baseline={baseline}),")
+        index += 1
+
+    source = "\n".join([
+        f'"""Replay of run {run_id} (exported {time.strftime("%Y-%m-%d %H:%M")} by app.exporter) - runs without the agent."""',
+        "import os",
+        "",
+        "from app.runner import Check, Step, run_steps",
+        "",
+        f"TASK = {task!r}",
+        f"RUN_ID = {run_id!r}",
+        f"BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), {baselines_name!r})",
+        "",
+        "",
+        "def _baseline(name):",
+        "    return os.path.join(BASELINES, name)",
+        "",
+        "",
+        "\n\n".join(functions),
+        "",
+        "STEPS = [",
+        *entries,
+        "]",
+        "",
+        "",
+        "def test_replay(page):",
+        '    """pytest-playwright entry point (its `page` fixture)."""',
+        "    run_steps(STEPS, page)",
+        "",
+    ])
+    return source, baselines
+
+
+def export_run(run_id, out_dir=EXPORT_DIR, pytest_name=False):
+    """Write the replay module of a completed run and return its path."""
+    checkpoint = checkpoint_store.latest(run_id)
+    if checkpoint is None:
+        raise ValueError(f"No checkpoint for run {run_id}")
+    state = checkpoint["state"]
+    plan = state.get("plan") or []
+    if not plan or state.get("error") or state.get("current_step_index", 0) < len(plan):
+        raise ValueError(f"Run {run_id} did not complete its plan - only completed runs can be exported")
+
+    name = f"{_slug(state['task'])}_{run_id[:8]}"
+    source, baselines = render_module(run_id, state, f"{name}_baselines")
+    os.makedirs(out_dir, exist_ok=True)
+    if baselines:
+        baseline_dir = os.path.join(out_dir, f"{name}_baselines")
+        os.makedirs(baseline_dir, exist_ok=True)
+        for file_name, source_path in baselines.items():
+            shutil.copyfile(source_path, os.path.join(baseline_dir, file_name))
+    path = os.path.join(out_dir, f"test_{name}.py" if pytest_name else f"{name}.py")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(source)
+    return path
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Export a completed run as a standalone Playwright replay")
+    parser.add_argument("run_id")
+    parser.add_argument("--out", default=EXPORT_DIR, help="output directory")
+    parser.add_argument("--pytest", action="store_true", help="name the file test_*.py for pytest collection")
+    args = parser.parse_args()
+    try:
+        path = export_run(args.run_id, args.out, args.pytest)
+    except ValueError as e:
+        raise SystemExit(f"❌ {str(e)}")
+    print(f"📦 Exported run {args.run_id} to {path}")
+    print(f"   python -m app.runner {path}")
+
+
+if __name__ == "__main__":
+    _main()
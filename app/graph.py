@@ -3,8 +3,14 @@ from app.state import AgentState
 from app.agents.planner import plan_node
 from app.agents.coder import execution_node
 from app.agents.healer import repair_node
-from app.agents.discovery import discovery_node
+from app.agents.discovery import discovery_node, is_discovery_task
 from app.agents.monitor import monitor_node
+from app.agents.preflight import preflight_node
+from app.agents.verify import verify_node, starts_assertion_group
+from app.agents.parallel import parallel_node, starts_parallel_group
+from app.agents.triage import retry_node, TRANSIENT, FATAL, MAX_TRANSIENT_RETRIES
+from app.cancellation import cancellable
+from app.checkpoints import checkpointed
 
 def should_continue(state: AgentState):
     # Check if we have a plan
@@ -15,9 +21,21 @@ def should_continue(state: AgentState):
     # Check for errors first
     error = state.get("error")
     if error:
+        # Unhealable failures (DNS, 4xx/5xx, CAPTCHA, closed browser, bad API key) stop right away
+        error_class = state.get("error_class")
+        if error_class == FATAL:
+            return "failed"
+        # Transient failures get a cheap retry with backoff, without the LLM
+        if error_class == TRANSIENT:
+            if state.get("transient_retries", 0) < MAX_TRANSIENT_RETRIES:
+                return "retry"
+            return "failed"
         retry_count = state.get("retry_count", 0)
         if retry_count > 3:
             return "failed"
+        # Code from the fast model failed - the strong model writes it again before the healer tries
+        if state.get("escalate_code"):
+            return "escalate"
         return "repair"
     
     # Check if all steps are complete
@@ -25,16 +43,27 @@ def should_continue(state: AgentState):
     if current_step_index >= len(plan):
         return "end"
         
-    # Continue to next step
+    # "[assert] ..." steps are checked locally, without codegen
+    if starts_assertion_group(state):
+        return "verify"
+    # Continue to next step (independent branch-tagged steps run in parallel tabs)
+    if starts_parallel_group(state):
+        return "parallel"
     return "continue"
 
 workflow = StateGraph(AgentState)
 
-workflow.add_node("planner", plan_node)
-workflow.add_node("executor", execution_node)
-workflow.add_node("repair", repair_node)
-workflow.add_node("discovery", discovery_node)
-workflow.add_node("monitor", monitor_node)
+# Every node checks the run's cancel token / deadline on entry and while it waits,
+# and checkpoints the state after it completes (resume, see app/checkpoints.py)
+workflow.add_node("planner", cancellable(checkpointed("planner", plan_node)))
+workflow.add_node("executor", cancellable(checkpointed("executor", execution_node)))
+workflow.add_node("repair", cancellable(checkpointed("repair", repair_node)))
+workflow.add_node("discovery", cancellable(checkpointed("discovery", discovery_node)))
+workflow.add_node("monitor", cancellable(checkpointed("monitor", monitor_node)))
+workflow.add_node("retry", cancellable(checkpointed("retry", retry_node)))
+workflow.add_node("parallel", cancellable(checkpointed("parallel", parallel_node)))
+workflow.add_node("preflight", cancellable(checkpointed("preflight", preflight_node)))
+workflow.add_node("verify", cancellable(checkpointed("verify", verify_node)))
 
 # Check if plan is valid before execution
 def check_plan(state: AgentState):
@@ -44,35 +73,99 @@ def check_plan(state: AgentState):
     # If error during planning or empty plan, stop
     if error or not plan:
         return "end"
-        
+    
+    if starts_assertion_group(state):
+        return "verify"
+    if starts_parallel_group(state):
+        return "parallel"
     return "continue"
 
-workflow.set_entry_point("planner")
+def route_task(state: AgentState):
+    # Resumed runs (see app/checkpoints.py) already have a plan - continue at the next step
+    plan = state.get("plan") or []
+    if plan and state.get("current_step_index", 0) < len(plan):
+        if starts_assertion_group(state):
+            return "verify"
+        return "parallel" if starts_parallel_group(state) else "resume"
+    # Discovery runs ("discover: https://...", or mode="discover") crawl the site instead of planning
+    if is_discovery_task(state):
+        return "discover"
+    return "plan"
+
+workflow.set_conditional_entry_point(
+    route_task,
+    {
+        "discover": "discovery",
+        "plan": "planner",
+        "resume": "executor",
+        "parallel": "parallel",
+        "verify": "verify"
+    }
+)
+workflow.add_edge("discovery", END)
 
 # Conditional edge from planner
 workflow.add_conditional_edges(
     "planner",
     check_plan,
     {
-        "continue": "executor",
+        "continue": "preflight",
+        "parallel": "parallel",
+        "verify": "verify",
         "end": END
     }
 )
 
+# Selectors of the upcoming steps are checked on the live page first (see agents/preflight.py);
+# a step whose selector is missing goes to the healer instead of timing out
+def after_preflight(state: AgentState):
+    return "repair" if state.get("error") else "execute"
+
+workflow.add_conditional_edges(
+    "preflight",
+    after_preflight,
+    {
+        "execute": "executor",
+        "repair": "repair"
+    }
+)
+
 # Route executor -> monitor -> should_continue
 workflow.add_edge("executor", "monitor")
+workflow.add_edge("parallel", "monitor")
 
 workflow.add_conditional_edges(
     "monitor",
     should_continue,
     {
-        "continue": "executor",
+        "continue": "preflight",
+        "parallel": "parallel",
+        "verify": "verify",
+        "repair": "repair",
+        "retry": "retry",
+        "escalate": "executor",
+        "failed": END,
+        "end": END
+    }
+)
+
+# Assertions don't change the page - skip the visual monitor
+workflow.add_conditional_edges(
+    "verify",
+    should_continue,
+    {
+        "continue": "preflight",
+        "parallel": "parallel",
+        "verify": "verify",
         "repair": "repair",
+        "retry": "retry",
+        "escalate": "executor",
         "failed": END,
         "end": END
     }
 )
 
 workflow.add_edge("repair", "executor")
+workflow.add_edge("retry", "executor")
 
 app = workflow.compile()
\ No newline at end of file
@@ -0,0 +1,11 @@
+"""
+LLM call layer used by get_llm(): response cache (cache.py) and the shared
+rate limiter (limiter.py) around the chat model, and the fast/strong model
+cascade (cascade.py) on top of it.
+"""
+from app.llm.cache import llm_cache
+from app.llm.cascade import cascade_stats
+from app.llm.client import LLMClient
+from app.llm.limiter import llm_limiter
+
+__all__ = ["LLMClient", "cascade_stats", "llm_cache", "llm_limiter"]
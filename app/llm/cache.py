@@ -0,0 +1,278 @@
+"""
+Local LLM response cache (SQLite, .agent_data/llm_cache.db).
+
+Two kinds of keys:
+- exact: hash of model + purpose + the full prompt (including images)
+- normalized: the same, but with the quoted literals and URL query strings
+  of the user/step text replaced by placeholders (scheme, host and path of a
+  URL stay in the key). The cached response is stored as a template with
+  those literals replaced too, and the current request's literals are put
+  back on a hit - so "fill 'blue shirt'" can reuse the code generated for
+  "fill 'red shirt'". Literals are only replaced as whole tokens, and a
+  normalized hit is only served if the cached code contains every literal
+  (code that never used the selector of its step can't be adapted to another).
+
+Entries expire after LLM_CACHE_TTL_HOURS and the least recently used ones are
+evicted beyond LLM_CACHE_MAX_ENTRIES. Hit rates are kept per purpose.
+
+    python -m app.llm.cache           # print hit-rate metrics
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from app.config import DATA_DIR
+
+CACHE_PATH = os.path.join(DATA_DIR, "llm_cache.db")
+CACHE_ENABLED = os.getenv("LLM_CACHE", "1").lower() in ("1", "true", "yes")
+TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600
+MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+# Literals shorter than this stay in the key (too ambiguous to re-insert safely)
+MIN_LITERAL_LENGTH = 3
+
+_LITERAL = re.compile(r"""'((?:[^'\\\n]|\\.)*)'|"((?:[^"\\\n]|\\.)*)"|(https?://[^\s'"<>)]+)""")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    purpose TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used);
+CREATE TABLE IF NOT EXISTS stats (
+    purpose TEXT PRIMARY KEY,
+    lookups INTEGER NOT NULL DEFAULT 0,
+    exact_hits INTEGER NOT NULL DEFAULT 0,
+    normalized_hits INTEGER NOT NULL DEFAULT 0,
+    stores INTEGER NOT NULL DEFAULT 0,
+    invalidations INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def _message_parts(messages):
+    """[(role, content)] for a prompt string or a list of LangChain messages."""
+    if isinstance(messages, str):
+        return [("human", messages)]
+    return [(getattr(m, "type", "human"), m.content) for m in messages]
+
+
+def _hash(model, purpose, parts):
+    payload = json.dumps([model, purpose, parts], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def exact_key(model, purpose, messages):
+    return "x:" + _hash(model, purpose, _message_parts(messages))
+
+
+def extract_literals(text):
+    """
+    Quoted string values and the query strings (with fragment) of URLs in
+    `text`, in order of appearance (deduplicated). The rest of a URL is not a
+    literal: a prompt for another site must not reuse this one's code.
+    """
+    literals = []
+    for match in _LITERAL.finditer(text):
+        value = next(group for group in match.groups() if group is not None)
+        if match.group(3) is None and _LITERAL.search(value):
+            # Quotes around a whole step ('this step: "click '#menu'"'): only the
+            # quoted arguments inside it are literals, not the wrapped text
+            literals.extend(v for v in extract_literals(value) if v not in literals)
+            continue
+        if re.match(r"https?://", value):
+            query = re.search(r"[?#]", value)
+            if query is None:
+                continue
+            value = value[query.start():]
+        if len(value) >= MIN_LITERAL_LENGTH and value not in literals:
+            literals.append(value)
+    return literals
+
+
+def _literal_pattern(literal):
+    # Whole tokens only: 'red' must not match inside ".required"
+    pattern = re.escape(literal)
+    if re.match(r"\w", literal):
+        pattern = r"(?<!\w)" + pattern
+    if re.search(r"\w$", literal):
+        pattern += r"(?!\w)"
+    return pattern
+
+
+def _templatize(text, literals):
+    if not literals:
+        return text
+    # One pass, longest first, so a literal that contains another one is replaced whole
+    order = sorted(range(len(literals)), key=lambda i: -len(literals[i]))
+    pattern = re.compile("|".join(f"(?P<l{index}>{_literal_pattern(literals[index])})" for index in order))
+    return pattern.sub(lambda match: f"⟦{match.lastgroup[1:]}⟧", text)
+
+
+def _fill(template, literals):
+    def _sub(match):
+        index = int(match.group(1))
+        return literals[index] if index < len(literals) else match.group(0)
+    return re.sub(r"⟦(\d+)⟧", _sub, template)
+
+
+def normalized_key(model, purpose, messages):
+    """
+    (key, literals) for the prompt with the literals of its user/step text replaced
+    by placeholders, or (None, []) if that text has no literals or the prompt
+    contains images. System prompts (guidelines, examples) are kept as they are.
+    """
+    parts = _message_parts(messages)
+    texts = []
+    for role, content in parts:
+        if isinstance(content, str):
+            blocks = [content]
+        else:
+            if any(block.get("type") != "text" for block in content):
+                return None, []
+            blocks = [block["text"] for block in content]
+        if role == "human":
+            texts.extend(blocks)
+    literals = extract_literals("\n".join(texts))
+    if not literals:
+        return None, []
+
+    def _norm(role, content):
+        if role != "human":
+            return content
+        if isinstance(content, str):
+            return _templatize(content, literals)
+        return [{**block, "text": _templatize(block["text"], literals)} for block in content]
+
+    return "n:" + _hash(model, purpose, [(role, _norm(role, content)) for role, content in parts]), literals
+
+
+class LLMCache:
+    def __init__(self, path=CACHE_PATH, ttl_seconds=TTL_SECONDS, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._ready = True
+        return conn
+
+    def _count(self, conn, purpose, column):
+        conn.execute("INSERT OR IGNORE INTO stats (purpose) VALUES (?)", (purpose,))
+        conn.execute(f"UPDATE stats SET {column} = {column} + 1 WHERE purpose = ?", (purpose,))
+
+    def lookup(self, model, purpose, messages):
+        """
+        Returns (response_text or None, how, keys) where how is "exact", "normalized"
+        or "miss" and keys are the cache keys of this prompt (for store/invalidate).
+        """
+        exact = exact_key(model, purpose, messages)
+        normalized, literals = normalized_key(model, purpose, messages)
+        keys = {"exact": exact, "normalized": normalized, "literals": literals}
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    self._count(conn, purpose, "lookups")
+                    for key, how in ((exact, "exact"), (normalized, "normalized")):
+                        if key is None:
+                            continue
+                        row = conn.execute("SELECT response, created FROM entries WHERE key = ?", (key,)).fetchone()
+                        if row is None:
+                            continue
+                        if now - row[1] > self.ttl_seconds:
+                            conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                            continue
+                        if how == "normalized" and not all(f"⟦{index}⟧" in row[0] for index in range(len(literals))):
+                            continue  # A literal of this prompt can't be put back into the cached code
+                        response = row[0] if how == "exact" else _fill(row[0], literals)
+                        conn.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                        self._count(conn, purpose, f"{how}_hits")
+                        return response, how, keys
+            finally:
+                conn.close()
+        return None, "miss", keys
+
+    def store(self, purpose, keys, response):
+        now = time.time()
+        rows = [(keys["exact"], "exact", purpose, response, now, now)]
+        if keys.get("normalized"):
+            rows.append((keys["normalized"], "normalized", purpose, _templatize(response, keys["literals"]), now, now))
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO entries (key, kind, purpose, response, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                    self._count(conn, purpose, "stores")
+                    conn.execute("DELETE FROM entries WHERE created < ?", (now - self.ttl_seconds,))
+                    # Least recently used beyond the size bound
+                    conn.execute(
+                        "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                        (self.max_entries,),
+                    )
+            finally:
+                conn.close()
+
+    def invalidate(self, purpose, keys):
+        """Drop the entries for a prompt whose cached response turned out to be bad."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM entries WHERE key IN (?, ?)", (keys["exact"], keys.get("normalized")))
+                    self._count(conn, purpose, "invalidations")
+            finally:
+                conn.close()
+
+    def stats(self):
+        """Hit-rate metrics per purpose."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                rows = conn.execute("SELECT purpose, lookups, exact_hits, normalized_hits, stores, invalidations FROM stats ORDER BY purpose").fetchall()
+                entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            finally:
+                conn.close()
+        purposes = {}
+        for purpose, lookups, exact_hits, normalized_hits, stores, invalidations in rows:
+            purposes[purpose] = {
+                "lookups": lookups,
+                "exact_hits": exact_hits,
+                "normalized_hits": normalized_hits,
+                "stores": stores,
+                "invalidations": invalidations,
+                "hit_rate": round((exact_hits + normalized_hits) / lookups, 3) if lookups else 0.0,
+            }
+        return {"entries": entries, "purposes": purposes}
+
+
+# Global instance
+llm_cache = LLMCache()
+
+
+if __name__ == "__main__":
+    report = llm_cache.stats()
+    print(f"{'purpose':<12} {'lookups':>8} {'exact':>7} {'normal.':>8} {'stores':>7} {'invalid.':>8} {'hit rate':>9}")
+    for purpose, s in report["purposes"].items():
+        print(f"{purpose:<12} {s['lookups']:>8} {s['exact_hits']:>7} {s['normalized_hits']:>8} {s['stores']:>7} {s['invalidations']:>8} {s['hit_rate']:>9.1%}")
+    print(f"\n{report['entries']} cached response(s)")
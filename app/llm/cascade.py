@@ -0,0 +1,226 @@
+"""
+Cheap-first model cascade for planning, codegen and text-only repair.
+
+The fast model (LLM_FAST_MODEL) answers first. Its output is checked
+statically (it must parse, and scripts may only use `page`, `browser_manager`
+and a small allowlist of builtins/modules); if the check fails, or the fast
+model's call raises (rate limit, provider error, timeout), the same request
+goes to the strong model (LLM_MODEL). Scripts from the fast model that
+fail at runtime are regenerated by the strong model before the healer is
+involved (the executor sets `escalate_code`, see app/graph.py). Vision repairs
+go to the strong model directly. LLM_CASCADE=0 sends everything to the strong
+model, as before.
+
+Per purpose and tier, the acceptance and runtime success rates, latency and
+token cost are kept in .agent_data/cascade_stats.json, with the estimated
+savings against sending every call to the strong model:
+
+    python -m app.llm.cascade
+"""
+import ast
+import json
+import os
+import threading
+import time
+
+from app.cancellation import call_cancellable
+from app.config import DATA_DIR, LLM_CASCADE, LLM_FAST_MODEL, LLM_MODEL, get_llm
+
+CASCADE_STATS_PATH = os.path.join(DATA_DIR, "cascade_stats.json")
+CASCADE_ENABLED = LLM_CASCADE and LLM_FAST_MODEL != LLM_MODEL
+
+# USD per million (input, output) tokens, for the savings estimate
+MODEL_PRICES = {
+    "anthropic/claude-3.5-sonnet": (3.0, 15.0),
+    "anthropic/claude-3.5-haiku": (0.8, 4.0),
+}
+
+# What a generated script may reference besides the names it assigns itself
+ALLOWED_NAMES = {
+    "page", "browser_manager", "print", "len", "range", "str", "int", "float", "bool",
+    "min", "max", "sum", "abs", "round", "sorted", "enumerate", "zip", "any", "all",
+    "list", "dict", "set", "tuple", "isinstance", "Exception", "TimeoutError",
+    "True", "False", "None",
+}
+ALLOWED_MODULES = {"re", "json", "time"}
+
+
+def _strip_fences(text):
+    return text.replace("```python", "").replace("```", "").strip()
+
+
+def validate_script(code):
+    """None if `code` looks like a runnable step script, else the reason it does not."""
+    code = _strip_fences(code)
+    if not code:
+        return "empty script"
+    source = code
+    if "await" in code:
+        # Same wrapping as BrowserManager.execute_script
+        source = "async def _user_script():\n" + "\n".join("    " + line for line in code.split("\n"))
+    try:
+        tree = ast.parse(source)
+    except SyntaxError as e:
+        return f"syntax error: {e.msg} (line {e.lineno})"
+
+    assigned, used = set(), set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or ""]
+            blocked = [m for m in modules if m.split(".")[0] not in ALLOWED_MODULES]
+            if blocked:
+                return f"import of {', '.join(blocked)} is not allowed"
+            assigned.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.Name):
+            (used if isinstance(node.ctx, ast.Load) else assigned).add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            assigned.add(node.name)
+        elif isinstance(node, ast.arg):
+            assigned.add(node.arg)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            assigned.add(node.name)
+        elif isinstance(node, ast.Attribute) and node.attr.startswith("__"):
+            return f"access to {node.attr} is not allowed"
+    unknown = sorted(used - assigned - ALLOWED_NAMES)
+    if unknown:
+        return f"uses names outside the allowlist: {', '.join(unknown[:5])}"
+    if not used & {"page", "browser_manager"}:
+        return "does not use page or browser_manager"
+    return None
+
+
+class CascadeStats:
+    def __init__(self, path=CASCADE_STATS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+        return self._data
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def _entry(self, purpose, tier):
+        return self._load().setdefault(purpose, {}).setdefault(tier, {
+            "calls": 0, "cache_hits": 0, "accepted": 0, "rejected": 0, "errors": 0,
+            "runtime_successes": 0, "runtime_failures": 0,
+            "latency_s": 0.0, "cost_usd": 0.0,
+        })
+
+    def record_call(self, purpose, tier, model, response, latency_s, accepted):
+        metadata = response.response_metadata or {}
+        with self._lock:
+            entry = self._entry(purpose, tier)
+            if metadata.get("cache") in ("exact", "normalized"):
+                entry["cache_hits"] += 1
+            else:
+                entry["calls"] += 1
+                entry["latency_s"] += latency_s
+                usage = getattr(response, "usage_metadata", None) or {}
+                prices = MODEL_PRICES.get(model)
+                if prices:
+                    entry["cost_usd"] += (usage.get("input_tokens", 0) * prices[0] + usage.get("output_tokens", 0) * prices[1]) / 1e6
+                entry["accepted" if accepted else "rejected"] += 1
+            self._save()
+
+    def record_error(self, purpose, tier):
+        """A call to `tier` that raised (rate limit, provider error, timeout)."""
+        with self._lock:
+            entry = self._entry(purpose, tier)
+            entry["errors"] = entry.get("errors", 0) + 1
+            self._save()
+
+    def record_runtime(self, purpose, tier, succeeded):
+        """Whether a script produced by `tier` ran successfully."""
+        with self._lock:
+            entry = self._entry(purpose, tier)
+            entry["runtime_successes" if succeeded else "runtime_failures"] += 1
+            self._save()
+
+    def report(self):
+        """Per purpose and tier: rates and averages, plus the estimated savings of the cascade."""
+        with self._lock:
+            data = json.loads(json.dumps(self._load()))
+        report = {}
+        for purpose, tiers in data.items():
+            rows = {}
+            for tier, e in tiers.items():
+                answered = e["accepted"] + e["rejected"]
+                ran = e["runtime_successes"] + e["runtime_failures"]
+                rows[tier] = {
+                    **e,
+                    "acceptance_rate": e["accepted"] / answered if answered else 0.0,
+                    "runtime_success_rate": e["runtime_successes"] / ran if ran else 0.0,
+                    "avg_latency_s": e["latency_s"] / e["calls"] if e["calls"] else 0.0,
+                    "avg_cost_usd": e["cost_usd"] / e["calls"] if e["calls"] else 0.0,
+                }
+            fast, strong = rows.get("fast"), rows.get("strong")
+            savings = None
+            if fast and strong and strong["calls"]:
+                # Fast answers that did not need the strong model, minus what all fast calls cost
+                kept = fast["accepted"] - fast["runtime_failures"]
+                savings = {
+                    "cost_usd": kept * strong["avg_cost_usd"] - fast["cost_usd"],
+                    "latency_s": kept * strong["avg_latency_s"] - fast["latency_s"],
+                }
+            report[purpose] = {"tiers": rows, "savings": savings}
+        return report
+
+
+# Global instance
+cascade_stats = CascadeStats()
+
+
+def invoke(purpose, messages, validate=None, tier=None):
+    """
+    Send `messages` through the cascade. `validate(content)` returns None if the
+    answer is usable, else a reason. A fast-model call that raises escalates too.
+    tier="strong" skips the fast model.
+    Returns (response, tier_used, escalation_reason or None).
+    """
+    tiers = ["fast", "strong"] if CASCADE_ENABLED and tier != "strong" else ["strong"]
+    reason = None
+    for current in tiers:
+        llm = get_llm(purpose=purpose, tier=current)
+        started = time.perf_counter()
+        try:
+            response = call_cancellable(llm.invoke, messages)
+        except Exception as e:
+            if current == tiers[-1]:
+                raise
+            # The fast model is down or rate limited - the strong model answers instead
+            cascade_stats.record_error(purpose, current)
+            reason = f"call failed: {str(e).splitlines()[0] if str(e) else type(e).__name__}"
+            continue
+        latency_s = time.perf_counter() - started
+        problem = validate(response.content) if validate else None
+        cascade_stats.record_call(purpose, current, llm.model, response, latency_s, problem is None)
+        if problem is None or current == tiers[-1]:
+            return response, current, reason
+        reason = problem
+        keys = (response.response_metadata or {}).get("cache_keys")
+        if keys:
+            # Don't serve the rejected answer from the cache next time
+            from app.llm.cache import llm_cache
+            llm_cache.invalidate(purpose, keys)
+
+
+if __name__ == "__main__":
+    for purpose, entry in cascade_stats.report().items():
+        print(f"{purpose}")
+        for tier, r in entry["tiers"].items():
+            print(f"  {tier:<7} {r['calls']:>5} calls  {r['cache_hits']:>4} cached  accepted {r['acceptance_rate']:>6.1%}  "
+                  f"runtime ok {r['runtime_success_rate']:>6.1%}  {r.get('errors', 0):>3} errors  {r['avg_latency_s']:>5.1f}s avg  ${r['cost_usd']:.4f}")
+        if entry["savings"]:
+            print(f"  saved vs strong-only: ${entry['savings']['cost_usd']:.4f}, {entry['savings']['latency_s']:.0f}s")
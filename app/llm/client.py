@@ -0,0 +1,50 @@
+from app.llm.cache import llm_cache, CACHE_ENABLED
+from app.llm.limiter import llm_limiter, estimate_tokens
+
+# Purposes whose responses may be reused (healing depends on live page state - never cached)
+CACHEABLE_PURPOSES = {"plan", "code", "discovery"}
+
+
+class LLMClient:
+    """
+    What get_llm() returns: the chat model plus the layers every call goes
+    through (response cache, then the shared rate limiter). invoke() takes the same input as ChatModel.invoke() and returns an
+    AIMessage; response_metadata["cache"] is "exact", "normalized" or "miss" and
+    response_metadata["cache_keys"] identifies the entry (see llm_cache.invalidate()).
+    """
+    def __init__(self, chat_model, model, purpose="default"):
+        self.chat_model = chat_model
+        self.model = model
+        self.purpose = purpose or "default"
+
+    @property
+    def cacheable(self):
+        return CACHE_ENABLED and self.purpose in CACHEABLE_PURPOSES
+
+    def _send(self, messages, **kwargs):
+        """Call the model through the shared rate limiter (backoff on 429, smaller max_tokens on 402)."""
+        default_max_tokens = kwargs.pop("max_tokens", None) or getattr(self.chat_model, "max_tokens", None)
+
+        def send(max_tokens):
+            if max_tokens and max_tokens != default_max_tokens:
+                return self.chat_model.invoke(messages, max_tokens=max_tokens, **kwargs)
+            return self.chat_model.invoke(messages, **kwargs)
+
+        tokens = estimate_tokens(messages, default_max_tokens)
+        return llm_limiter.call(self.model, self.purpose, tokens, send, default_max_tokens)
+
+    def invoke(self, messages, **kwargs):
+        if not self.cacheable:
+            return self._send(messages, **kwargs)
+
+        from langchain_core.messages import AIMessage
+
+        cached, how, keys = llm_cache.lookup(self.model, self.purpose, messages)
+        if cached is not None:
+            return AIMessage(content=cached, response_metadata={"cache": how, "cache_keys": keys})
+
+        response = self._send(messages, **kwargs)
+        if isinstance(response.content, str) and response.content.strip():
+            llm_cache.store(self.purpose, keys, response.content)
+        response.response_metadata = {**(response.response_metadata or {}), "cache": "miss", "cache_keys": keys}
+        return response
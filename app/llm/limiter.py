@@ -0,0 +1,229 @@
+"""
+Shared limiter for LLM requests, so concurrent nodes and runs back off together
+instead of each failing on OpenRouter rate limits.
+
+Per model:
+- token buckets for requests/min (LLM_RPM) and tokens/min (LLM_TPM)
+- a concurrency limit adjusted AIMD-style: halved on a 429, grown by ~1 per
+  window of successful calls, up to LLM_MAX_CONCURRENCY
+- a priority queue: repair > code > plan > discovery
+
+429s are retried with jittered exponential backoff (or Retry-After), 402s
+(not enough credits for max_tokens) are retried with a smaller max_tokens.
+Queue depth, wait times and retry counts: llm_limiter.stats().
+"""
+import heapq
+import itertools
+import os
+import random
+import re
+import threading
+import time
+
+from app.cancellation import RunCancelled, current_token, sleep
+
+RPM = float(os.getenv("LLM_RPM", "60"))
+TPM = float(os.getenv("LLM_TPM", "200000"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+MIN_MAX_TOKENS = 256
+POLL_SECONDS = 0.25
+
+# Lower runs first: healing unblocks a run that is already in progress
+PRIORITIES = {"repair": 0, "code": 1, "plan": 2, "default": 2, "discovery": 3}
+
+
+def _status_code(error):
+    code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if code:
+        return code
+    match = re.search(r"\b(402|429)\b", str(error))
+    return int(match.group(1)) if match else None
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _affordable_tokens(error, max_tokens):
+    """max_tokens to retry a 402 with ("...but can only afford 1234" or half)."""
+    match = re.search(r"can only afford (\d+)", str(error))
+    if match:
+        return min(int(int(match.group(1)) * 0.9), max_tokens - 1)
+    return max_tokens // 2
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._last) * self.rate)
+        self._last = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` is available (0 if it is now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Give back (positive) or charge (negative) tokens after the real usage is known."""
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _ModelLimits:
+    def __init__(self, rpm, tpm, concurrency):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = concurrency
+        self.concurrency = float(concurrency)
+        self.in_flight = 0
+        self.waiters = []
+        self.metrics = {
+            "calls": 0, "rate_limited": 0, "payment_required": 0, "retries": 0,
+            "wait_total_s": 0.0, "wait_max_s": 0.0, "max_queue_depth": 0,
+        }
+
+
+class LLMLimiter:
+    def __init__(self, rpm=RPM, tpm=TPM, concurrency=MAX_CONCURRENCY):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concurrency = concurrency
+        self._models = {}
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+
+    def _limits(self, model):
+        limits = self._models.get(model)
+        if limits is None:
+            limits = self._models[model] = _ModelLimits(self.rpm, self.tpm, self.concurrency)
+        return limits
+
+    def acquire(self, model, purpose, tokens):
+        """Block (in priority order) until a request of ~`tokens` tokens may be sent."""
+        entry = (PRIORITIES.get(purpose, PRIORITIES["default"]), next(self._seq))
+        started = time.monotonic()
+        with self._cond:
+            limits = self._limits(model)
+            heapq.heappush(limits.waiters, entry)
+            limits.metrics["max_queue_depth"] = max(limits.metrics["max_queue_depth"], len(limits.waiters))
+            try:
+                while True:
+                    token = current_token()
+                    if token is not None and token.cancelled:
+                        raise RunCancelled(token.reason)
+                    wait = POLL_SECONDS
+                    if limits.waiters[0] == entry and limits.in_flight < max(1, int(limits.concurrency)):
+                        wait_needed = max(limits.requests.wait_time(1), limits.tokens.wait_time(tokens))
+                        if wait_needed == 0:
+                            limits.requests.take(1)
+                            limits.tokens.take(tokens)
+                            limits.in_flight += 1
+                            break
+                        wait = min(wait, wait_needed)
+                    self._cond.wait(wait)
+            finally:
+                limits.waiters.remove(entry)
+                heapq.heapify(limits.waiters)
+                self._cond.notify_all()
+            waited = time.monotonic() - started
+            limits.metrics["wait_total_s"] += waited
+            limits.metrics["wait_max_s"] = max(limits.metrics["wait_max_s"], waited)
+
+    def release(self, model, reserved_tokens, used_tokens=None, rate_limited=False, succeeded=True):
+        with self._cond:
+            limits = self._limits(model)
+            limits.in_flight -= 1
+            limits.metrics["calls"] += 1
+            if used_tokens is not None:
+                limits.tokens.adjust(reserved_tokens - used_tokens)
+            if rate_limited:
+                # Multiplicative decrease
+                limits.concurrency = max(1.0, limits.concurrency / 2)
+            elif succeeded:
+                # Additive increase: about +1 per `concurrency` successful calls
+                limits.concurrency = min(limits.max_concurrency, limits.concurrency + 1 / limits.concurrency)
+            self._cond.notify_all()
+
+    def call(self, model, purpose, tokens, send, max_tokens=None):
+        """
+        send(max_tokens) under the limiter, retrying 429s with backoff and 402s with
+        a smaller max_tokens. `tokens` is the estimated prompt + completion size.
+        """
+        attempt = 0
+        while True:
+            self.acquire(model, purpose, tokens)
+            try:
+                response = send(max_tokens)
+            except Exception as e:
+                status = _status_code(e)
+                self.release(model, tokens, rate_limited=status == 429, succeeded=False)
+                if attempt >= MAX_RETRIES or status not in (402, 429):
+                    raise
+                attempt += 1
+                with self._cond:
+                    metrics = self._limits(model).metrics
+                    metrics["retries"] += 1
+                    metrics["rate_limited" if status == 429 else "payment_required"] += 1
+                if status == 402:
+                    if not max_tokens:
+                        raise
+                    max_tokens = _affordable_tokens(e, max_tokens)
+                    if max_tokens < MIN_MAX_TOKENS:
+                        raise
+                    continue
+                delay = _retry_after(e) or random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+                sleep(delay)
+                continue
+            usage = getattr(response, "usage_metadata", None) or {}
+            self.release(model, tokens, usage.get("total_tokens"))
+            return response
+
+    def stats(self):
+        with self._cond:
+            return {
+                model: {
+                    "queue_depth": len(limits.waiters),
+                    "in_flight": limits.in_flight,
+                    "concurrency_limit": round(limits.concurrency, 2),
+                    **{k: round(v, 3) if isinstance(v, float) else v for k, v in limits.metrics.items()},
+                    "wait_avg_s": round(limits.metrics["wait_total_s"] / limits.metrics["calls"], 3) if limits.metrics["calls"] else 0.0,
+                }
+                for model, limits in self._models.items()
+            }
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Rough size of a request for the tokens/min budget: prompt text + images + completion budget."""
+    from app.agents.prompts import count_tokens
+
+    parts = [messages] if isinstance(messages, str) else [m.content for m in messages]
+    total = 0
+    for content in parts:
+        if isinstance(content, str):
+            total += count_tokens(content)
+            continue
+        for block in content:
+            total += count_tokens(block["text"]) if block.get("type") == "text" else 1000
+    return total + (max_tokens or 0)
+
+
+# Global instance (shared by every LLM call in the process)
+llm_limiter = LLMLimiter()
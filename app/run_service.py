@@ -0,0 +1,276 @@
+"""
+Background run service: agent runs execute on worker threads instead of the
+Streamlit script thread, so the UI stays responsive and several sessions can
+run tasks at the same time.
+
+- a job queue feeds RUN_WORKERS worker threads
+- each run leases a browser from a BrowserPool for its whole duration
+  (`browser_instance` resolves to it inside the run, see app/tools/browser.py)
+- progress is published on an in-memory EventBus; the UI polls it with a cursor
+- runs are recorded in the run history and can be cancelled (or stopped by
+  RUN_DEADLINE_SECONDS) through their cancel token, see app/cancellation.py
+"""
+import base64
+import os
+import queue
+import threading
+import time
+import uuid
+
+from app import cancellation
+from app.checkpoints import checkpoint_store, resume_state, restore_browser
+from app.tools.browser import BrowserPool
+from app.tools.history import run_history
+
+RUN_WORKERS = int(os.getenv("RUN_WORKERS", "2"))
+
+QUEUED, RUNNING, SUCCESS, FAILED, CANCELLED = "queued", "running", "success", "failed", "cancelled"
+FINISHED = (SUCCESS, FAILED, CANCELLED)
+
+
+class EventBus:
+    """
+    Per-run event log with publish/subscribe. Pollers read with a cursor
+    (events(run_id, cursor)); callbacks registered with subscribe() are pushed
+    every event. Events of finished runs are dropped after `retain_seconds`.
+    """
+    def __init__(self, retain_seconds=600):
+        self.retain_seconds = retain_seconds
+        self._events = {}
+        self._closed = {}
+        self._subscribers = []
+        self._cond = threading.Condition()
+
+    def publish(self, run_id, kind, **data):
+        event = {"kind": kind, "time": time.time(), **data}
+        with self._cond:
+            self._events.setdefault(run_id, []).append(event)
+            subscribers = list(self._subscribers)
+            self._cond.notify_all()
+        for callback in subscribers:
+            try:
+                callback(run_id, event)
+            except Exception:
+                pass
+
+    def subscribe(self, callback):
+        """Push every event to callback(run_id, event). Returns an unsubscribe function."""
+        with self._cond:
+            self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def events(self, run_id, cursor=0):
+        """Events after `cursor`. Returns (events, new_cursor)."""
+        with self._cond:
+            events = self._events.get(run_id, [])
+            return events[cursor:], len(events)
+
+    def wait(self, run_id, cursor=0, timeout=None):
+        """Block until there are events after `cursor` (or the timeout). Returns (events, new_cursor)."""
+        with self._cond:
+            self._cond.wait_for(lambda: len(self._events.get(run_id, [])) > cursor, timeout=timeout)
+        return self.events(run_id, cursor)
+
+    def close(self, run_id):
+        """The run is over; forget it (and other finished runs) once retention expires."""
+        now = time.time()
+        with self._cond:
+            self._closed[run_id] = now
+            for stale in [r for r, closed in self._closed.items() if now - closed > self.retain_seconds]:
+                self._events.pop(stale, None)
+                del self._closed[stale]
+
+
+class RunService:
+    def __init__(self, workers=RUN_WORKERS):
+        self.workers = workers
+        self.pool = BrowserPool(workers)
+        self.bus = EventBus()
+        self._jobs = queue.Queue()
+        self._runs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"run-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, task, session_id=None, headless=None, resume_from=None):
+        """
+        Queue a task. Returns its run_id immediately. With `resume_from` (a run_id),
+        the run continues that run's last checkpoint instead (see app/checkpoints.py).
+        """
+        resume = None
+        if resume_from:
+            resume = resume_state(resume_from)
+            task = resume[0]["task"]
+        self._ensure_workers()
+        run_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._runs[run_id] = {
+                "status": QUEUED,
+                "task": task,
+                "session_id": session_id,
+                "token": cancellation.register(run_id),
+            }
+        run_history.start_run(run_id, session_id or "", task)
+        self.bus.publish(run_id, "status", status=QUEUED)
+        self._jobs.put((run_id, task, headless, resume))
+        return run_id
+
+    def cancel(self, run_id):
+        """
+        Request cancellation. Queued runs never start; running ones stop at their next
+        browser call, LLM call or node boundary.
+        """
+        with self._lock:
+            run = self._runs.get(run_id)
+            if not run or run["status"] in FINISHED:
+                return False
+            run["token"].cancel("Run cancelled by user")
+        self.bus.publish(run_id, "log", text="⏹️ Cancellation requested")
+        return True
+
+    def status(self, run_id):
+        with self._lock:
+            run = self._runs.get(run_id)
+            return run["status"] if run else None
+
+    def active_runs(self, session_id=None):
+        """run_ids that are queued or running (optionally for one session)."""
+        with self._lock:
+            return [
+                run_id for run_id, run in self._runs.items()
+                if run["status"] not in FINISHED and (session_id is None or run["session_id"] == session_id)
+            ]
+
+    def _set_status(self, run_id, status):
+        with self._lock:
+            self._runs[run_id]["status"] = status
+            if status in FINISHED:
+                self._runs[run_id]["finished"] = time.time()
+                # Finished runs are in the history DB; only keep recent ones in memory
+                for stale in [r for r, run in self._runs.items() if time.time() - run.get("finished", time.time()) > self.bus.retain_seconds]:
+                    del self._runs[stale]
+        self.bus.publish(run_id, "status", status=status)
+
+    def _worker(self):
+        while True:
+            run_id, task, headless, resume = self._jobs.get()
+            try:
+                self._execute(run_id, task, headless, resume)
+            except Exception as e:
+                self._finish(run_id, FAILED, f"❌ Task failed: {str(e)}")
+            finally:
+                self._jobs.task_done()
+
+    def _execute(self, run_id, task, headless, resume=None):
+        token = self._runs[run_id]["token"]
+        if token.cancelled:
+            self._finish(run_id, CANCELLED, "⏹️ Run cancelled before it started.")
+            return
+        # The deadline counts from the start of execution, not from submission
+        deadline = time.time() + cancellation.RUN_DEADLINE_SECONDS if cancellation.RUN_DEADLINE_SECONDS else None
+        token.deadline = deadline
+
+        # Imported here so that importing the service (and the UI) stays cheap
+        from app.graph import app as agent_app
+
+        with self.pool.lease() as browser:
+            self._set_status(run_id, RUNNING)
+            # A pooled browser must not forward events to the previous run's trace recorder
+            browser.tracer = None
+            # Launch in the requested mode; the nodes' own start() calls are then no-ops
+            browser.start(headless=headless)
+
+            if resume:
+                state, snapshot = resume
+                state = {**state, "run_id": run_id, "deadline": deadline}
+                logs = [f"⏯️ Resuming {state['resumed_from']} at step {state['current_step_index'] + 1}"]
+                try:
+                    restore_browser(browser, snapshot)
+                except Exception as e:
+                    logs.append(f"⚠️ Could not restore the browser session: {str(e)}")
+                for log in logs:
+                    self.bus.publish(run_id, "log", node="resume", text=log)
+                run_history.append_logs(run_id, logs)
+            else:
+                state = {
+                    "run_id": run_id,
+                    "task": task,
+                    "plan": [],
+                    "current_step_index": 0,
+                    "retry_count": 0,
+                    "error": None,
+                    "deadline": deadline,
+                    "logs": []
+                }
+            completed = False
+            try:
+                for event in agent_app.stream(state):
+                    node = next(iter(event))
+                    node_data = event[node] or {}
+                    state.update(node_data)
+
+                    logs = node_data.get("logs") or []
+                    for log in logs:
+                        self.bus.publish(run_id, "log", node=node, text=log)
+                    run_history.append_logs(run_id, logs)
+
+                    if node_data.get("screenshot"):
+                        image = base64.b64decode(node_data["screenshot"])
+                        run_history.add_screenshot(run_id, image)
+                        self.bus.publish(run_id, "screenshot", node=node, image=image)
+
+                    if token.cancelled:
+                        break
+
+                if not token.cancelled:
+                    # Final memory sample of the run; also frees memory before the browser is reused
+                    try:
+                        logs = browser.watchdog.check(run_id, force=True)
+                    except Exception:
+                        logs = []
+                    for log in logs:
+                        self.bus.publish(run_id, "log", node="watchdog", text=log)
+                    run_history.append_logs(run_id, logs)
+                completed = True
+            finally:
+                # Also when the graph raised: the next run must not get this run's tracer or a stuck loop
+                browser.tracer = None
+                if (token.cancelled or not completed) and not browser.reset_context():
+                    # The browser's event loop is stuck (e.g. a blocking script) - don't hand it to the next run
+                    self.pool.discard(browser)
+
+        plan = state.get("plan") or []
+        if token.cancelled:
+            self._finish(run_id, CANCELLED, f"⏹️ {token.reason}.")
+        elif plan and state.get("current_step_index", 0) >= len(plan):
+            self._finish(run_id, SUCCESS, "Task completed successfully.")
+        elif state.get("error"):
+            self._finish(run_id, FAILED, f"❌ Task failed: {state['error']}")
+        else:
+            self._finish(run_id, SUCCESS, "Task finished.")
+
+    def _finish(self, run_id, status, summary):
+        from app.tools.tracing import finish_run
+        finish_run(run_id, status)
+        checkpoint_store.mark_finished(run_id, status)
+        from app.tools.watchdog import memory_stats
+        memory = memory_stats(run_id)
+        if memory.get("peak_rss_mb"):
+            summary += f" (peak browser memory {memory['peak_rss_mb']:.0f} MB, {memory['peak_tabs']} tab(s))"
+        run_history.finish_run(run_id, status, summary)
+        self._set_status(run_id, status)
+        self.bus.publish(run_id, "done", status=status, summary=summary)
+        self.bus.close(run_id)
+        cancellation.release(run_id)
+
+
+# Global instance
+run_service = RunService()
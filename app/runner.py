@@ -0,0 +1,303 @@
+"""
+Lightweight runner for exported runs (app/exporter.py).
+
+Replays modules with Playwright's sync API and nothing else of the agent: no
+LLM, LangChain or graph import. Worker processes launch one browser each
+(BROWSER_PROFILE launch options) and run one module per fresh context, so
+large batches of scheduled regression runs only pay the browser launch once
+per worker.
+
+After each step, a popup the page opened becomes the page of the next step
+(as in the agent, see app/tools/tabs.py). The step's page is compared with
+the monitor's baseline with a pixel diff (a matching structure fingerprint
+skips it with MONITOR_STRUCTURE_SHORTCUT=1). A visual regression is reported, and fails the module with
+--strict-visual. "[assert]" checks run in one in-page evaluate, as in the
+verify node.
+
+    python -m app.runner exports/*.py [--workers 4] [--headed] [--strict-visual] [--json report.json]
+"""
+import argparse
+import concurrent.futures
+import importlib.util
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+from app.tools.assertions import ASSERTIONS_JS, parse_assertion, check_with_locator, compare_screenshot
+from app.tools.fingerprint import FINGERPRINT_JS
+from app.tools.profiles import get_profile
+from app.tools.tabs import POPUP_HINT_JS, POPUP_WAIT_MS, TAKE_POPUP_REQUESTS_JS
+
+VERIFY_TIMEOUT_MS = int(os.getenv("VERIFY_TIMEOUT_MS", "10000"))
+# Same threshold as the monitor (app/agents/monitor.py)
+VISUAL_DIFF_THRESHOLD = float(os.getenv("RUNNER_VISUAL_DIFF_THRESHOLD", "1.0"))
+REGION_DIFF_THRESHOLD = float(os.getenv("VERIFY_REGION_DIFF_THRESHOLD", "1.0"))
+# As in the monitor: trusting an unchanged structure fingerprint skips the pixel diff (opt-in)
+STRUCTURE_SHORTCUT = os.getenv("MONITOR_STRUCTURE_SHORTCUT", "0") == "1"
+
+
+class StepFailed(AssertionError):
+    def __init__(self, number, message, results):
+        super().__init__(f"Step {number}: {message}")
+        self.number = number
+        self.results = results
+
+
+class Step:
+    """One plan step: `run(page, browser_manager)` with the timeout it was recorded with."""
+    def __init__(self, number, run, timeout_ms=None, baseline=None):
+        self.number = number
+        self.run = run
+        self.timeout_ms = timeout_ms
+        self.baseline = baseline
+
+    def execute(self, manager, strict_visual=False):
+        page = manager.page
+        if self.timeout_ms:
+            page.set_default_timeout(self.timeout_ms)
+        since = len(manager.opened)
+        self.run(page, manager)
+        notes = manager.follow_popup(page, since)
+        if self.baseline and not os.path.exists(self.baseline):
+            notes.append(f"⚠️ baseline not found, visual check skipped: {self.baseline}")
+        elif self.baseline:
+            visual = _compare_with_baseline(manager.page, self.baseline)
+            notes.append(visual["actual"])
+            if not visual["passed"]:
+                if strict_visual:
+                    raise AssertionError(f"visual regression: {visual['actual']}")
+                notes[-1] = f"⚠️ visual regression: {visual['actual']}"
+        return notes
+
+
+class Check:
+    """Consecutive "[assert]" steps, evaluated in one in-page call."""
+    def __init__(self, number, assertions, regions=None, timeout_ms=VERIFY_TIMEOUT_MS):
+        self.number = number
+        self.assertions = assertions
+        # assertion position -> baseline of an "unchanged" region
+        self.regions = regions or {}
+        self.timeout_ms = timeout_ms
+
+    def execute(self, manager, strict_visual=False):
+        page = manager.page
+        parsed = [parse_assertion(text) for text in self.assertions]
+        deadline = time.monotonic() + self.timeout_ms / 1000
+        while True:
+            remaining_ms = max(0, (deadline - time.monotonic()) * 1000)
+            try:
+                results = page.evaluate(ASSERTIONS_JS, {"assertions": parsed, "timeoutMs": remaining_ms})
+                break
+            except Exception as e:
+                if "context was destroyed" not in str(e) or remaining_ms <= 0:
+                    raise
+                page.wait_for_load_state("domcontentloaded")
+        failures = []
+        for position, (assertion, result) in enumerate(zip(parsed, results)):
+            if result.get("unsupported"):
+                result = check_with_locator(page, assertion)
+            if assertion["kind"] == "unchanged" and result["passed"] and position in self.regions:
+                screenshot_bytes = page.locator(assertion["selector"]).first.screenshot(type='png')
+                result = compare_screenshot(screenshot_bytes, self.regions[position], REGION_DIFF_THRESHOLD)
+            if not result["passed"]:
+                failures.append(f"'{assertion['source']}' got {result.get('actual')}")
+        if failures:
+            raise AssertionError("; ".join(failures))
+        return [f"{len(parsed)} assertion(s) passed"]
+
+
+def _compare_with_baseline(page, baseline):
+    """The monitor's check: a pixel diff within the threshold (or the same structure fingerprint, if enabled)."""
+    fingerprint_path = baseline[:-len(".png")] + ".fp"
+    if STRUCTURE_SHORTCUT and os.path.exists(fingerprint_path):
+        with open(fingerprint_path, "r") as f:
+            if f.read().strip() == page.evaluate(FINGERPRINT_JS):
+                return {"passed": True, "actual": "page structure unchanged"}
+    return compare_screenshot(page.screenshot(type='png'), baseline, VISUAL_DIFF_THRESHOLD)
+
+
+class ReplayBrowserManager:
+    """The part of BrowserManager that generated scripts use, on a sync Playwright page."""
+    def __init__(self, page):
+        self.page = page
+        # Pages of the context in the order they opened
+        self.opened = []
+        page.context.add_init_script(POPUP_HINT_JS)
+        page.context.on("page", self.opened.append)
+
+    def get_page(self):
+        return self.page
+
+    def _find_popup(self, opener, since):
+        try:
+            requested = opener.evaluate(TAKE_POPUP_REQUESTS_JS)
+        except Exception:
+            requested = 0
+        popups = [p for p in self.opened[since:] if p.opener() == opener and not p.is_closed()]
+        if popups:
+            return popups[-1]
+        if not requested:
+            return None
+        try:
+            return opener.context.wait_for_event("page", predicate=lambda p: p.opener() == opener, timeout=POPUP_WAIT_MS)
+        except Exception:
+            return None
+
+    def follow_popup(self, opener, since):
+        """Make the popup `opener` opened since `since` the page (returns notes)."""
+        if self.page is not opener or opener.is_closed():
+            return []  # The script switched tabs itself
+        popup = self._find_popup(opener, since)
+        if popup is None:
+            return []
+        try:
+            popup.wait_for_load_state("domcontentloaded", timeout=POPUP_WAIT_MS)
+        except Exception:
+            pass
+        popup.bring_to_front()
+        self.page = popup
+        return [f"followed new tab: {popup.url}"]
+
+    def switch_to_new_tab(self):
+        if self.follow_popup(self.page, 0):
+            return {"status": "success", "output": "Switched to new tab"}
+        return {"status": "success", "output": "No new tab opened by this page - staying on the current tab"}
+
+    def iter_extract(self, schema, chunk_size=None):
+        # The extraction JS lives with BrowserManager.extract()
+        from app.tools.browser import EXTRACT_CHUNK_SIZE, EXTRACT_ROWS_JS
+        chunk_size = chunk_size or EXTRACT_CHUNK_SIZE
+        limit = schema.get("limit")
+        offset = 0
+        while True:
+            size = chunk_size if limit is None else min(chunk_size, limit - offset)
+            if size <= 0:
+                return
+            chunk = self.page.evaluate(EXTRACT_ROWS_JS, {"rows": schema.get("rows"), "fields": schema.get("fields") or {}, "offset": offset, "limit": size})
+            if chunk["rows"]:
+                yield chunk["rows"]
+            offset += len(chunk["rows"])
+            if not chunk["rows"] or offset >= chunk["total"]:
+                return
+
+    def extract(self, schema, chunk_size=None):
+        rows = []
+        for chunk in self.iter_extract(schema, chunk_size):
+            rows.extend(chunk)
+        return rows
+
+
+def run_steps(steps, page, strict_visual=False):
+    """
+    Replay exported steps on a sync Playwright page. Returns per-step results;
+    raises StepFailed (an AssertionError, so pytest reports it) at the first failure.
+    """
+    manager = ReplayBrowserManager(page)
+    results = []
+    for step in steps:
+        started = time.perf_counter()
+        try:
+            notes = step.execute(manager, strict_visual)
+        except Exception as e:
+            results.append({"step": step.number, "status": "error", "error": str(e), "duration_ms": (time.perf_counter() - started) * 1000})
+            raise StepFailed(step.number, str(e), results)
+        results.append({"step": step.number, "status": "success", "notes": notes, "duration_ms": (time.perf_counter() - started) * 1000})
+    return results
+
+
+# --- Worker processes ---
+
+_playwright = None
+_browser = None
+_profile = None
+
+
+def _init_worker(profile_name, headless):
+    global _playwright, _browser, _profile
+    from playwright.sync_api import sync_playwright
+    _profile = get_profile(profile_name)
+    _playwright = sync_playwright().start()
+    _browser = _playwright.chromium.launch(**_profile.launch_options(headless))
+
+
+def load_module(path):
+    name = "replay_" + os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_module(path, strict_visual=False):
+    """Replay one exported module in a fresh context of the worker's browser."""
+    started = time.perf_counter()
+    report = {"module": path, "status": "passed", "error": None, "steps": []}
+    context = None
+    try:
+        module = load_module(path)
+        context = _browser.new_context(**_profile.context_options())
+        report["steps"] = run_steps(module.STEPS, context.new_page(), strict_visual)
+    except StepFailed as e:
+        report.update(status="failed", error=str(e), steps=e.results)
+    except Exception as e:
+        report.update(status="failed", error=f"{type(e).__name__}: {str(e)}")
+    finally:
+        if context is not None:
+            try:
+                context.close()
+            except Exception:
+                pass
+    report["duration_s"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Replay exported runs without the agent")
+    parser.add_argument("paths", nargs="+", help="exported modules, or directories of them")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--profile", default=None, help="browser launch profile (default: BROWSER_PROFILE)")
+    parser.add_argument("--headed", action="store_true", help="show the browser windows")
+    parser.add_argument("--strict-visual", action="store_true", help="fail modules on a visual regression")
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            paths.extend(sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".py")))
+        else:
+            paths.append(path)
+    get_profile(args.profile)  # Unknown profile -> error before starting workers
+
+    started = time.perf_counter()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=max(1, min(args.workers, len(paths))),
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(args.profile, False if args.headed else True),
+    ) as pool:
+        futures = [pool.submit(run_module, path, args.strict_visual) for path in paths]
+        reports = []
+        for future in concurrent.futures.as_completed(futures):
+            report = future.result()
+            reports.append(report)
+            mark = "✅" if report["status"] == "passed" else "❌"
+            print(f"{mark} {report['module']} ({len(report['steps'])} step(s), {report['duration_s']:.1f}s)"
+                  + (f": {report['error']}" if report["error"] else ""), flush=True)
+            for step in report["steps"]:
+                for note in step.get("notes") or []:
+                    if note.startswith("⚠️"):
+                        print(f"   step {step['step']}: {note}")
+
+    failed = sum(1 for r in reports if r["status"] != "passed")
+    print(f"\n{len(reports) - failed}/{len(reports)} passed in {time.perf_counter() - started:.1f}s")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(sorted(reports, key=lambda r: r["module"]), f, indent=1)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,60 @@
+import os
+import threading
+import time
+
+from app.tools.browser import browser_instance
+
+# Modules that are only needed once the first task runs. Importing them in the
+# background while the user is still typing keeps them off the critical path.
+HEAVY_MODULES = [
+    "langchain_openai",
+    "langchain_core.messages",
+    "PIL.Image",
+    "numpy",
+    # The graph and every agent module (langgraph, prompts, ...); the first run imports
+    # it from RunService and then only waits for whatever is still loading
+    "app.graph",
+]
+
+_warm_started = False
+_warm_lock = threading.Lock()
+_preload_thread = None
+
+# Timings (seconds since process start of warm_start) for the startup benchmark
+timings = {}
+
+
+def _preload_modules():
+    import importlib
+    started = time.perf_counter()
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            # Optional at this point - the code path that needs it reports the error
+            pass
+    timings["modules_loaded"] = time.perf_counter() - started
+
+
+def warm_start(headless=None):
+    """
+    Pre-launch the browser and pre-import heavy modules in the background.
+    Safe to call repeatedly (e.g. on every Streamlit rerun); only the first call does work.
+    """
+    global _warm_started, _preload_thread
+    with _warm_lock:
+        if _warm_started:
+            return
+        _warm_started = True
+
+    started = time.perf_counter()
+    browser_instance.prewarm(headless=headless)
+    timings["prewarm_scheduled"] = time.perf_counter() - started
+
+    _preload_thread = threading.Thread(target=_preload_modules, daemon=True)
+    _preload_thread.start()
+
+
+def prewarm_enabled():
+    """Warm start is opt-in via BROWSER_PREWARM=1 (set in .env or the environment)."""
+    return os.getenv("BROWSER_PREWARM", "0").lower() in ("1", "true", "yes")
@@ -1,6 +1,8 @@
 from typing import List, Optional, TypedDict
 
 class AgentState(TypedDict):
+    run_id: str                     # Set by the planner (traces, history)
+    mode: Optional[str]             # "discover" crawls the site instead of planning (see agents/discovery.py)
     task: str                       
     plan: List[str]                 
     current_step_index: int         
@@ -11,4 +13,17 @@ class AgentState(TypedDict):
     screenshot: Optional[str]       # Now storing base64 string for Streamlit
     
     retry_count: int 
-    logs: List[str]                 # New: To display progress in UI
\ No newline at end of file
+    logs: List[str]                 # New: To display progress in UI
+    pending_fix: Optional[dict]     # Healer rewrite awaiting verification (fix memory)
+    error_class: Optional[str]      # transient / healable / fatal (see agents/triage.py)
+    transient_retries: int
+    timeout_overrides: Optional[dict]  # step index -> timeout ms (wins over learned timeouts)
+    sequential_until: Optional[int]    # Run branch-tagged steps before this index sequentially
+    deadline: Optional[float]          # Unix time after which the run is stopped (see cancellation.py)
+    resumed_from: Optional[str]        # run_id whose checkpoint this run continues (see checkpoints.py)
+    escalate_code: bool                # Regenerate the failed step with the strong model (see llm/cascade.py)
+    assertion_results: Optional[List[dict]]  # Outcome of each "[assert]" step (see agents/verify.py)
+    step_scripts: Optional[dict]       # step index -> script + timeout that completed it (see app/exporter.py)
+    step_outputs: Optional[dict]       # step index -> output of the script that completed it
+    completed_steps: Optional[List[int]]  # Steps a failed parallel group completed - skipped when it re-runs (see agents/parallel.py)
+    heal_session: Optional[dict]       # Repair conversation of the failing step (see agents/healer.py)
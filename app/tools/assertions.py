@@ -0,0 +1,217 @@
+"""
+Assertion mini-language for verification steps.
+
+The planner emits checks as "[assert] ..." steps instead of code:
+
+    [assert] url matches inventory\\.html        (also: url contains / url is)
+    [assert] title contains Swag Labs
+    [assert] visible .inventory_list
+    [assert] hidden #login-button
+    [assert] text .title contains "Products"     (also: text <selector> is <text>)
+    [assert] count .inventory_item >= 6          (==, !=, >=, <=, >, <)
+    [assert] unchanged .header_secondary_container
+
+Selectors are CSS or XPath ("//..." / "xpath=..."). All assertions of a batch
+are evaluated in one in-page call that polls until they all pass or the
+timeout runs out, and each returns {"passed", "actual"} for the diagnostics.
+"unchanged" compares an element screenshot with its baseline outside the page.
+"""
+import io
+import re
+
+ASSERT_TAG = re.compile(r'^\[assert\]\s*', re.IGNORECASE)
+
+STRING_OPS = ("matches", "contains", "is")
+QUOTED_TEXT_ASSERTION = re.compile(r'^(.+?)\s+(contains|is)\s+(["\'])(.*)\3$')
+COUNT_ASSERTION = re.compile(r'^(.+?)\s*(==|!=|>=|<=|>|<)\s*(\d+)$')
+# Python-only regex syntax: "matches" runs as a JS RegExp in the page
+PYTHON_ONLY_REGEX = re.compile(r'\(\?[aiLmsux-]+[):]|\(\?P[<=>]|\(\?#|\\[AZ]')
+
+
+def split_assertion(step: str):
+    """Returns the assertion text of an "[assert] ..." step, or None for other steps."""
+    match = ASSERT_TAG.match(step)
+    return step[match.end():].strip() if match else None
+
+
+def python_regex(pattern: str):
+    """A JS regex for Python's re: named groups (?<name>...) and \\k<name> become (?P<name>...) and (?P=name)."""
+    pattern = re.sub(r'\(\?<([A-Za-z_]\w*)>', r'(?P<\1>', pattern)
+    return re.sub(r'\\k<([A-Za-z_]\w*)>', r'(?P=\1)', pattern)
+
+
+def _unquote(value: str):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+        return value[1:-1]
+    return value
+
+
+def parse_assertion(text: str):
+    """
+    Parse one assertion into {"kind", "selector", "op", "value", "source"}.
+    Raises ValueError with what is wrong.
+    """
+    source = text.strip()
+    kind, _, rest = source.partition(" ")
+    kind, rest = kind.lower(), rest.strip()
+    assertion = {"kind": kind, "selector": None, "op": None, "value": None, "source": source}
+
+    if kind in ("url", "title"):
+        op, _, value = rest.partition(" ")
+        if op not in STRING_OPS or not value.strip():
+            raise ValueError(f"expected '{kind} matches|contains|is <value>', got '{source}'")
+        assertion.update(op=op, value=_unquote(value))
+        if op == "matches":
+            try:
+                re.compile(python_regex(assertion["value"]))
+            except re.error as e:
+                raise ValueError(f"invalid regex in '{source}': {e}")
+            python_only = PYTHON_ONLY_REGEX.search(assertion["value"])
+            if python_only:
+                raise ValueError(f"regex in '{source}' uses Python-only syntax '{python_only.group(0)}' (it runs as a JavaScript RegExp)")
+    elif kind in ("visible", "hidden", "unchanged"):
+        if not rest:
+            raise ValueError(f"expected '{kind} <selector>', got '{source}'")
+        assertion["selector"] = _unquote(rest)
+    elif kind == "text":
+        quoted = QUOTED_TEXT_ASSERTION.match(rest)
+        if quoted:
+            assertion.update(selector=_unquote(quoted.group(1)), op=quoted.group(2), value=quoted.group(4))
+            return assertion
+        for op in ("contains", "is"):
+            selector, sep, value = rest.rpartition(f" {op} ")
+            if sep and selector.strip():
+                assertion.update(selector=_unquote(selector), op=op, value=_unquote(value))
+                break
+        else:
+            raise ValueError(f"expected 'text <selector> contains|is <text>', got '{source}'")
+    elif kind == "count":
+        match = COUNT_ASSERTION.match(rest)
+        if not match:
+            raise ValueError(f"expected 'count <selector> <op> <number>', got '{source}'")
+        assertion.update(selector=_unquote(match.group(1)), op=match.group(2), value=int(match.group(3)))
+    else:
+        raise ValueError(f"unknown assertion '{kind}' in '{source}'")
+    return assertion
+
+
+def compare(actual, op, expected):
+    """Python side of the JS comparisons (locator fallback)."""
+    if op == "matches":
+        return re.search(python_regex(expected), actual) is not None
+    if op == "contains":
+        return expected in actual
+    if op == "is":
+        return actual == expected
+    return {"==": actual == expected, "!=": actual != expected, ">=": actual >= expected,
+            "<=": actual <= expected, ">": actual > expected, "<": actual < expected}[op]
+
+
+def check_with_locator(page, assertion):
+    """One assertion whose selector only Playwright understands (text=, :has-text(), ...)."""
+    locator = page.locator(assertion["selector"])
+    count = locator.count()
+    visible = locator.first.is_visible() if count else False
+    kind = assertion["kind"]
+    if kind in ("visible", "unchanged"):
+        return {"passed": visible, "actual": f"{count} match(es), first {'visible' if visible else 'hidden'}"}
+    if kind == "hidden":
+        return {"passed": not visible, "actual": f"{count} match(es), first {'visible' if visible else 'hidden'}"}
+    if kind == "count":
+        return {"passed": compare(count, assertion["op"], assertion["value"]), "actual": count}
+    if not count:
+        return {"passed": False, "actual": "no element matched"}
+    text = " ".join(locator.first.inner_text().split())
+    return {"passed": compare(text, assertion["op"], " ".join(assertion["value"].split())), "actual": text[:200]}
+
+
+def compare_screenshot(screenshot_bytes, baseline_path, threshold):
+    """Compare a PNG with a baseline file: passed if the mean pixel difference is <= threshold (%)."""
+    with open(baseline_path, "rb") as f:
+        baseline_bytes = f.read()
+    if screenshot_bytes == baseline_bytes:
+        return {"passed": True, "actual": "identical to baseline"}
+    try:
+        from PIL import Image, ImageChops
+        import numpy as np
+    except ImportError:
+        return {"passed": False, "actual": "differs from baseline (PIL/numpy not found for a tolerant diff)"}
+    current = Image.open(io.BytesIO(screenshot_bytes)).convert('RGB')
+    baseline = Image.open(io.BytesIO(baseline_bytes)).convert('RGB')
+    if current.size != baseline.size:
+        return {"passed": False, "actual": f"size {current.size[0]}x{current.size[1]}, baseline {baseline.size[0]}x{baseline.size[1]}"}
+    diff_percentage = np.mean(np.array(ImageChops.difference(current, baseline))) / 255 * 100
+    return {"passed": diff_percentage <= threshold, "actual": f"{diff_percentage:.2f}% different from baseline"}
+
+
+# Evaluates a batch of parsed assertions; polls every 100ms until all pass or timeoutMs is up.
+# Assertions with a selector the page can't query (Playwright-only syntax) come back as unsupported.
+ASSERTIONS_JS = """({ assertions, timeoutMs }) => new Promise((resolve) => {
+    const isVisible = (el) => {
+        const rect = el.getBoundingClientRect();
+        const style = getComputedStyle(el);
+        return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+    };
+    const query = (selector) => {
+        if (selector.startsWith('xpath=') || selector.startsWith('//') || selector.startsWith('(//')) {
+            const expr = selector.startsWith('xpath=') ? selector.slice(6) : selector;
+            const snapshot = document.evaluate(expr, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            return Array.from({ length: snapshot.snapshotLength }, (_, i) => snapshot.snapshotItem(i));
+        }
+        return Array.from(document.querySelectorAll(selector.startsWith('css=') ? selector.slice(4) : selector));
+    };
+    const normalize = (text) => (text || '').replace(/\\s+/g, ' ').trim();
+    const compareText = (actual, op, expected) => {
+        if (op === 'matches') {
+            try {
+                return new RegExp(expected).test(actual);
+            } catch (e) {
+                return false;  // Reported per assertion (see check) instead of failing the batch
+            }
+        }
+        if (op === 'contains') return actual.includes(expected);
+        return actual === expected;
+    };
+    const compareCount = (actual, op, expected) => ({
+        '==': actual === expected, '!=': actual !== expected, '>=': actual >= expected,
+        '<=': actual <= expected, '>': actual > expected, '<': actual < expected,
+    })[op];
+    const check = (a) => {
+        if (a.op === 'matches') {
+            try {
+                new RegExp(a.value);
+            } catch (e) {
+                return { passed: false, invalid: true, actual: `invalid JavaScript regex: ${e.message}` };
+            }
+        }
+        if (a.kind === 'url' || a.kind === 'title') {
+            const actual = a.kind === 'url' ? location.href : document.title;
+            return { passed: compareText(actual, a.op, a.value), actual };
+        }
+        let nodes;
+        try {
+            nodes = query(a.selector);
+        } catch (e) {
+            return { unsupported: true };
+        }
+        const visible = nodes.filter(isVisible);
+        const summary = `${nodes.length} match(es), ${visible.length} visible`;
+        if (a.kind === 'visible' || a.kind === 'unchanged') return { passed: visible.length > 0, actual: summary };
+        if (a.kind === 'hidden') return { passed: visible.length === 0, actual: summary };
+        if (a.kind === 'count') return { passed: compareCount(nodes.length, a.op, a.value), actual: nodes.length };
+        // text: the first visible match (or the first match)
+        const target = visible[0] || nodes[0];
+        if (!target) return { passed: false, actual: 'no element matched' };
+        const actual = normalize(target.innerText || target.textContent);
+        return { passed: compareText(actual, a.op, normalize(a.value)), actual: actual.slice(0, 200) };
+    };
+    const started = performance.now();
+    const poll = () => {
+        const results = assertions.map(check);
+        const pending = results.some((r) => !r.passed && !r.unsupported && !r.invalid);
+        if (!pending || performance.now() - started >= timeoutMs) return resolve(results);
+        setTimeout(poll, 100);
+    };
+    poll();
+})"""
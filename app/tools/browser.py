@@ -1,8 +1,25 @@
-from playwright.async_api import async_playwright
 import base64
 import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import queue
 import threading
 import sys
+import time
+import weakref
+
+from app.cancellation import wait_future
+from app.tools.assertions import ASSERTIONS_JS
+from app.tools.fingerprint import FINGERPRINT_JS
+from app.tools.profiles import get_profile
+from app.tools.sandbox import SANDBOX_ENABLED, ScriptSandbox, free_port
+from app.tools.tabs import TAB_TRACKING, TabTracker
+from app.tools.tracing import TRACE_ENABLED
+from app.tools.watchdog import MemoryWatchdog
+
+# Rows per evaluate round trip for browser_manager.extract()
+EXTRACT_CHUNK_SIZE = 500
 
 class SyncPlaywrightWrapper:
     """Wrapper that makes async Playwright objects and methods appear synchronous"""
@@ -63,8 +80,122 @@ class SyncPlaywrightWrapper:
             
         return result
 
+# Runs in the page: evaluates a declarative field schema over every row element in one call.
+# Field spec: "css" (innerText), "css@attr" (attribute/property), "@attr" / "." (the row itself),
+# or {"selector": css, "attr": name, "all": bool}.
+EXTRACT_ROWS_JS = """({ rows, fields, offset, limit }) => {
+    const parse = (spec) => {
+        if (typeof spec !== 'string') return { selector: spec.selector || '', attr: spec.attr || null, all: !!spec.all };
+        const at = spec.lastIndexOf('@');
+        if (at >= 0 && !spec.slice(at).includes(']')) return { selector: spec.slice(0, at).trim(), attr: spec.slice(at + 1), all: false };
+        return { selector: spec.trim(), attr: null, all: false };
+    };
+    const specs = Object.entries(fields).map(([name, spec]) => [name, parse(spec)]);
+    const read = (el, attr) => {
+        if (!el) return null;
+        if (!attr) return (el.innerText ?? el.textContent ?? '').trim();
+        const value = attr in el && typeof el[attr] !== 'function' ? el[attr] : el.getAttribute(attr);
+        return value === undefined ? null : value;
+    };
+    const scope = (root, selector) => (!selector || selector === '.') ? [root] : Array.from(root.querySelectorAll(selector));
+    const all = rows ? Array.from(document.querySelectorAll(rows)) : [document.documentElement];
+    const slice = all.slice(offset, offset + limit);
+    return {
+        total: all.length,
+        rows: slice.map((row) => {
+            const out = {};
+            for (const [name, spec] of specs) {
+                const matches = scope(row, spec.selector);
+                out[name] = spec.all ? matches.map((el) => read(el, spec.attr)) : read(matches[0], spec.attr);
+            }
+            return out;
+        }),
+    };
+}"""
+
+# Runs in the page: resolves many selectors at once (preflight, see agents/preflight.py).
+# Returns {results, settled}: {count, visible} per selector, or {unsupported: true} for
+# selectors the DOM APIs can't evaluate. Waits (polling every 100ms) while a "wait"
+# selector matches nothing, until graceMs after the document finished loading - or
+# maxWaitMs in all, then it is reported unsettled. CSS selectors are also resolved
+# in open shadow roots, as Playwright does.
+CHECK_SELECTORS_JS = """({ items, graceMs, maxWaitMs }) => new Promise((resolve) => {
+    const isVisible = (el) => {
+        const rect = el.getBoundingClientRect();
+        const style = getComputedStyle(el);
+        return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+    };
+    const shadowRoots = () => {
+        const roots = [];
+        const walk = (root) => {
+            for (const el of root.querySelectorAll('*')) {
+                if (el.shadowRoot) {
+                    roots.push(el.shadowRoot);
+                    walk(el.shadowRoot);
+                }
+            }
+        };
+        walk(document);
+        return roots;
+    };
+    const query = (selector, roots) => {
+        if (selector.startsWith('xpath=') || selector.startsWith('//') || selector.startsWith('(//')) {
+            const expr = selector.startsWith('xpath=') ? selector.slice(6) : selector;
+            const snapshot = document.evaluate(expr, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+            return Array.from({ length: snapshot.snapshotLength }, (_, i) => snapshot.snapshotItem(i));
+        }
+        const css = selector.startsWith('css=') ? selector.slice(4) : selector;
+        const nodes = Array.from(document.querySelectorAll(css));
+        for (const root of roots) nodes.push(...root.querySelectorAll(css));
+        // Combinators across a shadow boundary only match in Playwright - don't guess
+        if (!nodes.length && roots.length) throw new Error('shadow DOM');
+        return nodes;
+    };
+    const resolveOne = ({ selector }, roots) => {
+        try {
+            const nodes = query(selector, roots);
+            return { count: nodes.length, visible: nodes.filter(isVisible).length };
+        } catch (e) {
+            return { unsupported: true };
+        }
+    };
+    const started = performance.now();
+    let loadedAt = null;
+    const check = () => {
+        const now = performance.now();
+        if (loadedAt === null && document.readyState === 'complete') loadedAt = now;
+        const roots = shadowRoots();
+        const results = items.map((item) => resolveOne(item, roots));
+        const waiting = results.some((r, i) => items[i].wait && !r.unsupported && r.count === 0);
+        const settled = loadedAt !== null && now - loadedAt >= graceMs;
+        if (!waiting || settled || now - started >= maxWaitMs) return resolve({ results, settled: !waiting || settled });
+        setTimeout(check, 100);
+    };
+    check();
+})"""
+
+class _PageScopedManager:
+    """browser_manager as seen by a script running on a non-active page (parallel branches)"""
+    def __init__(self, manager, page):
+        self._manager = manager
+        self._page = page
+
+    def extract(self, schema, chunk_size=None):
+        return self._manager.extract(schema, chunk_size=chunk_size, page=self._page)
+
+    def iter_extract(self, schema, chunk_size=None):
+        return self._manager.iter_extract(schema, chunk_size=chunk_size, page=self._page)
+
+    async def extract_async(self, schema, chunk_size=None):
+        return await self._manager.extract_async(schema, chunk_size=chunk_size, page=self._page)
+
+    def __getattr__(self, name):
+        return getattr(self._manager, name)
+
 class BrowserManager:
-    def __init__(self):
+    def __init__(self, profile=None):
+        # Launch flags, viewport and default headless mode (see app/tools/profiles.py)
+        self.profile = get_profile(profile)
         self._playwright = None
         self._browser = None
         self._context = None
@@ -72,6 +203,28 @@ class BrowserManager:
         self.page = None
         self._loop = None
         self._loop_thread = None
+        self._warm_future = None
+        # Status of the last main-frame navigation response (set by page listeners)
+        self.last_navigation = None
+        # Structural fingerprint cache, invalidated on navigation / page switch / script run
+        self._nav_serial = 0
+        self._fingerprint_cache = None
+        # Trace recorder of the run being executed (see app/tools/tracing.py)
+        self.tracer = None
+        # Sandboxed script execution (see app/tools/sandbox.py)
+        self.cdp_endpoint = None
+        self._sandbox = None
+        self._sandbox_worker = False
+        self._step_timeouts = None
+        self._launched_headless = None
+        self._target_ids = weakref.WeakKeyDictionary()
+        # Pages that already have their navigation / trace listeners (attached once per page)
+        self._watched_pages = weakref.WeakSet()
+        self._traced_pages = weakref.WeakSet()
+        # Memory sampling, stale tab cleanup and context recycling (see app/tools/watchdog.py)
+        self.watchdog = MemoryWatchdog(self)
+        # Ordered tab registry, popup following and abandoned tab cleanup (see app/tools/tabs.py)
+        self.tabs = TabTracker(self)
 
     def _get_or_create_loop(self):
         """Get or create an event loop in a separate thread for async Playwright"""
@@ -102,39 +255,70 @@ class BrowserManager:
         return self._loop
 
     def _run_async(self, coro):
-        """Run an async coroutine in the dedicated event loop"""
+        """
+        Run an async coroutine in the dedicated event loop. If the current run is
+        cancelled (or hits its deadline) while waiting, the coroutine is cancelled
+        and RunCancelled is raised (see app/cancellation.py).
+        """
         loop = self._get_or_create_loop()
         future = asyncio.run_coroutine_threadsafe(coro, loop)
-        return future.result()
+        return wait_future(future)
+
+    async def _launch(self, headless=None):
+        """Start Playwright and launch Chromium (runs on the browser loop)"""
+        if self._playwright is None:
+            # Imported here so that importing the agent modules stays cheap
+            from playwright.async_api import async_playwright
+            self._playwright = await async_playwright().start()
+
+        if self._browser is None:
+            options = self.profile.launch_options(headless)
+            if SANDBOX_ENABLED:
+                # Sandbox workers attach to this browser over CDP
+                port = free_port()
+                options["args"].append(f'--remote-debugging-port={port}')
+                self.cdp_endpoint = f"http://127.0.0.1:{port}"
+            self._browser = await self._playwright.chromium.launch(**options)
+            self._launched_headless = options["headless"]
+
+    def prewarm(self, headless=None):
+        """
+        Launch the event loop, Playwright and Chromium in the background.
+        Returns immediately; the next start() call waits for the launch to finish
+        instead of paying for it on the first step.
+        """
+        if self._browser is not None or self._warm_future is not None:
+            return self._warm_future
+        loop = self._get_or_create_loop()
+        self._warm_future = asyncio.run_coroutine_threadsafe(self._launch(headless), loop)
+        return self._warm_future
 
-    def start(self, headless=False):
-        """Start the browser if not already running"""
+    def start(self, headless=None):
+        """Start the browser if not already running (headless=None: the profile's default)"""
         if self.page:
             return
 
-        if self._playwright is None:
-            self._playwright = self._run_async(async_playwright().start())
-            
-        if self._browser is None:
-            self._browser = self._run_async(self._playwright.chromium.launch(
-                headless=headless,
-                args=[
-                    '--disable-blink-features=AutomationControlled',
-                    '--disable-dev-shm-usage',
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                    '--start-maximized' # Added from snippet
-                ]
-            ))
+        if self._warm_future is not None:
+            warm_future, self._warm_future = self._warm_future, None
+            try:
+                warm_future.result()
+            except Exception:
+                # Prewarm failed (e.g. browsers not installed yet) - launch normally below
+                pass
+
+        if self._browser is not None and self._context is None and headless is not None and headless != self._launched_headless:
+            # Prewarmed (or left idle) in the other mode - relaunch the way this run asked for
+            self._run_async(self._browser.close())
+            self._browser = None
+
+        if self._playwright is None or self._browser is None:
+            self._run_async(self._launch(headless))
             
         # Create context if it doesn't exist
         if self._context is None:
-            context_options = {}
-            
-            # Set viewport for consistency
-            context_options['viewport'] = {'width': 1920, 'height': 1080}
-
-            self._context = self._run_async(self._browser.new_context(**context_options))
+            self._context = self._run_async(self._browser.new_context(**self.profile.context_options()))
+            if TAB_TRACKING:
+                self._run_async(self.tabs.attach(self._context))
             
             # Wrap context
             self._context = SyncPlaywrightWrapper(self._context, self._run_async)
@@ -147,25 +331,337 @@ class BrowserManager:
             self._async_page.set_default_timeout(30000)
             # Use domcontentloaded for faster navigation
             self._async_page.set_default_navigation_timeout(30000)
+            self._watch_page(self._async_page)
             
             # Create sync wrapper for the page
             self.page = SyncPlaywrightWrapper(self._async_page, self._run_async)
             
             return self._playwright, self._browser, self._async_page, self._context
 
+    def _watch_page(self, async_page):
+        """Attach listeners that record main-frame navigations and their responses"""
+        if async_page in self._watched_pages:
+            return
+        self._watched_pages.add(async_page)
+        def _on_response(response):
+            try:
+                if response.request.is_navigation_request() and response.frame.parent_frame is None:
+                    self.last_navigation = {"url": response.url, "status": response.status}
+            except Exception:
+                pass
+
+        def _on_navigated(frame):
+            if frame.parent_frame is None:
+                self._nav_serial += 1
+
+        async_page.on("response", _on_response)
+        async_page.on("framenavigated", _on_navigated)
+        if TRACE_ENABLED:
+            self._trace_page(async_page)
+
+    def _trace_page(self, async_page):
+        """Forward network and console events to the active trace recorder (if any)"""
+        if async_page in self._traced_pages:
+            return
+        self._traced_pages.add(async_page)
+        def _on_traced_response(response):
+            tracer = self.tracer
+            if tracer is None:
+                return
+            try:
+                request = response.request
+                timing = request.timing or {}
+                ttfb = timing.get("responseStart", -1)
+                tracer.network(request.method, response.url, response.status, request.resource_type,
+                               duration_ms=ttfb if ttfb >= 0 else None)
+            except Exception:
+                pass
+
+        def _on_request_failed(request):
+            tracer = self.tracer
+            if tracer is not None:
+                tracer.network(request.method, request.url, None, request.resource_type, failure=request.failure)
+
+        def _on_console(message):
+            tracer = self.tracer
+            if tracer is not None and message.type in ("error", "warning"):
+                tracer.console(message.type, message.text)
+
+        def _on_page_error(error):
+            tracer = self.tracer
+            if tracer is not None:
+                tracer.console("pageerror", str(error))
+
+        async_page.on("response", _on_traced_response)
+        async_page.on("requestfailed", _on_request_failed)
+        async_page.on("console", _on_console)
+        async_page.on("pageerror", _on_page_error)
+
+    def screenshot_jpeg(self, quality=40):
+        """Small JPEG of the active page's viewport (trace frames), or None"""
+        if not self._async_page:
+            return None
+        try:
+            return self._run_async(self._async_page.screenshot(type="jpeg", quality=quality, scale="css"))
+        except Exception:
+            return None
+
+    def fingerprint(self):
+        """
+        Structural fingerprint of the active page (DOM skeleton + form fields, no text).
+        Cached until the next navigation, page switch or script execution.
+        """
+        if not self._async_page:
+            return None
+        key = (id(self._async_page), self._nav_serial)
+        if self._fingerprint_cache and self._fingerprint_cache[0] == key:
+            return self._fingerprint_cache[1]
+        try:
+            value = self._run_async(self._async_page.evaluate(FINGERPRINT_JS))
+        except Exception:
+            return None
+        self._fingerprint_cache = (key, value)
+        return value
+
+    def detect_blocker(self):
+        """Return 'captcha' if the current page is a CAPTCHA/bot challenge, else None"""
+        if not self._async_page:
+            return None
+
+        async def _detect():
+            return await self._async_page.evaluate("""() => {
+                // Only a challenge on screen counts: many login pages load the invisible
+                // reCAPTCHA v3 badge (.g-recaptcha, recaptcha anchor iframe) without ever challenging
+                const onScreen = (el) => {
+                    const rect = el.getBoundingClientRect();
+                    if (rect.width < 10 || rect.height < 10) return false;
+                    if (rect.bottom <= 0 || rect.right <= 0 || rect.top >= innerHeight || rect.left >= innerWidth) return false;
+                    for (let node = el; node; node = node.parentElement) {
+                        const style = getComputedStyle(node);
+                        if (style.visibility === 'hidden' || style.display === 'none' || style.opacity === '0') return false;
+                    }
+                    return true;
+                };
+                const challenges = 'iframe[src*="recaptcha/api2/bframe"], iframe[src*="recaptcha/enterprise/bframe"],'
+                    + ' iframe[src*="hcaptcha"][src*="frame=challenge"], iframe[src*="challenges.cloudflare.com"], form[action*="captcha" i]';
+                if (Array.from(document.querySelectorAll(challenges)).some(onScreen)) return 'captcha';
+                // Cloudflare interstitial
+                if (document.querySelector('#challenge-form, #cf-challenge-running, #challenge-running')) return 'captcha';
+                const title = (document.title || '').toLowerCase();
+                if (title.includes('captcha') || title.includes('just a moment') || title.includes('attention required')) return 'captcha';
+                return null;
+            }""")
+
+        try:
+            return self._run_async(_detect())
+        except Exception:
+            return None
+
+    def run_async(self, coro):
+        """Run a coroutine that uses the async Playwright API on the browser's event loop"""
+        return self._run_async(coro)
+
+    @property
+    def async_context(self):
+        """The underlying async BrowserContext (for code that runs on the browser loop)"""
+        return self._context._obj if self._context else None
+
+    def driver_pid(self):
+        """Pid of the Playwright driver process (the launched Chromium runs below it), or None"""
+        try:
+            return self._playwright._impl_obj._connection._transport._proc.pid
+        except AttributeError:
+            return None
+
+    def recycle_context(self, storage_state=None, url=None):
+        """
+        Replace the browser context with a fresh one that has the same cookies and
+        localStorage, reopened at the active page's URL. Frees renderer memory
+        held by long sessions; other tabs and in-page state are dropped.
+        `storage_state`/`url` restore a saved session instead (checkpoint resume).
+        """
+        if not self._context:
+            return
+
+        async def _recycle():
+            old_context = self._context._obj
+            target_url = url or (self._async_page.url if self._async_page else None)
+            state = storage_state or await old_context.storage_state()
+            context = await self._browser.new_context(**self.profile.context_options(), storage_state=state)
+            if TAB_TRACKING:
+                await self.tabs.attach(context)
+            async_page = await context.new_page()
+            await old_context.close()
+            if target_url and target_url.startswith("http"):
+                await async_page.goto(target_url, wait_until="domcontentloaded")
+            return context, async_page
+
+        context, async_page = self._run_async(_recycle())
+        self._context = SyncPlaywrightWrapper(context, self._run_async)
+        self._async_page = async_page
+        timeout_ms, navigation_timeout_ms = self._step_timeouts or (30000, 30000)
+        async_page.set_default_timeout(timeout_ms)
+        async_page.set_default_navigation_timeout(navigation_timeout_ms)
+        self._watch_page(async_page)
+        self._nav_serial += 1
+        self.page = SyncPlaywrightWrapper(async_page, self._run_async)
+
+    def set_step_timeout(self, timeout_ms, navigation_timeout_ms=None, page=None):
+        """
+        Apply the default action/navigation timeouts for the next step on the active
+        page, or on `page` (a page from new_page(), e.g. a parallel branch's tab)
+        """
+        if page is not None:
+            async_page = page._obj
+        else:
+            self._step_timeouts = (timeout_ms, navigation_timeout_ms or timeout_ms)
+            async_page = self._async_page
+        if not async_page:
+            return
+        # Both setters are synchronous in the async API
+        async_page.set_default_timeout(timeout_ms)
+        async_page.set_default_navigation_timeout(navigation_timeout_ms or timeout_ms)
+
+    async def _extract_chunks(self, async_page, schema, chunk_size):
+        """Async generator of row chunks; the first evaluate also returns the total row count"""
+        rows = schema.get("rows")
+        fields = schema.get("fields") or {}
+        limit = schema.get("limit")
+        offset = 0
+        while True:
+            size = chunk_size if limit is None else min(chunk_size, limit - offset)
+            if size <= 0:
+                return
+            chunk = await async_page.evaluate(EXTRACT_ROWS_JS, {"rows": rows, "fields": fields, "offset": offset, "limit": size})
+            if chunk["rows"]:
+                yield chunk["rows"]
+            offset += len(chunk["rows"])
+            if not chunk["rows"] or offset >= chunk["total"]:
+                return
+
+    def iter_extract(self, schema, chunk_size=None, page=None):
+        """
+        Stream extract() results in chunks of `chunk_size` rows (one evaluate per chunk)
+        for large result sets.
+        """
+        if self._loop_thread is not None and threading.current_thread() is self._loop_thread:
+            raise RuntimeError("In scripts that use 'await', call 'await browser_manager.extract_async(schema)' instead.")
+        async_page = page._obj if page else self._async_page
+        chunks = self._extract_chunks(async_page, schema, chunk_size or EXTRACT_CHUNK_SIZE)
+        while True:
+            try:
+                yield self._run_async(chunks.__anext__())
+            except StopAsyncIteration:
+                return
+
+    def extract(self, schema, chunk_size=None, page=None):
+        """
+        Bulk data extraction in one round trip instead of per-element inner_text()/get_attribute() calls.
+        
+        schema = {
+            "rows": ".s-result-item",            # one row per matching element (omit for a single page-level row)
+            "fields": {
+                "title": "h2 a",                 # innerText of the first match inside the row
+                "link": "h2 a@href",             # attribute/property
+                "asin": "@data-asin",            # attribute of the row element itself
+                "tags": {"selector": ".tag", "all": True},  # list of all matches
+            },
+            "limit": 100,                        # optional max rows
+        }
+        Returns a list of dicts. Result sets larger than `chunk_size` are fetched in chunks.
+        """
+        rows = []
+        for chunk in self.iter_extract(schema, chunk_size=chunk_size, page=page):
+            rows.extend(chunk)
+        return rows
+
+    async def extract_async(self, schema, chunk_size=None, page=None):
+        """extract() for scripts that use 'await'"""
+        async_page = page._obj if page else self._async_page
+        rows = []
+        async for chunk in self._extract_chunks(async_page, schema, chunk_size or EXTRACT_CHUNK_SIZE):
+            rows.extend(chunk)
+        return rows
+
+    def check_selectors(self, items, grace_ms=0, max_wait_ms=None):
+        """
+        Resolve [{"selector": ..., "wait": bool}] on the active page in one evaluate.
+        Returns {"results": [{"count", "visible"} or {"unsupported": True}] in the same
+        order, "settled"}; settled is False if a "wait" selector still matched nothing
+        before the page had loaded for grace_ms (giving up after max_wait_ms).
+        """
+        if not self._async_page or not items:
+            return {"results": [], "settled": True}
+        max_wait_ms = grace_ms * 2 if max_wait_ms is None else max_wait_ms
+        return self._run_async(self._async_page.evaluate(
+            CHECK_SELECTORS_JS, {"items": items, "graceMs": grace_ms, "maxWaitMs": max_wait_ms}
+        ))
+
+    def check_assertions(self, assertions, timeout_ms=0):
+        """
+        Evaluate parsed assertions (see app/tools/assertions.py) on the active page in
+        one evaluate that polls until they all pass or timeout_ms is up. A navigation
+        during the wait restarts the evaluate on the new document with the time left.
+        """
+        if not self._async_page or not assertions:
+            return []
+
+        async def _check():
+            deadline = time.monotonic() + timeout_ms / 1000
+            while True:
+                remaining_ms = max(0, (deadline - time.monotonic()) * 1000)
+                try:
+                    return await self._async_page.evaluate(ASSERTIONS_JS, {"assertions": assertions, "timeoutMs": remaining_ms})
+                except Exception as e:
+                    if "context was destroyed" not in str(e) or remaining_ms <= 0:
+                        raise
+                    await self._async_page.wait_for_load_state("domcontentloaded")
+
+        return self._run_async(_check())
+
+    def new_page(self):
+        """Open an extra page in the shared context (same cookies/session) and return it wrapped"""
+        if not self._context:
+            raise RuntimeError("Browser not started. Call start() first.")
+        async_page = self._run_async(self._context._obj.new_page())
+        self.tabs.pin(async_page)
+        async_page.set_default_timeout(30000)
+        async_page.set_default_navigation_timeout(30000)
+        if TRACE_ENABLED:
+            self._trace_page(async_page)
+        return SyncPlaywrightWrapper(async_page, self._run_async)
+
     def get_page(self):
         """Return the current page object"""
         return self.page
 
     def set_active_page(self, page_wrapper):
         """Set the currently active page for the browser manager"""
+        self._watch_page(page_wrapper._obj)
         self.page = page_wrapper
         self._async_page = page_wrapper._obj
 
+    def activate_page(self, async_page):
+        """Bring an async page to the front and make it the active page"""
+        self._run_async(async_page.bring_to_front())
+        self.set_active_page(SyncPlaywrightWrapper(async_page, self._run_async))
+        if self._step_timeouts:
+            self.set_step_timeout(*self._step_timeouts)
+
     def switch_to_new_tab(self):
-        """Switch to the last opened tab/page"""
+        """
+        Switch to the tab the active page opened, waiting for it if it is still on
+        its way. Steps rarely need this: popups are followed after every step.
+        """
         if not self._context:
             return {"status": "error", "error": "No browser context found"}
+
+        if TAB_TRACKING and not self._sandbox_worker:
+            popup = self._run_async(self.tabs.find_popup(self._async_page))
+            if popup is None:
+                return {"status": "success", "output": "No new tab opened by this page - staying on the current tab"}
+            self.activate_page(popup)
+            return {"status": "success", "output": f"Switched to new tab. Total tabs: {len(self.tabs.pages())}"}
         
         async def _switch():
             pages = self._context.pages
@@ -182,10 +678,103 @@ class BrowserManager:
         else:
             return {"status": "error", "error": "No pages found to switch to"}
 
-    def execute_script(self, script_code: str):
+    def attach_over_cdp(self, endpoint):
+        """Connect to an already running browser (sandbox worker processes)"""
+        async def _attach():
+            from playwright.async_api import async_playwright
+            self._playwright = await async_playwright().start()
+            self._browser = await self._playwright.chromium.connect_over_cdp(endpoint)
+        self._run_async(_attach())
+        self._sandbox_worker = True
+
+    async def _target_id(self, async_page):
+        """CDP target id of a page - identifies the same tab across Playwright connections"""
+        target_id = self._target_ids.get(async_page)
+        if target_id is None:
+            session = await async_page.context.new_cdp_session(async_page)
+            try:
+                target_id = (await session.send("Target.getTargetInfo"))["targetInfo"]["targetId"]
+            finally:
+                await session.detach()
+            self._target_ids[async_page] = target_id
+        return target_id
+
+    def page_target_id(self, page=None):
+        async_page = page._obj if page else self._async_page
+        return self._run_async(self._target_id(async_page)) if async_page else None
+
+    def select_target(self, target_id):
+        """Make the page with this CDP target id the active page"""
+        async def _find():
+            for context in self._browser.contexts:
+                for async_page in context.pages:
+                    if await self._target_id(async_page) == target_id:
+                        return context, async_page
+            return None, None
+
+        context, async_page = self._run_async(_find())
+        if async_page is None:
+            raise RuntimeError(f"Page {target_id} not found in the browser")
+        if self._context is None or self._context._obj is not context:
+            self._context = SyncPlaywrightWrapper(context, self._run_async)
+        self._async_page = async_page
+        self.page = SyncPlaywrightWrapper(async_page, self._run_async)
+
+    def _execute_sandboxed(self, script_code, page=None):
+        """execute_script() in a sandbox worker process attached to this browser over CDP"""
+        if self._sandbox is None:
+            self._sandbox = ScriptSandbox()
+        target_id = self.page_target_id(page)
+        result = self._sandbox.run(self.cdp_endpoint, target_id, script_code, self._step_timeouts)
+
+        active_target = result.pop("active_target", None)
+        if page is None and active_target and active_target != target_id:
+            # The script switched tabs in the worker - follow it here
+            for async_page in self._context._obj.pages:
+                if self._run_async(self._target_id(async_page)) == active_target:
+                    self.set_active_page(SyncPlaywrightWrapper(async_page, self._run_async))
+                    break
+
+        if result["status"] != "success" and "screenshot" not in result:
+            # The worker was killed before it could take one
+            failed_page = page._obj if page else self._async_page
+            try:
+                result["screenshot"] = base64.b64encode(self._run_async(failed_page.screenshot())).decode('utf-8')
+            except Exception:
+                pass
+        return result
+
+    def execute_script(self, script_code: str, page=None):
+        """
+        Run a generated script against the active page, or against `page`
+        (a wrapped page from new_page(), used for parallel branches).
+        With SCRIPT_SANDBOX=1 the script runs in a worker process instead.
+        After a successful step on the active page, a popup it opened becomes
+        the active page (result["tab_logs"] says what was done).
+        """
+        if page is not None or not TAB_TRACKING or self._sandbox_worker or not self.page:
+            return self._execute_script(script_code, page)
+        start_page, since_serial = self._async_page, self.tabs.serial
+        result = self._execute_script(script_code)
+        if result["status"] == "success":
+            try:
+                result["tab_logs"] = self.tabs.after_step(start_page, since_serial)
+            except Exception as e:
+                result["tab_logs"] = [f"⚠️ Tab tracking failed: {str(e)}"]
+        return result
+
+    def _execute_script(self, script_code, page=None):
         if not self.page:
             raise RuntimeError("Browser not started. Call start() first.")
         
+        # The script may change the DOM without navigating
+        self._fingerprint_cache = None
+        
+        if SANDBOX_ENABLED and not self._sandbox_worker and self.cdp_endpoint:
+            return self._execute_sandboxed(script_code, page)
+        # Scripts for a specific page see a browser_manager whose helpers target that page
+        manager = _PageScopedManager(self, page) if page else self
+        
         # Clean script code - remove any leading/trailing whitespace
         script_code = script_code.strip()
         
@@ -198,7 +787,7 @@ class BrowserManager:
                 async def _execute_async():
                     """Execute script in async context with async page"""
                     # Capture page in closure for explicit access
-                    page_obj = self._async_page
+                    page_obj = page._obj if page else self._async_page
                     
                     # Find minimum indentation (if any) to normalize
                     lines = script_code.split('\n')
@@ -222,7 +811,7 @@ class BrowserManager:
                             wrapped_code += "\n"
                     
                     # Create globals dict with page injected
-                    globals_dict = {'_page_inject': page_obj, 'browser_manager': self}
+                    globals_dict = {'_page_inject': page_obj, 'browser_manager': manager}
                     locals_dict = {}
                     # Execute the wrapped async code to define the function
                     exec(wrapped_code, globals_dict, locals_dict)
@@ -234,15 +823,17 @@ class BrowserManager:
             else:
                 # Execute script with sync wrapper (no await needed)
                 # Execute directly with page in globals
-                globals_dict = {'page': self.page, 'browser_manager': self}
+                globals_dict = {'page': page or self.page, 'browser_manager': manager}
                 exec(script_code, globals_dict, {})
                 result = {"status": "success", "output": "Step completed"}
             
             return result
         except Exception as e:
             # Capture screenshot on failure
+            failed_page = page._obj if page else self._async_page
+            
             async def _screenshot():
-                screenshot_bytes = await self._async_page.screenshot()
+                screenshot_bytes = await failed_page.screenshot()
                 screenshot_b64 = base64.b64encode(screenshot_bytes).decode('utf-8')
                 return {
                     "status": "error", 
@@ -252,7 +843,31 @@ class BrowserManager:
             
             return self._run_async(_screenshot())
 
+    def reset_context(self, timeout=5):
+        """
+        Close the browser context after a cancelled or failed run so the next run starts from a
+        clean page. Returns False if the event loop did not respond in time (e.g. a
+        generated script is blocking it), in which case the manager should be discarded.
+        """
+        if not self._context or not self._loop or self._loop.is_closed():
+            return True
+        # Not _run_async: the caller's run is cancelled, so that would give up immediately
+        future = asyncio.run_coroutine_threadsafe(self._context._obj.close(), self._loop)
+        try:
+            future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            return False
+        except Exception:
+            pass
+        self._context = None
+        self._async_page = None
+        self.page = None
+        self._fingerprint_cache = None
+        return True
+
     def close(self):
+        if self._sandbox:
+            self._sandbox.recycle()
         if self._browser:
             async def _close():
                 if self._context:
@@ -276,6 +891,7 @@ class BrowserManager:
                 self._playwright = None
                 self._async_page = None
                 self.page = None
+                self._warm_future = None
             
             if self._loop and not self._loop.is_closed():
                 try:
@@ -289,5 +905,85 @@ class BrowserManager:
                     self._loop.close()
                 self._loop = None
 
+# Browser leased to the run executing in this context (see BrowserPool.lease)
+_current_browser = contextvars.ContextVar("current_browser", default=None)
+
+# Used outside of pooled runs (CLI, tests, warm start)
+_default_browser = BrowserManager()
+
+def current_browser():
+    """The BrowserManager of the current run, or the default instance"""
+    return _current_browser.get() or _default_browser
+
+class _BrowserProxy:
+    """Module-level `browser_instance` that resolves to current_browser() on every access"""
+    def __getattr__(self, name):
+        return getattr(current_browser(), name)
+
+    def __setattr__(self, name, value):
+        setattr(current_browser(), name, value)
+
+class BrowserPool:
+    """
+    Up to `size` browsers shared by concurrent runs. Each run leases one for its
+    whole duration; the default instance (possibly prewarmed) is handed out first.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = []
+        # The discarded managers themselves (ids are reused once an object is collected)
+        self._discarded = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._created) < self.size:
+                default_free = _default_browser not in self._created and _default_browser not in self._discarded
+                manager = _default_browser if default_free else BrowserManager()
+                self._created.append(manager)
+                return manager
+        return self._idle.get(timeout=timeout)
+
+    def release(self, manager):
+        if manager not in self._discarded:
+            self._idle.put(manager)
+
+    def discard(self, manager):
+        """Drop a stuck browser from the pool (a fresh one takes its slot) and close it in the background"""
+        with self._lock:
+            self._discarded.add(manager)
+            if manager in self._created:
+                self._created.remove(manager)
+        threading.Thread(target=manager.close, daemon=True).start()
+
+    @contextlib.contextmanager
+    def lease(self, timeout=None):
+        """Acquire a browser and make it `browser_instance` for code running in this context"""
+        manager = self.acquire(timeout)
+        token = _current_browser.set(manager)
+        try:
+            yield manager
+        finally:
+            _current_browser.reset(token)
+            self.release(manager)
+
+    def close_idle(self):
+        """Close the browsers that are not leased right now (they relaunch on next use)"""
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for manager in idle:
+            manager.close()
+            self._idle.put(manager)
+        return len(idle)
+
 # Global instance
-browser_instance = BrowserManager()
\ No newline at end of file
+browser_instance = _BrowserProxy()
\ No newline at end of file
@@ -0,0 +1,40 @@
+"""
+Structural page fingerprint.
+
+A cheap hash of the page's DOM skeleton (tag/role/type sequence with depth)
+plus its form fields, computed in-page and ignoring all text. Two loads of the
+same page template produce the same fingerprint even if the content differs,
+which lets the monitor, healer and discovery skip repeated work.
+"""
+
+# JS function expression (usable with page.evaluate or embedded in other scripts)
+FINGERPRINT_JS = """() => {
+    // Two FNV-1a 32-bit hashes with different offsets -> 64-bit fingerprint
+    let h1 = 0x811c9dc5, h2 = 0x01000193 ^ 0x5bd1e995;
+    const feed = (str) => {
+        for (let i = 0; i < str.length; i++) {
+            const c = str.charCodeAt(i);
+            h1 = Math.imul(h1 ^ c, 0x01000193) >>> 0;
+            h2 = Math.imul(h2 ^ c, 0x01000193 + 2) >>> 0;
+        }
+    };
+    let count = 0;
+    const walk = (node, depth) => {
+        if (depth > 14 || count > 5000) return;
+        for (const child of node.children) {
+            const tag = child.tagName;
+            if (tag === 'SCRIPT' || tag === 'STYLE' || tag === 'NOSCRIPT' || tag === 'TEMPLATE') continue;
+            count++;
+            feed(tag + '|' + (child.getAttribute('role') || '') + '|' + (child.getAttribute('type') || '') + '|' + depth + ';');
+            walk(child, depth + 1);
+        }
+    };
+    walk(document.body || document.documentElement, 0);
+    for (const form of document.forms) {
+        feed('form:');
+        for (const field of form.elements) {
+            feed((field.getAttribute('name') || '') + ':' + (field.getAttribute('type') || field.tagName) + ',');
+        }
+    }
+    return h1.toString(16).padStart(8, '0') + h2.toString(16).padStart(8, '0');
+}"""
@@ -0,0 +1,168 @@
+"""
+Persistent memory of fixes that worked, for the healer.
+
+Entries are keyed by (normalized error signature, failing selector, domain).
+When the same failure shows up again the remembered rewrite is replayed
+directly, without an LLM call. Fixes for the same error signature elsewhere
+are offered to the LLM as few-shot examples.
+"""
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from app.config import DATA_DIR
+
+FIX_MEMORY_PATH = os.path.join(DATA_DIR, "fix_memory.json")
+MAX_ENTRIES = 500
+
+# Playwright methods whose first argument is a selector
+_SELECTOR_CALL = re.compile(
+    r"\.(?:locator|click|fill|type|press|check|uncheck|hover|dblclick|select_option|"
+    r"wait_for_selector|query_selector|query_selector_all|inner_text|text_content|get_attribute|is_visible)"
+    r"\(\s*(['\"])(.+?)\1"
+)
+_ERROR_LOCATOR = re.compile(r"locator\((['\"])(.+?)\1\)")
+
+
+def error_signature(error: str) -> str:
+    """
+    Normalize a Playwright error into a stable signature: first line only,
+    quoted values and numbers replaced, whitespace collapsed.
+    e.g. 'Locator.click: Timeout 30000ms exceeded.' -> 'locator.click: timeout <n>ms exceeded.'
+    """
+    first_line = (error or "").strip().split("\n")[0]
+    sig = re.sub(r"(['\"]).*?\1", "<s>", first_line)
+    sig = re.sub(r"\d+", "<n>", sig)
+    sig = re.sub(r"\s+", " ", sig).strip().lower()
+    return sig[:160]
+
+
+def failing_selector(error: str, script: str) -> str:
+    """The selector that failed: taken from the error's locator(...) if present, else the script's first selector."""
+    match = _ERROR_LOCATOR.search(error or "")
+    if match:
+        return match.group(2)
+    match = _SELECTOR_CALL.search(script or "")
+    if match:
+        return match.group(2)
+    return ""
+
+
+def domain_of(url: str) -> str:
+    return urlparse(url or "").netloc.lower()
+
+
+def make_key(error: str, script: str, url: str):
+    """Returns (key, signature, selector, domain) for a failure."""
+    sig = error_signature(error)
+    selector = failing_selector(error, script)
+    domain = domain_of(url)
+    return f"{sig}|{selector}|{domain}", sig, selector, domain
+
+
+class FixMemory:
+    def __init__(self, path=FIX_MEMORY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._data.setdefault("entries", {})
+            self._data.setdefault("stats", {"lookups": 0, "hits": 0, "hit_successes": 0, "llm_fixes": 0, "llm_successes": 0})
+        return self._data
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def lookup(self, key: str):
+        """Return the remembered fixed script for this failure key, or None."""
+        with self._lock:
+            data = self._load()
+            data["stats"]["lookups"] += 1
+            entry = data["entries"].get(key)
+            if entry and entry["successes"] > entry["failures"]:
+                data["stats"]["hits"] += 1
+                entry["last_used"] = time.time()
+                self._save()
+                return entry["fixed_script"]
+            self._save()
+            return None
+
+    def examples(self, signature: str, limit: int = 2):
+        """Successful fixes for the same error signature (any selector/domain), best first."""
+        with self._lock:
+            entries = [
+                e for e in self._load()["entries"].values()
+                if e["signature"] == signature and e["successes"] > e["failures"]
+            ]
+        entries.sort(key=lambda e: (e["successes"] - e["failures"], e["last_used"]), reverse=True)
+        return entries[:limit]
+
+    def record_success(self, fix: dict, fixed_script: str):
+        """A fix produced by the healer (`fix` is the state's pending_fix) passed - remember it."""
+        with self._lock:
+            data = self._load()
+            stats = data["stats"]
+            stats["hit_successes" if fix.get("from_memory") else "llm_successes"] += 1
+            entry = data["entries"].get(fix["key"])
+            if entry is None or entry["fixed_script"] != fixed_script:
+                entry = {
+                    "signature": fix["signature"],
+                    "selector": fix["selector"],
+                    "domain": fix["domain"],
+                    "failed_script": fix["failed_script"],
+                    "fixed_script": fixed_script,
+                    "successes": 0,
+                    "failures": 0,
+                }
+                data["entries"][fix["key"]] = entry
+            entry["successes"] += 1
+            entry["last_used"] = time.time()
+            self._evict()
+            self._save()
+
+    def record_failure(self, fix: dict):
+        """A fix failed again. Remembered fixes that fail are demoted so they are not replayed forever."""
+        with self._lock:
+            data = self._load()
+            entry = data["entries"].get(fix["key"])
+            if fix.get("from_memory") and entry:
+                entry["failures"] += 1
+            self._save()
+
+    def count_llm_fix(self):
+        with self._lock:
+            self._load()["stats"]["llm_fixes"] += 1
+            self._save()
+
+    def _evict(self):
+        entries = self._data["entries"]
+        if len(entries) > MAX_ENTRIES:
+            oldest = sorted(entries, key=lambda k: entries[k].get("last_used", 0))
+            for key in oldest[:len(entries) - MAX_ENTRIES]:
+                del entries[key]
+
+    def stats(self):
+        """Hit-rate statistics for the UI/logs."""
+        with self._lock:
+            stats = dict(self._load()["stats"])
+            stats["entries"] = len(self._data["entries"])
+        stats["hit_rate"] = stats["hits"] / stats["lookups"] if stats["lookups"] else 0.0
+        return stats
+
+
+# Global instance
+fix_memory = FixMemory()
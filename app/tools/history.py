@@ -0,0 +1,146 @@
+"""
+Run history for the web UI, stored in SQLite instead of Streamlit session state.
+
+A session only keeps its session id; runs, their log lines and error
+screenshots live in .agent_data/history.db and are read a page at a time.
+The store is bounded to HISTORY_MAX_RUNS runs (oldest deleted first).
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from app.config import DATA_DIR
+
+HISTORY_PATH = os.path.join(DATA_DIR, "history.db")
+MAX_RUNS = int(os.getenv("HISTORY_MAX_RUNS", "500"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    task TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'running',
+    summary TEXT,
+    log_count INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS runs_session ON runs (session_id, created);
+CREATE TABLE IF NOT EXISTS logs (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    line TEXT NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
+CREATE TABLE IF NOT EXISTS screenshots (
+    run_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    image BLOB NOT NULL,
+    PRIMARY KEY (run_id, seq)
+);
+"""
+
+
+class RunHistory:
+    def __init__(self, path=HISTORY_PATH, max_runs=MAX_RUNS):
+        self.path = path
+        self.max_runs = max_runs
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._ready = True
+        return conn
+
+    def _write(self, sql_statements):
+        """Run (sql, params) pairs in one transaction."""
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    for sql, params in sql_statements:
+                        conn.execute(sql, params)
+            finally:
+                conn.close()
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            conn = self._connect()
+            try:
+                return [dict(row) for row in conn.execute(sql, params)]
+            finally:
+                conn.close()
+
+    def start_run(self, run_id, session_id, task):
+        self._write([(
+            "INSERT OR REPLACE INTO runs (run_id, session_id, task, created) VALUES (?, ?, ?, ?)",
+            (run_id, session_id, task, time.time()),
+        )])
+        self._prune()
+
+    def append_logs(self, run_id, lines):
+        if not lines:
+            return
+        with self._lock:
+            conn = self._connect()
+            try:
+                with conn:
+                    start = conn.execute("SELECT log_count FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+                    conn.executemany(
+                        "INSERT INTO logs (run_id, seq, line) VALUES (?, ?, ?)",
+                        [(run_id, start + i, line) for i, line in enumerate(lines)],
+                    )
+                    conn.execute("UPDATE runs SET log_count = ? WHERE run_id = ?", (start + len(lines), run_id))
+            finally:
+                conn.close()
+
+    def add_screenshot(self, run_id, image_bytes):
+        self._write([(
+            "INSERT INTO screenshots (run_id, seq, image) "
+            "VALUES (?, (SELECT COUNT(*) FROM screenshots WHERE run_id = ?), ?)",
+            (run_id, run_id, image_bytes),
+        )])
+
+    def finish_run(self, run_id, status, summary):
+        self._write([(
+            "UPDATE runs SET status = ?, summary = ?, finished = ? WHERE run_id = ?",
+            (status, summary, time.time(), run_id),
+        )])
+
+    def count_runs(self, session_id):
+        return self._read("SELECT COUNT(*) AS n FROM runs WHERE session_id = ?", (session_id,))[0]["n"]
+
+    def list_runs(self, session_id, limit=10, offset=0):
+        """Newest first, without logs or screenshots."""
+        return self._read(
+            "SELECT run_id, task, status, summary, log_count, created, finished FROM runs "
+            "WHERE session_id = ? ORDER BY created DESC LIMIT ? OFFSET ?",
+            (session_id, limit, offset),
+        )
+
+    def get_logs(self, run_id):
+        return [row["line"] for row in self._read("SELECT line FROM logs WHERE run_id = ? ORDER BY seq", (run_id,))]
+
+    def get_screenshots(self, run_id):
+        return [row["image"] for row in self._read("SELECT image FROM screenshots WHERE run_id = ? ORDER BY seq", (run_id,))]
+
+    def _prune(self):
+        """Keep only the newest max_runs runs."""
+        stale = [row["run_id"] for row in self._read(
+            "SELECT run_id FROM runs ORDER BY created DESC LIMIT -1 OFFSET ?", (self.max_runs,)
+        )]
+        if stale:
+            marks = ",".join("?" * len(stale))
+            self._write([(f"DELETE FROM {table} WHERE run_id IN ({marks})", stale) for table in ("logs", "screenshots", "runs")])
+
+
+# Global instance
+run_history = RunHistory()
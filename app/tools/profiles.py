@@ -0,0 +1,94 @@
+"""
+Browser launch profiles (BROWSER_PROFILE, default "desktop").
+
+- desktop: visible, maximized 1920x1080 window - for watching the agent work
+- headless: the desktop profile without a window (CI smoke runs, screenshots
+  look the same as in desktop runs)
+- dense: for headless server boxes running many contexts at once - Chromium's
+  new headless mode, a 1280x720 viewport, no GPU/extensions/background
+  services, no throttling of background tabs (every context is "in the
+  background" headless), and renderer processes shared across sites
+
+An explicit headless=True/False (e.g. the UI's checkbox) still overrides the
+profile's default. benchmarks/bench_profiles.py measures how many concurrent
+contexts per core each profile supports.
+"""
+import os
+
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "desktop")
+# Renderer processes shared by all contexts of a browser in the dense profile
+DENSE_RENDERER_LIMIT = int(os.getenv("DENSE_RENDERER_LIMIT", str(max(2, os.cpu_count() or 2))))
+
+_COMMON_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--disable-dev-shm-usage',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+]
+
+
+class LaunchProfile:
+    def __init__(self, name, headless, viewport, args=None, channel=None):
+        self.name = name
+        self.headless = headless
+        self.viewport = viewport
+        self.args = args or []
+        # "chromium" selects the new headless mode (full browser) instead of headless shell
+        self.channel = channel
+
+    def launch_options(self, headless=None):
+        headless = self.headless if headless is None else headless
+        options = {"headless": headless, "args": _COMMON_ARGS + self.args}
+        if self.channel and headless:
+            options["channel"] = self.channel
+        return options
+
+    def context_options(self):
+        return {"viewport": dict(self.viewport)}
+
+
+PROFILES = {
+    "desktop": LaunchProfile(
+        name="desktop",
+        headless=False,
+        viewport={'width': 1920, 'height': 1080},
+        args=['--start-maximized'],
+    ),
+    "headless": LaunchProfile(
+        name="headless",
+        headless=True,
+        viewport={'width': 1920, 'height': 1080},
+    ),
+    "dense": LaunchProfile(
+        name="dense",
+        headless=True,
+        viewport={'width': 1280, 'height': 720},
+        channel="chromium",
+        args=[
+            '--disable-gpu',
+            '--disable-extensions',
+            '--disable-component-extensions-with-background-pages',
+            '--disable-background-networking',
+            '--disable-component-update',
+            '--disable-default-apps',
+            '--disable-sync',
+            '--no-first-run',
+            '--mute-audio',
+            # Headless contexts are never "visible" - don't slow their timers and renderers down
+            '--disable-background-timer-throttling',
+            '--disable-backgrounding-occluded-windows',
+            '--disable-renderer-backgrounding',
+            # Share renderer processes across sites/contexts instead of one per site
+            '--disable-features=site-per-process,IsolateOrigins,Translate,MediaRouter',
+            f'--renderer-process-limit={DENSE_RENDERER_LIMIT}',
+        ],
+    ),
+}
+
+
+def get_profile(name=None):
+    """The launch profile called `name` (default: BROWSER_PROFILE)."""
+    name = name or BROWSER_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown browser profile '{name}' (available: {', '.join(PROFILES)})")
+    return PROFILES[name]
@@ -0,0 +1,145 @@
+"""
+Sandboxed execution of generated scripts (SCRIPT_SANDBOX=1).
+
+Instead of exec() in the app process, each script runs in a pooled worker
+process. Workers attach to the same Chromium over CDP (the browser is launched
+with a remote debugging port), pick the page by its CDP target id and run the
+script with BrowserManager.execute_script, so scripts behave exactly as they do
+in-process. Each task gets a CPU-time limit, each worker a memory limit, and
+workers are recycled after SANDBOX_MAX_TASKS scripts. A script that overruns
+SANDBOX_TIMEOUT_SECONDS (or a crashed worker) tears down the pool; the next
+script starts a fresh one. No browser is launched per step.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import socket
+import sys
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+from app.cancellation import RunCancelled, wait_future
+
+SANDBOX_ENABLED = os.getenv("SCRIPT_SANDBOX", "0").lower() in ("1", "true", "yes")
+SANDBOX_WORKERS = int(os.getenv("SANDBOX_WORKERS", "2"))
+SANDBOX_TIMEOUT_SECONDS = float(os.getenv("SANDBOX_TIMEOUT_SECONDS", "120"))
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "30"))
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "1024"))
+SANDBOX_MAX_TASKS = int(os.getenv("SANDBOX_MAX_TASKS", "50"))
+
+
+def free_port():
+    """A free local TCP port for Chromium's --remote-debugging-port."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# --- Worker process side ---
+
+_worker = None  # BrowserManager attached over CDP
+
+
+def _virtual_memory_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+def _init_worker(cdp_endpoint, memory_mb):
+    global _worker
+    from app.tools.browser import BrowserManager
+    _worker = BrowserManager()
+    _worker.attach_over_cdp(cdp_endpoint)
+    try:
+        import resource
+    except ImportError:
+        return  # No rlimits on Windows
+    # Set after connecting: the Playwright driver subprocess must not inherit the limit
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = _virtual_memory_bytes() + memory_mb * 1024 * 1024
+    if hard == resource.RLIM_INFINITY or limit < hard:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _limit_cpu(cpu_seconds):
+    """RLIMIT_CPU counts the process lifetime, so allow `cpu_seconds` more than used so far."""
+    try:
+        import resource
+    except ImportError:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    limit = int(usage.ru_utime + usage.ru_stime) + cpu_seconds
+    if hard == resource.RLIM_INFINITY or limit < hard:
+        resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+
+
+def _run_in_worker(target_id, script_code, timeouts, cpu_seconds):
+    _limit_cpu(cpu_seconds)
+    _worker.select_target(target_id)
+    if timeouts:
+        _worker.set_step_timeout(*timeouts)
+    try:
+        result = _worker.execute_script(script_code)
+    except MemoryError:
+        return {"status": "error", "error": f"Script exceeded the sandbox memory limit ({SANDBOX_MEMORY_MB} MB)"}
+    # The script may have switched tabs (browser_manager.switch_to_new_tab())
+    result["active_target"] = _worker.page_target_id()
+    return result
+
+
+# --- App side ---
+
+class ScriptSandbox:
+    """Worker pool for one browser (each BrowserManager owns one, see execute_script)"""
+    def __init__(self):
+        self._executor = None
+        self._endpoint = None
+        self._lock = threading.Lock()
+
+    def _pool(self, endpoint):
+        with self._lock:
+            if self._executor is None or endpoint != self._endpoint:
+                self._shutdown()
+                options = {"max_tasks_per_child": SANDBOX_MAX_TASKS} if sys.version_info >= (3, 11) else {}
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=SANDBOX_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(endpoint, SANDBOX_MEMORY_MB),
+                    **options
+                )
+                self._endpoint = endpoint
+            return self._executor
+
+    def _shutdown(self):
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # shutdown() does not stop a running script - kill the workers first
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.kill()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def recycle(self):
+        """Kill all workers; the next script starts a fresh pool."""
+        with self._lock:
+            self._shutdown()
+
+    def run(self, endpoint, target_id, script_code, timeouts=None):
+        """Run a script on the page with CDP target `target_id`. Returns an execute_script()-style result."""
+        future = self._pool(endpoint).submit(_run_in_worker, target_id, script_code, timeouts, SANDBOX_CPU_SECONDS)
+        try:
+            return wait_future(future, timeout=SANDBOX_TIMEOUT_SECONDS)
+        except concurrent.futures.TimeoutError:
+            self.recycle()
+            return {"status": "error", "error": f"Script did not finish within {SANDBOX_TIMEOUT_SECONDS:.0f}s in the sandbox (worker killed)"}
+        except BrokenProcessPool:
+            self.recycle()
+            return {"status": "error", "error": f"Sandbox worker died (CPU limit {SANDBOX_CPU_SECONDS}s or memory limit {SANDBOX_MEMORY_MB} MB exceeded, a crash, or it could not attach to the browser)"}
+        except RunCancelled:
+            self.recycle()
+            raise
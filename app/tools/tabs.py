@@ -0,0 +1,173 @@
+"""
+Tab registry for a browser context.
+
+Every page the context opens (popups, target=_blank links, new_page()) is
+recorded in opening order, with its opener, from the context's "page" event -
+instead of assuming the last entry of context.pages is the new tab. An init
+script counts popup requests in each document (window.open, clicks on links
+and submits of forms with a target), so after a step the tracker knows
+whether a popup is still on its way and waits for its event: no fixed
+sleeps, and no waiting at all after steps that opened nothing.
+
+After each step of the main flow (BrowserManager.execute_script):
+- the popup the active page opened during the step becomes the active page,
+  so plans and scripts don't need browser_manager.switch_to_new_tab()
+- tabs the flow has left behind are closed: popups and formerly active pages
+  that are neither the active page nor one of its last TAB_KEEP_OPENERS
+  openers. Pages from new_page() (parallel branches) are never touched.
+"""
+import asyncio
+import os
+import weakref
+
+TAB_TRACKING = os.getenv("TAB_TRACKING", "1").lower() in ("1", "true", "yes")
+# Upper bound for a requested popup to open and reach domcontentloaded
+POPUP_WAIT_MS = int(os.getenv("POPUP_WAIT_MS", "10000"))
+TAB_KEEP_OPENERS = int(os.getenv("TAB_KEEP_OPENERS", "1"))
+
+POPUP_HINT_JS = """
+(() => {
+    if (window.__agentPopupHint) return;
+    window.__agentPopupHint = true;
+    window.__agentPopups = 0;
+    const opensPopup = (target) => !!target && !["_self", "_parent", "_top"].includes(target.toLowerCase());
+    const open = window.open;
+    window.open = function (...args) {
+        window.__agentPopups++;
+        return open.apply(this, args);
+    };
+    document.addEventListener("click", (event) => {
+        const link = event.target instanceof Element && event.target.closest("a[href], area[href]");
+        if (link && opensPopup(link.target)) window.__agentPopups++;
+    }, true);
+    document.addEventListener("submit", (event) => {
+        if (opensPopup(event.target.target)) window.__agentPopups++;
+    }, true);
+})();
+"""
+
+TAKE_POPUP_REQUESTS_JS = "() => { const n = window.__agentPopups || 0; window.__agentPopups = 0; return n; }"
+
+
+class TabTracker:
+    def __init__(self, manager):
+        self._manager = manager
+        # {"page", "opener", "serial"} in opening order (only touched on the browser loop)
+        self._tabs = []
+        self.serial = 0
+        self._waiters = []
+        self._contexts = weakref.WeakSet()
+        self._pinned = weakref.WeakSet()
+        self._visited = weakref.WeakSet()
+
+    async def attach(self, context):
+        """Track the pages of `context` (call before it opens its first page)."""
+        if context in self._contexts:
+            return
+        self._contexts.add(context)
+        await context.add_init_script(POPUP_HINT_JS)
+        context.on("page", self._on_page)
+        for page in context.pages:
+            self._register(page, None)
+
+    async def _on_page(self, page):
+        self._register(page, await page.opener())
+
+    def _register(self, page, opener):
+        if any(entry["page"] is page for entry in self._tabs):
+            return
+        self.serial += 1
+        self._tabs.append({"page": page, "opener": opener, "serial": self.serial})
+        page.on("close", self._forget)
+        for waiter_opener, future in self._waiters:
+            if waiter_opener is opener and not future.done():
+                future.set_result(page)
+
+    def _forget(self, page):
+        self._tabs = [entry for entry in self._tabs if entry["page"] is not page]
+
+    def pin(self, async_page):
+        """Never close this page (pages the agent opened itself, e.g. parallel branches)."""
+        self._pinned.add(async_page)
+
+    def pages(self):
+        """Open tracked pages in the order they were opened."""
+        return [entry["page"] for entry in self._tabs if not entry["page"].is_closed()]
+
+    def _opener_of(self, page):
+        return next((entry["opener"] for entry in self._tabs if entry["page"] is page), None)
+
+    def _popups(self, opener, since_serial):
+        return [
+            entry["page"] for entry in self._tabs
+            if entry["opener"] is opener and entry["serial"] > since_serial and not entry["page"].is_closed()
+        ]
+
+    async def find_popup(self, opener, since_serial=0):
+        """
+        The last popup `opener` opened after `since_serial`. If none has opened
+        yet but the page requested one, wait for its event (up to POPUP_WAIT_MS).
+        """
+        try:
+            requested = await opener.evaluate(TAKE_POPUP_REQUESTS_JS)
+        except Exception:
+            requested = 0  # Closed, or navigated while evaluating
+        popup = (self._popups(opener, since_serial) or [None])[-1]
+        if popup is None and requested:
+            future = asyncio.get_running_loop().create_future()
+            waiter = (opener, future)
+            self._waiters.append(waiter)
+            try:
+                popup = await asyncio.wait_for(future, POPUP_WAIT_MS / 1000)
+            except asyncio.TimeoutError:
+                return None
+            finally:
+                self._waiters.remove(waiter)
+        if popup is not None:
+            try:
+                await popup.wait_for_load_state("domcontentloaded", timeout=POPUP_WAIT_MS)
+            except Exception:
+                pass  # Still loading - the next step's own waits take over
+        return popup
+
+    async def _close_abandoned(self):
+        active = self._manager._async_page
+        keep = {active}
+        opener = self._opener_of(active)
+        for _ in range(TAB_KEEP_OPENERS):
+            if opener is None:
+                break
+            keep.add(opener)
+            opener = self._opener_of(opener)
+        closed = 0
+        for entry in list(self._tabs):
+            page = entry["page"]
+            if page in keep or page in self._pinned or page.is_closed():
+                continue
+            if entry["opener"] is None and page not in self._visited:
+                continue  # Not opened or used by the flow (e.g. discovery pages)
+            try:
+                await page.close()
+                closed += 1
+            except Exception:
+                pass
+        return closed
+
+    def after_step(self, start_page, since_serial):
+        """
+        Follow the popup `start_page` opened during the step that started at
+        `since_serial`, then close abandoned tabs. Returns log lines.
+        """
+        manager = self._manager
+        logs = []
+        self._visited.add(start_page)
+        # The script may already have switched tabs itself (switch_to_new_tab)
+        if manager._async_page is start_page and not start_page.is_closed():
+            popup = manager.run_async(self.find_popup(start_page, since_serial))
+            if popup is not None:
+                manager.activate_page(popup)
+                logs.append(f"🗂️ Followed new tab: {popup.url}")
+        closed = manager.run_async(self._close_abandoned())
+        if closed:
+            logs.append(f"🧹 Closed {closed} abandoned tab(s)")
+        return logs
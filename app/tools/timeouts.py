@@ -0,0 +1,188 @@
+"""
+Adaptive per-step timeouts learned from recorded step durations.
+
+Durations of successful steps are recorded per (domain, step type). Once a
+profile has enough samples its timeout becomes p99 x margin, clamped to
+[MIN_TIMEOUT_MS, MAX_TIMEOUT_MS]; until then the Playwright default is used.
+Failing selectors then give up after a few seconds instead of 30s. Samples
+are written to disk at most every TIMEOUTS_SAVE_INTERVAL_SECONDS (and at exit).
+
+    python -m app.tools.timeouts      # print learned profiles and time saved
+"""
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from app.config import DATA_DIR
+
+TIMEOUTS_PATH = os.path.join(DATA_DIR, "timeouts.json")
+
+DEFAULT_TIMEOUT_MS = 30000
+MIN_TIMEOUT_MS = int(os.getenv("MIN_STEP_TIMEOUT_MS", "3000"))
+MAX_TIMEOUT_MS = int(os.getenv("MAX_STEP_TIMEOUT_MS", "60000"))
+TIMEOUT_MARGIN = float(os.getenv("STEP_TIMEOUT_MARGIN", "3.0"))
+MIN_SAMPLES = 5
+MAX_SAMPLES = 50
+SAVE_INTERVAL_SECONDS = float(os.getenv("TIMEOUTS_SAVE_INTERVAL_SECONDS", "10"))
+
+_STEP_TYPES = [
+    ("navigation", r"\.goto\(|\.go_back\(|\.reload\("),
+    ("fill", r"\.fill\(|\.type\(|\.press\(|\.select_option\("),
+    ("click", r"\.click\(|\.check\(|\.dblclick\("),
+    ("wait", r"\.wait_for"),
+    ("evaluate", r"\.evaluate\(|\.extract\("),
+]
+_URL = re.compile(r"https?://[^\s'\"]+")
+
+
+def step_type(step: str) -> str:
+    for name, pattern in _STEP_TYPES:
+        if re.search(pattern, step or ""):
+            return name
+    return "other"
+
+
+def step_domain(step: str, current_url: str) -> str:
+    """Navigation steps are profiled by their target domain, others by the current page's."""
+    match = _URL.search(step or "")
+    url = match.group(0) if match and step_type(step) == "navigation" else current_url
+    return urlparse(url or "").netloc.lower()
+
+
+def is_timeout_error(error: str) -> bool:
+    return bool(re.search(r"Timeout \d+ms exceeded", error or ""))
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class TimeoutProfiles:
+    def __init__(self, path=TIMEOUTS_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = None
+        self._dirty = False
+        self._last_save = 0.0
+
+    def _load(self):
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._data.setdefault("samples", {})
+            self._data.setdefault("stats", {"timeout_failures": 0, "saved_ms": 0})
+        return self._data
+
+    def _save(self, force=False):
+        # Every successful step records a sample - write at most every SAVE_INTERVAL_SECONDS
+        self._dirty = True
+        now = time.time()
+        if not force and now - self._last_save < SAVE_INTERVAL_SECONDS:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._last_save = now
+
+    def flush(self):
+        """Write samples recorded since the last save."""
+        with self._lock:
+            if self._dirty:
+                self._save(force=True)
+
+    def lookup(self, domain: str, kind: str):
+        """(timeout_ms, source) for this domain/step type: "learned", or "default" if not enough samples."""
+        with self._lock:
+            samples = self._load()["samples"].get(f"{domain}|{kind}", [])
+        if len(samples) < MIN_SAMPLES:
+            return DEFAULT_TIMEOUT_MS, "default"
+        learned = int(_percentile(samples, 99) * TIMEOUT_MARGIN)
+        return max(MIN_TIMEOUT_MS, min(MAX_TIMEOUT_MS, learned)), "learned"
+
+    def timeout_for(self, domain: str, kind: str) -> int:
+        """Learned timeout (ms) for this domain/step type, or the default if not enough samples."""
+        return self.lookup(domain, kind)[0]
+
+    def record(self, domain: str, kind: str, duration_ms: float):
+        """Record the duration of a successful step."""
+        with self._lock:
+            samples = self._load()["samples"].setdefault(f"{domain}|{kind}", [])
+            samples.append(int(duration_ms))
+            del samples[:-MAX_SAMPLES]
+            self._save()
+
+    def record_timeout_failure(self, applied_ms: int):
+        """A step timed out under `applied_ms` - count the time saved vs the default timeout."""
+        with self._lock:
+            stats = self._load()["stats"]
+            stats["timeout_failures"] += 1
+            stats["saved_ms"] += max(0, DEFAULT_TIMEOUT_MS - applied_ms)
+            self._save()
+
+    def report(self):
+        """Learned profiles and total time saved on failing steps."""
+        with self._lock:
+            data = self._load()
+            keys = sorted(data["samples"])
+            stats = dict(data["stats"])
+        profiles = []
+        for key in keys:
+            domain, kind = key.rsplit("|", 1)
+            with self._lock:
+                samples = list(self._data["samples"][key])
+            profiles.append({
+                "domain": domain,
+                "step_type": kind,
+                "samples": len(samples),
+                "p99_ms": _percentile(samples, 99),
+                "timeout_ms": self.timeout_for(domain, kind),
+            })
+        return {"profiles": profiles, **stats}
+
+
+def resolve_timeout(state, step: str, current_url: str):
+    """
+    Timeout for the current step: an explicit per-step override from
+    state['timeout_overrides'] (keyed by step index) wins over the learned profile.
+    Returns (timeout_ms, domain, step_type, source).
+    """
+    kind = step_type(step)
+    domain = step_domain(step, current_url)
+    overrides = state.get("timeout_overrides") or {}
+    index = state.get("current_step_index", 0)
+    override = overrides.get(index, overrides.get(str(index)))
+    if override:
+        return int(override), domain, kind, "override"
+    learned, source = timeout_profiles.lookup(domain, kind)
+    if source == "default":
+        return learned, domain, kind, source
+    # Back off towards the default on retries, in case the page is just slower today
+    retries = state.get("retry_count", 0)
+    if retries:
+        learned = min(DEFAULT_TIMEOUT_MS, learned * (2 ** retries))
+    return learned, domain, kind, "learned"
+
+
+# Global instance
+timeout_profiles = TimeoutProfiles()
+atexit.register(timeout_profiles.flush)
+
+
+if __name__ == "__main__":
+    report = timeout_profiles.report()
+    print(f"{'domain':<30} {'type':<11} {'samples':>7} {'p99 ms':>8} {'timeout':>8}")
+    for p in report["profiles"]:
+        print(f"{p['domain']:<30} {p['step_type']:<11} {p['samples']:>7} {p['p99_ms']:>8} {p['timeout_ms']:>8}")
+    print(f"\nTimed-out steps: {report['timeout_failures']}, time saved vs {DEFAULT_TIMEOUT_MS}ms default: {report['saved_ms'] / 1000:.1f}s")
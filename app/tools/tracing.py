@@ -0,0 +1,248 @@
+"""
+Opt-in per-run execution traces (TRACE_RUNS=1).
+
+Each run gets one append-only binary file, traces/<run_id>.trace:
+
+    file header : b"BATRACE1"
+    record      : <B event type><H step><I ms since run start><I payload length> + payload
+
+Payloads are compact JSON, except FRAME records which hold raw JPEG bytes (one
+frame sampled at each step boundary). Events are buffered in memory and written
+once per step, so tracing adds no per-request file I/O. Old runs are evicted
+when the directory exceeds TRACE_MAX_MB; the budget is checked on every write,
+and a run that still does not fit stops recording (its run_end record counts
+the dropped records). The trace is closed by whoever drives the graph
+(RunService, `python -m app.checkpoints resume`), on every way out of the run.
+
+Only steps run by the executor are traced. Parallel branches and "[assert]"
+steps are not recorded (their effects show up in the next step's frame).
+
+    python -m app.tools.tracing list
+    python -m app.tools.tracing show <run_id> [--step N] [--type network]
+    python -m app.tools.tracing frames <run_id> --out DIR [--step N]
+"""
+import argparse
+import json
+import os
+import struct
+import threading
+import time
+
+from app.config import DATA_DIR
+
+TRACE_ENABLED = os.getenv("TRACE_RUNS", "0").lower() in ("1", "true", "yes")
+TRACE_FRAMES = os.getenv("TRACE_FRAMES", "1").lower() in ("1", "true", "yes")
+TRACE_DIR = os.path.join(DATA_DIR, "traces")
+TRACE_MAX_BYTES = int(float(os.getenv("TRACE_MAX_MB", "200")) * 1024 * 1024)
+
+MAGIC = b"BATRACE1"
+_RECORD = struct.Struct("<BHII")
+
+RUN_START, STEP_START, STEP_END, ACTION, NETWORK, CONSOLE, FRAME, RUN_END = range(1, 9)
+EVENT_NAMES = {
+    RUN_START: "run_start", STEP_START: "step_start", STEP_END: "step_end", ACTION: "action",
+    NETWORK: "network", CONSOLE: "console", FRAME: "frame", RUN_END: "run_end",
+}
+_NAME_TO_EVENT = {name: code for code, name in EVENT_NAMES.items()}
+
+
+def _json(payload):
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class TraceRecorder:
+    def __init__(self, run_id, trace_dir=TRACE_DIR):
+        self.run_id = run_id
+        self.path = os.path.join(trace_dir, f"{run_id}.trace")
+        self.current_step = 0
+        self.dropped = 0
+        self._trace_dir = trace_dir
+        self._over_quota = False
+        self._buffer = []
+        self._lock = threading.Lock()
+        os.makedirs(trace_dir, exist_ok=True)
+        if os.path.exists(self.path):
+            # Resumed run: keep appending, with the clock continuing from the last record
+            last_ms = max((t_ms for _, _, t_ms, _ in read_trace(self.path)), default=0)
+            self._t0 = time.time() - last_ms / 1000
+        else:
+            self._t0 = time.time()
+            enforce_quota(trace_dir)
+            with open(self.path, "wb") as f:
+                f.write(MAGIC)
+
+    def _add(self, event, payload: bytes, step=None):
+        t_ms = int((time.time() - self._t0) * 1000)
+        record = _RECORD.pack(event, self.current_step if step is None else step, t_ms, len(payload)) + payload
+        with self._lock:
+            self._buffer.append(record)
+
+    def flush(self, force=False):
+        with self._lock:
+            records, self._buffer = self._buffer, []
+        if not records:
+            return
+        if self._over_quota and not force:
+            # Over the quota with nothing left to evict - keep the trace as it is
+            self.dropped += len(records)
+            return
+        with open(self.path, "ab") as f:
+            f.write(b"".join(records))
+        self._over_quota = enforce_quota(self._trace_dir) > TRACE_MAX_BYTES
+
+    def run_start(self, task):
+        self._add(RUN_START, _json({"run_id": self.run_id, "task": task, "started": time.time()}))
+
+    def step_start(self, step, description):
+        self.current_step = step
+        self._add(STEP_START, _json({"description": description}))
+
+    def action(self, script):
+        self._add(ACTION, _json({"script": script}))
+
+    def network(self, method, url, status, resource_type, duration_ms=None, failure=None):
+        payload = {"m": method, "u": url[:300], "s": status, "r": resource_type}
+        if duration_ms is not None:
+            payload["d"] = round(duration_ms, 1)
+        if failure:
+            payload["f"] = failure
+        self._add(NETWORK, _json(payload))
+
+    def console(self, level, text):
+        self._add(CONSOLE, _json({"l": level, "t": text[:1000]}))
+
+    def frame(self, jpeg_bytes):
+        self._add(FRAME, jpeg_bytes)
+
+    def step_end(self, status, duration_ms, error=None):
+        payload = {"status": status, "d": round(duration_ms, 1)}
+        if error:
+            payload["error"] = error[:2000]
+        self._add(STEP_END, _json(payload))
+        self.flush()
+
+    def run_end(self, status):
+        self.flush()
+        payload = {"status": status}
+        if self.dropped:
+            payload["dropped"] = self.dropped
+        self._add(RUN_END, _json(payload))
+        self.flush(force=True)
+
+
+_recorders = {}
+_recorders_lock = threading.Lock()
+
+
+def get_recorder(state):
+    """The recorder for this run, or None when tracing is disabled."""
+    if not TRACE_ENABLED or not state.get("run_id"):
+        return None
+    run_id = state["run_id"]
+    with _recorders_lock:
+        recorder = _recorders.get(run_id)
+        if recorder is None:
+            recorder = TraceRecorder(run_id)
+            if os.path.getsize(recorder.path) == len(MAGIC):
+                recorder.run_start(state.get("task", ""))
+            _recorders[run_id] = recorder
+            # Only a handful of runs are active at once; drop the oldest handles
+            while len(_recorders) > 32:
+                _recorders.pop(next(iter(_recorders))).flush()
+    return recorder
+
+
+def finish_run(run_id, status):
+    """Write the run_end record and forget the recorder."""
+    with _recorders_lock:
+        recorder = _recorders.pop(run_id, None)
+    if recorder:
+        recorder.run_end(status)
+
+
+def enforce_quota(trace_dir=TRACE_DIR, max_bytes=TRACE_MAX_BYTES):
+    """
+    Delete the oldest trace files until the directory fits in the quota (never those
+    of active runs). Returns the size of what is left.
+    """
+    # Called from TraceRecorder() while get_recorder() holds _recorders_lock - read a snapshot instead
+    active = {os.path.abspath(recorder.path) for recorder in list(_recorders.values())}
+    try:
+        files = [os.path.join(trace_dir, name) for name in os.listdir(trace_dir) if name.endswith(".trace")]
+    except OSError:
+        return 0
+    total = sum(os.path.getsize(path) for path in files)
+    # Active runs count towards the quota but their files stay
+    files = sorted((path for path in files if os.path.abspath(path) not in active), key=os.path.getmtime)
+    while files and total > max_bytes:
+        oldest = files.pop(0)
+        total -= os.path.getsize(oldest)
+        os.remove(oldest)
+    return total
+
+
+def read_trace(path):
+    """Yield (event_name, step, t_ms, payload) from a trace file. Payload is a dict, or bytes for frames."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a trace file")
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            event, step, t_ms, length = _RECORD.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return  # Truncated tail (process died mid-write)
+            yield EVENT_NAMES.get(event, str(event)), step, t_ms, payload if event == FRAME else json.loads(payload)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description="Inspect execution traces")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List recorded runs")
+    show = sub.add_parser("show", help="Print a run's timeline")
+    show.add_argument("run_id")
+    show.add_argument("--step", type=int)
+    show.add_argument("--type", choices=sorted(_NAME_TO_EVENT))
+    frames = sub.add_parser("frames", help="Export step-boundary frames as JPEG files")
+    frames.add_argument("run_id")
+    frames.add_argument("--out", required=True)
+    frames.add_argument("--step", type=int)
+    args = parser.parse_args()
+
+    if args.command == "list":
+        if not os.path.isdir(TRACE_DIR):
+            return
+        for name in sorted(os.listdir(TRACE_DIR), key=lambda n: os.path.getmtime(os.path.join(TRACE_DIR, n))):
+            if not name.endswith(".trace"):
+                continue
+            path = os.path.join(TRACE_DIR, name)
+            events = list(read_trace(path))
+            steps = {step for kind, step, _, _ in events if kind == "step_start"}
+            task = next((p["task"] for kind, _, _, p in events if kind == "run_start"), "")
+            print(f"{name[:-6]:<14} {os.path.getsize(path) / 1024:>8.1f} KB  {len(steps):>3} steps  {task[:60]}")
+        return
+
+    path = os.path.join(TRACE_DIR, f"{args.run_id}.trace")
+    if args.command == "frames":
+        os.makedirs(args.out, exist_ok=True)
+        for kind, step, t_ms, payload in read_trace(path):
+            if kind == "frame" and (args.step is None or step == args.step):
+                out_path = os.path.join(args.out, f"step_{step:03d}_{t_ms}.jpg")
+                with open(out_path, "wb") as f:
+                    f.write(payload)
+                print(out_path)
+        return
+
+    for kind, step, t_ms, payload in read_trace(path):
+        if args.step is not None and step != args.step:
+            continue
+        if args.type and kind != args.type:
+            continue
+        detail = f"<{len(payload)} bytes jpeg>" if kind == "frame" else json.dumps(payload, ensure_ascii=False)
+        print(f"{t_ms / 1000:>9.3f}s  step {step:<3} {kind:<10} {detail}")
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,204 @@
+"""
+Chromium memory watchdog.
+
+Between steps (at most every WATCHDOG_INTERVAL_SECONDS) the executor asks the
+watchdog of its BrowserManager to sample:
+- per page: JS heap and DOM size via CDP Performance.getMetrics
+- the browser's process tree RSS (psutil if installed, /proc otherwise)
+
+It then closes background tabs that have not been the active tab for
+WATCHDOG_STALE_TAB_SECONDS, and recycles the context (new context with the
+same cookies/localStorage, reopened at the current URL) when RSS or a page's
+JS heap crosses its threshold. Peak memory per run is kept for sizing how
+many concurrent runs a machine can take (memory_stats()).
+"""
+import os
+import threading
+import time
+import weakref
+
+WATCHDOG_ENABLED = os.getenv("WATCHDOG", "1").lower() in ("1", "true", "yes")
+WATCHDOG_INTERVAL_SECONDS = float(os.getenv("WATCHDOG_INTERVAL_SECONDS", "15"))
+MAX_RSS_MB = float(os.getenv("WATCHDOG_MAX_RSS_MB", "2048"))
+MAX_PAGE_HEAP_MB = float(os.getenv("WATCHDOG_MAX_PAGE_HEAP_MB", "512"))
+STALE_TAB_SECONDS = float(os.getenv("WATCHDOG_STALE_TAB_SECONDS", "120"))
+MAX_TRACKED_RUNS = 200
+
+MB = 1024 * 1024
+
+
+def _children_from_proc(root_pid):
+    """Descendant pids of root_pid, read from /proc (Linux)."""
+    parents = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # pid (comm) state ppid ... - comm may contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        parents.setdefault(ppid, []).append(int(name))
+    found, stack = [], [root_pid]
+    while stack:
+        for child in parents.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _rss_from_proc(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+def process_tree_rss(root_pid):
+    """Total RSS (bytes) of all processes below root_pid, or None if it cannot be measured."""
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        try:
+            total = 0
+            for child in psutil.Process(root_pid).children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total
+        except psutil.Error:
+            return None
+    if os.path.isdir("/proc"):
+        return sum(_rss_from_proc(pid) for pid in _children_from_proc(root_pid))
+    return None
+
+
+# run_id -> peak memory and actions taken
+_run_stats = {}
+_run_stats_lock = threading.Lock()
+
+
+def memory_stats(run_id=None):
+    """Memory stats of one run, or of all recent runs."""
+    with _run_stats_lock:
+        if run_id is not None:
+            return dict(_run_stats.get(run_id, {}))
+        return {rid: dict(stats) for rid, stats in _run_stats.items()}
+
+
+def _record(run_id, sample, closed, recycled):
+    if not run_id:
+        return
+    with _run_stats_lock:
+        stats = _run_stats.setdefault(run_id, {
+            "samples": 0, "peak_rss_mb": 0.0, "peak_js_heap_mb": 0.0, "peak_tabs": 0,
+            "tabs_closed": 0, "recycles": 0,
+        })
+        stats["samples"] += 1
+        if sample["rss_mb"] is not None:
+            stats["peak_rss_mb"] = max(stats["peak_rss_mb"], sample["rss_mb"])
+        stats["peak_js_heap_mb"] = max(stats["peak_js_heap_mb"], sample["js_heap_mb"])
+        stats["peak_tabs"] = max(stats["peak_tabs"], len(sample["pages"]))
+        stats["tabs_closed"] += closed
+        stats["recycles"] += int(recycled)
+        while len(_run_stats) > MAX_TRACKED_RUNS:
+            del _run_stats[next(iter(_run_stats))]
+
+
+class MemoryWatchdog:
+    def __init__(self, manager):
+        self._manager = manager
+        self._last_check = 0.0
+        self._last_active = weakref.WeakKeyDictionary()
+        self._sessions = weakref.WeakKeyDictionary()
+
+    async def _page_metrics(self, page):
+        session = self._sessions.get(page)
+        if session is None:
+            session = await page.context.new_cdp_session(page)
+            await session.send("Performance.enable")
+            self._sessions[page] = session
+        metrics = {m["name"]: m["value"] for m in (await session.send("Performance.getMetrics"))["metrics"]}
+        return {
+            "url": page.url,
+            "js_heap_mb": round(metrics.get("JSHeapUsedSize", 0) / MB, 1),
+            "nodes": int(metrics.get("Nodes", 0)),
+            "documents": int(metrics.get("Documents", 0)),
+        }
+
+    async def _sample(self, context):
+        pages = []
+        for page in context.pages:
+            try:
+                pages.append((page, await self._page_metrics(page)))
+            except Exception:
+                pass  # Page closed or crashed while sampling
+        return pages
+
+    def sample(self):
+        """Current memory picture of the manager's context."""
+        manager = self._manager
+        context = manager.async_context
+        pages = manager.run_async(self._sample(context)) if context else []
+        driver_pid = manager.driver_pid()
+        rss = process_tree_rss(driver_pid) if driver_pid else None
+        return {
+            "rss_mb": round(rss / MB, 1) if rss is not None else None,
+            "js_heap_mb": round(sum(m["js_heap_mb"] for _, m in pages), 1),
+            "pages": pages,
+        }
+
+    def check(self, run_id=None, force=False):
+        """
+        Sample (at most every WATCHDOG_INTERVAL_SECONDS unless `force`) and act on
+        the thresholds. Call between steps only. Returns log lines of what was done.
+        """
+        if not WATCHDOG_ENABLED or not self._manager.page:
+            return []
+        now = time.monotonic()
+        if not force and now - self._last_check < WATCHDOG_INTERVAL_SECONDS:
+            return []
+        self._last_check = now
+
+        sample = self.sample()
+        active = self._manager._async_page
+        logs = []
+
+        # Close background tabs that have not been active for a while
+        closed = 0
+        for page, metrics in sample["pages"]:
+            if page is active:
+                self._last_active[page] = now
+                continue
+            last_active = self._last_active.setdefault(page, now)
+            if now - last_active > STALE_TAB_SECONDS:
+                try:
+                    self._manager.run_async(page.close())
+                    closed += 1
+                except Exception:
+                    pass
+        if closed:
+            logs.append(f"🧹 Closed {closed} stale background tab(s)")
+
+        heaviest = max((m["js_heap_mb"] for _, m in sample["pages"]), default=0)
+        over_rss = sample["rss_mb"] is not None and sample["rss_mb"] > MAX_RSS_MB
+        recycled = False
+        if over_rss or heaviest > MAX_PAGE_HEAP_MB:
+            reason = f"browser RSS {sample['rss_mb']} MB" if over_rss else f"page JS heap {heaviest} MB"
+            try:
+                self._manager.recycle_context()
+                recycled = True
+                logs.append(f"♻️ Recycled browser context ({reason}), cookies and storage kept")
+            except Exception as e:
+                logs.append(f"⚠️ Context recycle failed ({reason}): {str(e)}")
+
+        _record(run_id, sample, closed, recycled)
+        return logs
@@ -0,0 +1,131 @@
+"""
+Launch profile benchmark: how many concurrent browser contexts per core each
+profile (app/tools/profiles.py) supports.
+
+Each profile runs in a fresh interpreter. The child opens contexts in steps
+(1, 2, 4, ... up to --max-contexts), each with a page running a small
+DOM/JS workload, then runs the workload on all pages at once and measures the
+p95 latency and the browser's RSS. A context count is "supported" while the p95
+stays under --budget-ms.
+
+Usage:
+    python benchmarks/bench_profiles.py [--profiles desktop,dense] [--max-contexts 32] [--budget-ms 500]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import asyncio, json, statistics, sys, time
+from app.tools.browser import BrowserManager
+from app.tools.watchdog import process_tree_rss
+
+profile, max_contexts, budget_ms, rounds = sys.argv[1], int(sys.argv[2]), float(sys.argv[3]), int(sys.argv[4])
+
+PAGE = '''<html><body><ul id="list"></ul><script>
+setInterval(() => { document.title = String(Date.now()); }, 100);
+</script></body></html>'''
+
+# Build and lay out a list of a few hundred nodes, then sort it - typical page work
+WORKLOAD = '''() => {
+    const list = document.getElementById("list");
+    list.innerHTML = "";
+    for (let i = 0; i < 400; i++) {
+        const li = document.createElement("li");
+        li.textContent = "item " + Math.random().toString(36).slice(2);
+        list.appendChild(li);
+    }
+    const items = Array.from(list.children).map(li => li.textContent).sort();
+    return list.getBoundingClientRect().height + items.length;
+}'''
+
+manager = BrowserManager(profile=profile)
+manager.start(headless=None)
+pages = []
+
+
+async def open_page():
+    context = await manager._browser.new_context(**manager.profile.context_options())
+    page = await context.new_page()
+    await page.set_content(PAGE)
+    return page
+
+
+async def run_round():
+    async def timed(page):
+        started = time.perf_counter()
+        await page.evaluate(WORKLOAD)
+        return (time.perf_counter() - started) * 1000
+    return await asyncio.gather(*(timed(page) for page in pages))
+
+
+count = 1
+while count <= max_contexts:
+    while len(pages) < count:
+        pages.append(manager.run_async(open_page()))
+    latencies = []
+    for _ in range(rounds):
+        latencies.extend(manager.run_async(run_round()))
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    pid = manager.driver_pid()
+    rss = process_tree_rss(pid) if pid else None
+    print(json.dumps({
+        "contexts": count,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": p95,
+        "rss_mb": rss / 1024 / 1024 if rss is not None else None,
+    }), flush=True)
+    if p95 > budget_ms:
+        break
+    count *= 2
+manager.close()
+"""
+
+
+def run_profile(profile, max_contexts, budget_ms, rounds):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, profile, str(max_contexts), str(budget_ms), str(rounds)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return [json.loads(line) for line in out.stdout.splitlines() if line.startswith("{")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", default="desktop,headless,dense")
+    parser.add_argument("--max-contexts", type=int, default=32)
+    parser.add_argument("--budget-ms", type=float, default=500, help="p95 workload latency a context count must stay under")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    summary = []
+    print(f"{'profile':<10} {'contexts':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'RSS (MB)':>9} {'MB/context':>11}")
+    for profile in args.profiles.split(","):
+        try:
+            results = run_profile(profile, args.max_contexts, args.budget_ms, args.rounds)
+        except subprocess.CalledProcessError as e:
+            # e.g. the desktop profile on a server without a display
+            lines = (e.stderr or "").strip().splitlines()
+            error = next((line for line in reversed(lines) if "Error" in line), lines[-1] if lines else "unknown error")
+            print(f"{profile:<10} failed: {error.strip()}")
+            continue
+        for r in results:
+            rss = f"{r['rss_mb']:.0f}" if r["rss_mb"] is not None else "-"
+            per_context = f"{r['rss_mb'] / r['contexts']:.0f}" if r["rss_mb"] is not None else "-"
+            print(f"{profile:<10} {r['contexts']:>8} {r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f} {rss:>9} {per_context:>11}")
+        supported = max((r["contexts"] for r in results if r["p95_ms"] <= args.budget_ms), default=0)
+        summary.append((profile, supported))
+
+    print(f"\nWithin a {args.budget_ms:.0f}ms p95 budget on {cores} core(s):")
+    for profile, supported in summary:
+        print(f"  {profile:<10} {supported:>3} context(s)  ({supported / cores:.2f} per core)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Startup benchmark: cold vs warm time-to-first-action.
+
+Each mode runs in a fresh interpreter so import caches do not leak between runs.
+  cold: when the "task" arrives, import the graph, start the browser and navigate
+  warm: call warm_start() at process start, idle for --think seconds (the user
+        typing a task), then import the graph, start the browser and navigate
+        (as RunService does)
+
+Usage:
+    python benchmarks/bench_startup.py [--runs 3] [--think 2.0] [--headless]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+mode, think, headless = sys.argv[1], float(sys.argv[2]), sys.argv[3] == "1"
+if mode == "warm":
+    from app.startup import warm_start
+    warm_start(headless=headless)
+t_startup = time.perf_counter() - t0
+time.sleep(think)
+t_task = time.perf_counter()
+import app.graph
+from app.tools.browser import browser_instance
+browser_instance.start(headless=headless)
+browser_instance.get_page().goto("about:blank")
+t_first_action = time.perf_counter() - t_task
+browser_instance.close()
+print(json.dumps({"startup": t_startup, "first_action": t_first_action}))
+"""
+
+
+def run_once(mode, think, headless):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, mode, str(think), "1" if headless else "0"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--think", type=float, default=2.0, help="Idle seconds between startup and the first task")
+    parser.add_argument("--headless", action="store_true")
+    args = parser.parse_args()
+
+    print(f"{'mode':<6} {'startup (ms)':>12} {'first action (ms)':>18}")
+    for mode in ("cold", "warm"):
+        results = [run_once(mode, args.think, args.headless) for _ in range(args.runs)]
+        startup = statistics.median(r["startup"] for r in results) * 1000
+        first = statistics.median(r["first_action"] for r in results) * 1000
+        print(f"{mode:<6} {startup:>12.0f} {first:>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
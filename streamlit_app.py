@@ -1,8 +1,12 @@
 import streamlit as st
-import base64
-from app.graph import app as agent_app
-from app.tools.browser import browser_instance
+from app.llm import llm_limiter
+from app.run_service import run_service
+from app.startup import warm_start, prewarm_enabled
+from app.tools.history import run_history
+from app.tools.profiles import get_profile
+from app.tools.watchdog import memory_stats
 import os
+import uuid
 
 st.set_page_config(page_title="AI Browser Agent", page_icon="🤖", layout="wide")
 
@@ -23,128 +27,118 @@ st.markdown("Powered by **LangGraph**, **Playwright**, and **OpenRouter**")
 with st.sidebar:
     st.header("Configuration")
     api_key = st.text_input("OpenRouter API Key", type="password")
-    headless = st.checkbox("Run Headless", value=False)
+    headless = st.checkbox("Run Headless", value=get_profile().headless)
     
     if api_key:
         import os
         os.environ["OPENROUTER_API_KEY"] = api_key
+    
+    # Runs go to background workers, each with its own browser
+    st.caption(f"{len(run_service.active_runs())} run(s) active on {run_service.workers} worker(s)")
+    llm_queue = sum(s["queue_depth"] for s in llm_limiter.stats().values())
+    if llm_queue:
+        st.caption(f"{llm_queue} LLM request(s) waiting for rate limits")
+    # Sizing hint: how much memory a run's browser peaks at
+    peaks = [s["peak_rss_mb"] for s in memory_stats().values() if s["peak_rss_mb"]]
+    if peaks:
+        st.caption(f"Browser memory per run: avg {sum(peaks) / len(peaks):.0f} MB, max {max(peaks):.0f} MB ({len(peaks)} run(s))")
+    if st.button("Close Idle Browsers", type="secondary"):
+        closed = run_service.pool.close_idle()
+        st.success(f"Closed {closed} browser(s).")
+
+# Warm start: launch the browser and import heavy modules while the user types
+if prewarm_enabled():
+    warm_start(headless=headless)
 
 # Main Interface
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-
-# Display Chat History
-# Display Chat History
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        if "logs" in message and message["logs"]:
-            with st.status("Execution Log", expanded=False, state="complete"):
-                for log in message["logs"]:
+# Runs are stored in the history DB - the session only keeps ids and counters
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "10"))
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if "history_pages" not in st.session_state:
+    st.session_state.history_pages = 1
+if "active_runs" not in st.session_state:
+    st.session_state.active_runs = {}  # run_id -> task, only while queued/running
+session_id = st.session_state.session_id
+
+# Display Chat History (newest page(s) only, older runs on demand)
+total_runs = run_history.count_runs(session_id)
+shown = min(total_runs, HISTORY_PAGE_SIZE * st.session_state.history_pages)
+if total_runs > shown:
+    if st.button(f"Load older runs ({total_runs - shown} more)"):
+        st.session_state.history_pages += 1
+        st.rerun()
+
+for run in reversed(run_history.list_runs(session_id, limit=shown)):
+    if run["run_id"] in st.session_state.active_runs:
+        continue  # Rendered live below
+    with st.chat_message("user"):
+        st.markdown(run["task"])
+    with st.chat_message("assistant"):
+        # Logs and screenshots are only read from the DB when expanded
+        if run["log_count"] and st.toggle(f"Execution Log ({run['log_count']} lines)", key=f"log_{run['run_id']}"):
+            with st.container(border=True):
+                for log in run_history.get_logs(run["run_id"]):
                     st.write(log)
-        st.markdown(message["content"])
-        if "image" in message:
-            st.image(base64.b64decode(message["image"]))
+                for image in run_history.get_screenshots(run["run_id"]):
+                    st.image(image, caption="Error State")
+        st.markdown(run["summary"] or "⏳ Run did not finish.")
+        # Failed, cancelled or interrupted runs can continue from their last checkpoint
+        if run["status"] != "success" and st.button("Resume", key=f"resume_{run['run_id']}", type="secondary"):
+            try:
+                resumed = run_service.submit(run["task"], session_id=session_id, headless=headless, resume_from=run["run_id"])
+            except ValueError as e:
+                st.warning(str(e))
+            else:
+                st.session_state.active_runs[resumed] = run["task"]
+                st.rerun()
+        # Completed runs can be replayed without the agent (app/exporter.py, python -m app.runner)
+        if run["status"] == "success" and st.button("Export Replay", key=f"export_{run['run_id']}", type="secondary"):
+            from app.exporter import export_run
+            try:
+                st.success(f"Exported to `{export_run(run['run_id'])}`")
+            except ValueError as e:
+                st.warning(str(e))
+
+
+@st.fragment(run_every=1.0)
+def live_run(run_id):
+    """Re-rendered every second from the run's events; the rest of the page is left alone."""
+    events, _ = run_service.bus.events(run_id)
+    status = run_service.status(run_id)
+    done = next((e for e in events if e["kind"] == "done"), None)
+    if done or status is None:
+        # Finished (or from before a server restart) - show it from the history instead
+        st.session_state.active_runs.pop(run_id, None)
+        st.rerun(scope="app")
 
-# State Management
-if "is_running" not in st.session_state:
-    st.session_state.is_running = False
+    label = "Queued..." if status == "queued" else "Agent is working..."
+    with st.status(label, expanded=True, state="running"):
+        for event in events:
+            if event["kind"] == "log":
+                st.write(event["text"])
+            elif event["kind"] == "screenshot":
+                st.error("Encountered an error. Analyzing visual state...")
+                st.image(event["image"], caption="Error State")
+    if st.button("Cancel", key=f"cancel_{run_id}", type="secondary"):
+        run_service.cancel(run_id)
 
-# Input - Disabled when agent is running
-task = st.chat_input("What should I do on the web?", disabled=st.session_state.is_running)
+
+# Runs of this session that are still queued/running
+for run_id, run_task in list(st.session_state.active_runs.items()):
+    with st.chat_message("user"):
+        st.markdown(run_task)
+    with st.chat_message("assistant"):
+        live_run(run_id)
+
+# Input - several tasks can run at once
+task = st.chat_input("What should I do on the web?")
 
 if task:
     if not os.getenv("OPENROUTER_API_KEY"):
         st.error("Please provide an OpenRouter API Key in the sidebar.")
         st.stop()
 
-    # Add user message
-    st.session_state.messages.append({"role": "user", "content": task})
-    st.session_state.is_running = True
+    run_id = run_service.submit(task, session_id=session_id, headless=headless)
+    st.session_state.active_runs[run_id] = task
     st.rerun()
-
-# Agent Execution
-if st.session_state.is_running:
-    # Get the latest task (last user message)
-    # We need to find the last user message to use as the task
-    # In this simple flow, it's usually the last message
-    current_task = st.session_state.messages[-1]["content"]
-    
-    with st.chat_message("assistant"):
-        status_container = st.status("Agent is working...", expanded=True)
-        
-        initial_state = {
-            "task": current_task,
-            "plan": [],
-            "current_step_index": 0,
-            "retry_count": 0,
-            "error": None,
-            "logs": []
-        }
-
-        collected_logs = []
-
-        try:
-            # Run the Graph
-            final_state = None
-            for event in agent_app.stream(initial_state):
-                # Inspect the event to find the current node's output
-                current_node = next(iter(event)) # e.g., 'planner', 'executor'
-                node_data = event[current_node]
-                
-                # Update UI with logs immediately
-                if "logs" in node_data:
-                    for log in node_data["logs"]:
-                        status_container.write(log)
-                        collected_logs.append(log)
-                
-                # Check for screenshots (Errors)
-                if "screenshot" in node_data and node_data["screenshot"]:
-                    status_container.error("Encountered an error. Analyzing visual state...")
-                    st.image(base64.b64decode(node_data["screenshot"]), caption="Error State")
-                
-                # Update final state for next iteration
-                final_state = node_data
-
-            # Check final state
-            if final_state:
-                plan_length = len(final_state.get("plan", []))
-                current_step = final_state.get("current_step_index", 0)
-                
-                if current_step >= plan_length:
-                    status_container.update(label="Task Complete!", state="complete", expanded=False)
-                    st.success("Workflow Finished.")
-                elif final_state.get("error") and final_state.get("retry_count", 0) > 3:
-                    status_container.update(label="Task Failed", state="error", expanded=False)
-                    st.error("Workflow failed after multiple retries.")
-                else:
-                    # Still in progress - show current status
-                    status_container.update(label=f"Step {current_step} of {plan_length}", state="running")
-            
-            # Save final message with collected logs
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": "Task completed successfully.",
-                "logs": collected_logs
-            })
-            
-            # Keep browser open - user can close it manually
-            col1, col2 = st.columns([3, 1])
-            with col1:
-                st.info("🌐 Browser window remains open so you can view the results.")
-            with col2:
-                if st.button("Close Browser", type="secondary"):
-                    browser_instance.close()
-                    st.success("Browser closed.")
-
-        except Exception as e:
-            st.error(f"System Error: {e}")
-            # Persist error to chat history so it's visible after rerun
-            st.session_state.messages.append({
-                "role": "assistant", 
-                "content": f"❌ Task failed: {str(e)}",
-                "logs": collected_logs
-            })
-        
-        finally:
-            st.session_state.is_running = False
-            st.rerun()
\ No newline at end of file
@@ -0,0 +1,61 @@
+import sys
+import os
+
+import pytest
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.tools.assertions import split_assertion, parse_assertion, compare
+
+
+def test_split_assertion():
+    assert split_assertion("[assert] visible .inventory_list") == "visible .inventory_list"
+    assert split_assertion("[ASSERT]title contains Swag") == "title contains Swag"
+    assert split_assertion("page.click('#login')") is None
+
+
+def test_parse_each_kind():
+    assert parse_assertion("url matches inventory\\.html")["op"] == "matches"
+    assert parse_assertion("title contains Swag Labs")["value"] == "Swag Labs"
+    assert parse_assertion("hidden #login-button")["selector"] == "#login-button"
+    count = parse_assertion("count .inventory_item >= 6")
+    assert (count["selector"], count["op"], count["value"]) == (".inventory_item", ">=", 6)
+    unchanged = parse_assertion("unchanged '.header_secondary_container'")
+    assert unchanged["selector"] == ".header_secondary_container"
+
+
+def test_text_with_quoted_value():
+    text = parse_assertion('text .title contains "Products is here"')
+    assert (text["selector"], text["op"], text["value"]) == (".title", "contains", "Products is here")
+    unquoted = parse_assertion("text div.price is $29.99")
+    assert (unquoted["selector"], unquoted["op"], unquoted["value"]) == ("div.price", "is", "$29.99")
+
+
+@pytest.mark.parametrize("text", [
+    "url resembles inventory",
+    "visible",
+    "count .item about 6",
+    "smells .item",
+    "url matches (unclosed",
+])
+def test_invalid_assertions(text):
+    with pytest.raises(ValueError):
+        parse_assertion(text)
+
+
+@pytest.mark.parametrize("pattern", ["(?i)inventory", "(?P<page>inventory)", "\\Ahttps", "inventory(?#comment)"])
+def test_python_only_regex_is_rejected(pattern):
+    with pytest.raises(ValueError, match="JavaScript"):
+        parse_assertion(f"url matches {pattern}")
+
+
+def test_js_regex_syntax_is_accepted():
+    assertion = parse_assertion("url matches (?<page>inventory)\\.html")
+    assert compare("https://x.test/inventory.html", "matches", assertion["value"])
+
+
+def test_compare():
+    assert compare(7, ">=", 6) and not compare(5, ">=", 6)
+    assert compare("Swag Labs", "contains", "Swag")
+    assert not compare("Swag Labs", "is", "Swag")
@@ -0,0 +1,48 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.llm.cascade import validate_script
+
+
+def test_valid_scripts():
+    assert validate_script("page.click('#login-button')") is None
+    assert validate_script("```python\nawait page.fill('#user', 'standard_user')\n```") is None
+    assert validate_script("import re\nm = re.search(r'\\d+', page.inner_text('.total'))") is None
+
+
+def test_rejected_scripts():
+    assert validate_script("") == "empty script"
+    assert validate_script("page.click('#a'").startswith("syntax error")
+    assert "not allowed" in validate_script("import os\nos.system('ls')\npage.click('#a')")
+    assert "not allowed" in validate_script("page.__class__")
+    assert "allowlist" in validate_script("open('/etc/passwd')\npage.click('#a')")
+    assert validate_script("x = 1") == "does not use page or browser_manager"
+
+
+def test_fast_model_failure_escalates(monkeypatch, tmp_path):
+    from types import SimpleNamespace
+
+    from app.llm import cascade
+
+    class FakeLLM:
+        def __init__(self, tier):
+            self.tier = tier
+            self.model = tier
+
+        def invoke(self, messages):
+            if self.tier == "fast":
+                raise RuntimeError("429 Too Many Requests")
+            return SimpleNamespace(content="page.click('#a')", response_metadata={})
+
+    stats = cascade.CascadeStats(path=str(tmp_path / "stats.json"))
+    monkeypatch.setattr(cascade, "CASCADE_ENABLED", True)
+    monkeypatch.setattr(cascade, "cascade_stats", stats)
+    monkeypatch.setattr(cascade, "get_llm", lambda purpose, tier: FakeLLM(tier))
+
+    response, tier, reason = cascade.invoke("code", "step", validate=validate_script)
+    assert (response.content, tier) == ("page.click('#a')", "strong")
+    assert "429" in reason
+    assert stats.report()["code"]["tiers"]["fast"]["errors"] == 1
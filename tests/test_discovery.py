@@ -0,0 +1,58 @@
+import asyncio
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from app.agents.discovery import crawl
+
+# The start URL redirects to https://www.shop.test/
+SITE = {
+    "https://www.shop.test/": ["/a", "/b", "/c", "https://other.test/x"],
+    "https://www.shop.test/a": [],
+    "https://www.shop.test/b": [],
+    "https://www.shop.test/c": [],
+}
+
+
+class FakePage:
+    url = None
+
+    def set_default_timeout(self, timeout):
+        pass
+
+    async def goto(self, url, **kwargs):
+        self.url = "https://www.shop.test/" if url == "http://shop.test" else url
+
+    async def evaluate(self, script):
+        return {"title": "", "elements": [], "forms": [], "links": SITE[self.url], "structure": self.url}
+
+    async def close(self):
+        pass
+
+
+class FakeContext:
+    def __init__(self, broken=False):
+        self.broken = broken
+
+    async def new_page(self):
+        if self.broken:
+            raise RuntimeError("no tab")
+        return FakePage()
+
+
+def test_crawl_follows_links_on_the_redirected_origin():
+    pages = asyncio.run(crawl(FakeContext(), "http://shop.test"))
+    assert [p["url"] for p in pages] == ["http://shop.test", "https://www.shop.test/a", "https://www.shop.test/b", "https://www.shop.test/c"]
+
+
+def test_crawl_queues_at_most_max_pages():
+    assert len(asyncio.run(crawl(FakeContext(), "http://shop.test", max_pages=2))) == 2
+
+
+def test_crawl_fails_instead_of_hanging_without_tabs():
+    with pytest.raises(RuntimeError):
+        asyncio.run(asyncio.wait_for(crawl(FakeContext(broken=True), "http://shop.test"), 5))
@@ -0,0 +1,23 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.exporter import to_sync
+
+
+def test_sync_scripts_are_kept():
+    assert to_sync("  page.click('#login')\n") == "page.click('#login')"
+
+
+def test_await_is_removed():
+    script = "await page.goto('https://x.test')\nrows = await browser_manager.extract_async({'rows': '.item'})"
+    assert to_sync(script) == "page.goto('https://x.test')\nrows = browser_manager.extract({'rows': '.item'})"
+
+
+def test_async_blocks_become_sync():
+    script = "async with page.expect_popup() as info:\n    await page.click('a')\nfor row in rows:\n    await page.fill('#q', row)"
+    assert to_sync(script) == (
+        "with page.expect_popup() as info:\n    page.click('a')\nfor row in rows:\n    page.fill('#q', row)"
+    )
@@ -0,0 +1,22 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.healer import script_signature
+
+
+def test_formatting_does_not_change_the_signature():
+    assert script_signature("page.click('#a')") == script_signature("page.click( \"#a\" )  # retry")
+    assert script_signature("await page.click('#a')") == script_signature("```python\nawait  page.click('#a')\n```")
+
+
+def test_different_scripts_differ():
+    assert script_signature("page.click('#a')") != script_signature("page.click('#b')")
+    assert script_signature("page.click('#a')") != script_signature("await page.click('#a')")
+
+
+def test_unparsable_scripts_fall_back_to_text():
+    assert script_signature("page.click(  '#a'") == script_signature("page.click( '#a'")
+    assert script_signature(None) == script_signature("")
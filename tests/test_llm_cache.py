@@ -0,0 +1,75 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from app.llm.cache import LLMCache, extract_literals, normalized_key, _templatize, _fill
+
+
+def test_url_host_stays_in_key():
+    amazon = "Go to https://www.amazon.com and search for 'laptop'"
+    ebay = "Go to https://www.ebay.com and search for 'headphones'"
+    assert normalized_key("m", "planner", amazon)[0] != normalized_key("m", "planner", ebay)[0]
+
+
+def test_only_query_string_is_a_literal():
+    first, literals = normalized_key("m", "coder", "Open https://shop.test/search?q=red&page=2#top")
+    second, _ = normalized_key("m", "coder", "Open https://shop.test/search?q=blue#top")
+    assert literals == ["?q=red&page=2#top"]
+    assert first == second
+    assert extract_literals("Open https://shop.test/search") == []
+
+
+def test_literals_replaced_as_whole_tokens():
+    code = "page.fill('.required', 'red')\npage.click('#red-button')"
+    template = _templatize(code, ["red"])
+    assert ".required" in template
+    assert _fill(template, ["big"]) == "page.fill('.required', 'big')\npage.click('#big-button')"
+
+
+def test_system_prompt_literals_are_ignored():
+    system = SystemMessage(content="Prefer page.get_by_role('button') over CSS.")
+    first, literals = normalized_key("m", "coder", [system, HumanMessage(content='Type "red shirt" into search')])
+    assert literals == ["red shirt"]
+    other_system = SystemMessage(content="Prefer page.get_by_role('link') over CSS.")
+    second, _ = normalized_key("m", "coder", [other_system, HumanMessage(content='Type "blue shirt" into search')])
+    assert first != second
+
+
+def test_normalized_hit_refills_literals(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.db"))
+    stored = [HumanMessage(content="Write code for: type 'red' into '#search'")]
+    _, _, keys = cache.lookup("m", "coder", stored)
+    cache.store("coder", keys, "page.fill('#search', 'red')\npage.wait_for_selector('.required')")
+
+    response, how, _ = cache.lookup("m", "coder", [HumanMessage(content="Write code for: type 'big' into '#search'")])
+    assert how == "normalized"
+    assert response == "page.fill('#search', 'big')\npage.wait_for_selector('.required')"
+
+
+def test_wrapper_quotes_are_not_a_literal():
+    assert extract_literals('Write code for this step: "Click \'#menu\'".') == ["#menu"]
+    assert extract_literals('Write code for this step: "Click the menu".') == ["Click the menu"]
+
+
+def test_steps_differing_in_selector_do_not_share_code(tmp_path):
+    from app.agents.prompts import build_coder_prompt
+
+    cache = LLMCache(path=str(tmp_path / "cache.db"))
+    menu, _ = build_coder_prompt("Click '#menu'")
+    _, _, keys = cache.lookup("m", "code", menu)
+    cache.store("code", keys, "page.click('#menu')")
+    checkout, _ = build_coder_prompt("Click '#checkout'")
+    response, _, _ = cache.lookup("m", "code", checkout)
+    assert response == "page.click('#checkout')"
+
+    # Cached code that never used its step's selector can't be adapted to another one
+    user, _ = build_coder_prompt("Fill '#user-name' with 'standard_user'")
+    _, _, keys = cache.lookup("m", "code", user)
+    cache.store("code", keys, "page.get_by_placeholder('Username').fill('standard_user')")
+    password, _ = build_coder_prompt("Fill '#password' with 'secret_sauce'")
+    response, how, _ = cache.lookup("m", "code", password)
+    assert (response, how) == (None, "miss")
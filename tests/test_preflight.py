@@ -0,0 +1,48 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.preflight import step_calls, preflight_window, target_url
+
+
+def test_step_calls_on_page():
+    assert step_calls("page.fill('#user-name', 'standard_user')") == [("fill", "#user-name", False)]
+    assert step_calls("await page.goto('https://www.saucedemo.com')") == [("goto", "https://www.saucedemo.com", False)]
+    assert step_calls("page.click(") is None
+    assert step_calls("print('hello')") == []
+
+
+def test_locator_strictness():
+    assert ("locator", ".item", True) in step_calls("page.locator('.item').click()")
+    assert ("locator", ".item", False) in step_calls("page.locator('.item').first.click()")
+    # count() does not wait for a match - nothing to check
+    assert ("locator", None, False) in step_calls("n = page.locator('.item').count()")
+
+
+def test_chained_calls_keep_only_page_selectors():
+    calls = step_calls("page.locator('.cart').locator('button').click()")
+    methods = [method for method, _, _ in calls]
+    assert "click" in methods
+    # 'button' is relative to '.cart', not a page selector
+    assert all(selector != "button" for _, selector, _ in calls)
+
+
+def test_preflight_window_stops_at_navigation():
+    plan = [
+        "page.goto('https://www.saucedemo.com')",
+        "page.fill('#user-name', 'standard_user')",
+        "page.fill('#password', 'secret_sauce')",
+        "page.click('#login-button')",
+        "page.click('.inventory_item button')",
+    ]
+    assert [index for index, _ in preflight_window(plan, 1)] == [1, 2, 3]
+    assert [index for index, _ in preflight_window(plan, 0)] == [0]
+    assert target_url(plan, 3) == "https://www.saucedemo.com"
+
+
+def test_preflight_window_stops_at_branches_and_bad_steps():
+    plan = ["page.fill('#q', 'shoes')", "[branch:a] page.goto('https://a.test')", "page.click('#x')"]
+    assert [index for index, _ in preflight_window(plan, 0)] == [0]
+    assert preflight_window(["page.click("], 0) == []
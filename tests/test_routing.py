@@ -0,0 +1,29 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.graph import route_task
+
+
+def _state(task, **extra):
+    return {"task": task, "plan": [], "current_step_index": 0, **extra}
+
+
+def test_ordinary_tasks_are_planned():
+    assert route_task(_state("Go to https://www.google.com/maps and find a cafe on the map")) == "plan"
+    assert route_task(_state("Go to https://www.saucedemo.com, login and explore the inventory page")) == "plan"
+
+
+def test_discovery_is_explicit():
+    assert route_task(_state("discover: https://www.saucedemo.com")) == "discover"
+    assert route_task(_state("Discover:https://www.saucedemo.com")) == "discover"
+    assert route_task(_state("https://www.saucedemo.com", mode="discover")) == "discover"
+
+
+def test_resumed_runs_continue_their_plan():
+    plan = ["Go to https://www.saucedemo.com", "[assert] url contains saucedemo", "Click login"]
+    assert route_task(_state("anything", plan=plan, current_step_index=0)) == "resume"
+    assert route_task(_state("anything", plan=plan, current_step_index=1)) == "verify"
+    assert route_task(_state("discover: https://x.test", plan=plan, current_step_index=3)) == "discover"
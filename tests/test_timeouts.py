@@ -0,0 +1,30 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.tools import timeouts
+from app.tools.timeouts import TimeoutProfiles, DEFAULT_TIMEOUT_MS, TIMEOUT_MARGIN
+
+
+def test_learned_default_value_is_reported_as_learned(monkeypatch, tmp_path):
+    profiles = TimeoutProfiles(path=str(tmp_path / "timeouts.json"))
+    assert profiles.lookup("shop.test", "click") == (DEFAULT_TIMEOUT_MS, "default")
+    for _ in range(5):
+        profiles.record("shop.test", "click", DEFAULT_TIMEOUT_MS / TIMEOUT_MARGIN)
+    monkeypatch.setattr(timeouts, "timeout_profiles", profiles)
+    timeout_ms, _, _, source = timeouts.resolve_timeout({}, "page.click('#a')", "https://shop.test/")
+    assert (timeout_ms, source) == (DEFAULT_TIMEOUT_MS, "learned")
+
+
+def test_samples_are_written_at_most_once_per_interval(monkeypatch, tmp_path):
+    monkeypatch.setattr(timeouts, "SAVE_INTERVAL_SECONDS", 3600)
+    path = tmp_path / "timeouts.json"
+    profiles = TimeoutProfiles(path=str(path))
+    profiles.record("shop.test", "click", 100)
+    written = path.read_text()
+    profiles.record("shop.test", "click", 200)
+    assert path.read_text() == written
+    profiles.flush()
+    assert TimeoutProfiles(path=str(path)).report()["profiles"][0]["samples"] == 2
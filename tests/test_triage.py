@@ -0,0 +1,31 @@
+import sys
+import os
+
+# Add parent dir to path so we can import app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.triage import classify_failure, TRANSIENT, HEALABLE, FATAL
+
+
+def test_script_problems_are_healable():
+    assert classify_failure("Timeout 30000ms exceeded waiting for locator('#login')") == HEALABLE
+    assert classify_failure("strict mode violation: locator('.item') resolved to 6 elements") == HEALABLE
+    assert classify_failure("") == HEALABLE
+
+
+def test_network_hiccups_are_transient():
+    assert classify_failure("page.goto: net::ERR_CONNECTION_RESET at https://x.test") == TRANSIENT
+    assert classify_failure("Error code: 503 - upstream unavailable") == TRANSIENT
+    assert classify_failure("HTTP 502 navigating to https://x.test") == TRANSIENT
+
+
+def test_unfixable_failures_are_fatal():
+    assert classify_failure("page.goto: net::ERR_NAME_NOT_RESOLVED at https://nope.invalid") == FATAL
+    assert classify_failure("HTTP 404 navigating to https://x.test/missing") == FATAL
+    assert classify_failure("Target page, context or browser has been closed") == FATAL
+    assert classify_failure("OPENROUTER_API_KEY not found in .env") == FATAL
+
+
+def test_captcha_signal_wins():
+    assert classify_failure("Timeout 30000ms exceeded", {"blocker": "captcha"}) == FATAL
+    assert classify_failure("Timeout 30000ms exceeded", {"blocker": None}) == HEALABLE